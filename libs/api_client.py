@@ -1,3 +1,4 @@
+import io
 import json
 import os
 import sys
@@ -5,24 +6,110 @@ from pathlib import Path
 import requests
 import base64
 import mimetypes
+import shutil
 import subprocess
-import tempfile
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-# Globally disable proxies to prevent localhost connection issues
-s = requests.Session()
-s.trust_env = False
+from chunked_upload import ChunkedUploader, DEFAULT_PARALLEL, DEFAULT_PART_MB
+from failover import FailoverPolicy, RETRYABLE_STATUSES
+from gateways import GatewayPool, TrackedResponse
+from http_pool import HTTPPool, DEFAULT_POOL_CONNECTIONS, DEFAULT_POOL_MAXSIZE, DEFAULT_TIMEOUTS
+import image_tools
+from media_cache import MediaCache, cache_root, fast_hash, DEFAULT_MAX_MB
+from model_catalog import ModelCatalog, DEFAULT_TTL_MINUTES
+from rate_limit import RateLimiter, parse_retry_after
+from response_cache import CachedResponse, ResponseCache
+import response_cache
+from streaming_body import EncodedMedia, FileMedia, StreamingJSONBody
+from telemetry import Telemetry
+from upload_cache import UploadCache, DEFAULT_URI_TTL_HOURS
+import video_tools
+
+UPLOAD_MODES = ("multipart", "octet-stream")
+# Upload failures that mean the remembered endpoint is gone (others may be transient)
+ENDPOINT_GONE = (404, 405)
+# Media at least this large is encoded once into a cached base64 blob
+BLOB_MIN_BYTES = 1024 * 1024
+# How chat_completion sends videos: the (optimized) file itself, sampled key frames, or the audio track
+VIDEO_MODES = ("video", "frames", "audio")
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.webm', '.ts')
 
 
 class AntigravityClient:
-    def __init__(self, api_key=None, base_url=None):
+    def __init__(self, api_key=None, base_url=None, pool_maxsize=None, pool_connections=None, timeouts=None):
+        config_started = time.perf_counter()
         self.config = self._load_config()
-        self.base_url = base_url or self.config.get("base_url", "").rstrip("/")
-        self.api_key = api_key or self.config.get("api_key", "")
+        # Spans and byte counts per request, delivered to hooks and the configured sinks
+        self.telemetry = Telemetry(self.config.get("telemetry_jsonl"), self.config.get("telemetry_prometheus"))
+        self.telemetry.add_span("config_load", time.perf_counter() - config_started)
+        # One or more gateways (config "gateways"); uploads, caches and the model catalog use the first
+        self.gateways = GatewayPool.from_config(self.config, base_url, api_key)
+        self.base_url = self.gateways.primary.base_url
+        self.api_key = self.gateways.primary.api_key
         
-        if not self.base_url or not self.api_key:
+        if not all(g.base_url and g.api_key for g in self.gateways.gateways):
             print("[-] Error: Configuration missing base_url or api_key", file=sys.stderr)
             sys.exit(1)
+
+        self.media_cache = MediaCache(
+            cache_root(self.config) / "media",
+            max_bytes=int(self.config.get("media_cache_max_mb", DEFAULT_MAX_MB)) * 1024 * 1024,
+        )
+        self.upload_cache = UploadCache(
+            cache_root(self.config) / "uploads.json",
+            uri_ttl=float(self.config.get("file_uri_ttl_hours", DEFAULT_URI_TTL_HOURS)) * 3600,
+        )
+        self.response_cache = ResponseCache(
+            cache_root(self.config) / "responses.sqlite3",
+            ttl=float(self.config.get("response_cache_ttl_hours", response_cache.DEFAULT_TTL_HOURS)) * 3600,
+            max_bytes=int(self.config.get("response_cache_max_mb", response_cache.DEFAULT_MAX_MB)) * 1024 * 1024,
+        )
+        self.model_catalog = ModelCatalog(
+            cache_root(self.config) / "models.json",
+            ttl=float(self.config.get("models_cache_ttl_minutes", DEFAULT_TTL_MINUTES)) * 60,
+        )
+        self._models_failed_at = None
+        self.failover = FailoverPolicy(self.config)
+        # Token buckets per model/gateway/route and the priority queue in front of them
+        self.limiter = RateLimiter.from_config(self.config)
+        self.queue_timeout = float(self.config.get("queue_timeout", 300))
+        self.retry_after_max = float(self.config.get("retry_after_max", 30))
+
+        # Connection pool owned by this client: shared keep-alive connections, one Session per thread
+        self.http = HTTPPool(
+            pool_connections=pool_connections or max(len(self.gateways),
+                                                     int(self.config.get("pool_connections", DEFAULT_POOL_CONNECTIONS))),
+            pool_maxsize=pool_maxsize or int(self.config.get("pool_maxsize", DEFAULT_POOL_MAXSIZE)),
+            pool_block=bool(self.config.get("pool_block", False)),
+            tcp_keepalive=bool(self.config.get("tcp_keepalive", True)),
+        )
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **self.config.get("timeouts", {}), **(timeouts or {}))
+        if len(self.gateways) > 1:
+            self.gateways.start_health_checks(self._check_gateway,
+                                              float(self.config.get("gateway_health_interval", 15)))
+
+    @property
+    def session(self):
+        return self.http.session
+
+    def _timeout(self, kind):
+        """(connect, read) timeout tuple for a kind of call: chat, upload, image or models."""
+        return (self.timeouts["connect"], self.timeouts[kind])
+
+    def connection_stats(self):
+        """Counters for requests made and new vs. reused connections."""
+        return self.http.stats()
+
+    def close(self):
+        self.gateways.close()
+        self.http.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
             
     def _load_config(self):
         # [Fix] 支持 PyInstaller 打包后的路径
@@ -53,25 +140,25 @@ class AntigravityClient:
         print(f"[-] Warning: No config or example found.", file=sys.stderr)
         return {}
 
+    def _hash(self, path):
+        with self.telemetry.span("hash"):
+            return fast_hash(path)
+
     def _optimize_video(self, input_path, mute=False):
         """
         Use FFmpeg to compress large videos to a manageable size for AI.
         Target: 360P at low bitrate, keeping timing intact.
         """
-        # Save to current working directory cache instead of temp
-        cache_dir = Path("video_cache")
-        cache_dir.mkdir(parents=True, exist_ok=True)
-
-        # Consistent naming for caching based on modification time, name and mute status
-        mtime = int(os.path.getmtime(input_path))
-        safe_name = os.path.basename(input_path).replace(" ", "_")
-        mute_suffix = "_muted" if mute else ""
-        output_path = cache_dir / f"optimized_{mtime}{mute_suffix}_{safe_name}.mp4"
-
-        if output_path.exists() and output_path.stat().st_size > 0:
+        # Content-addressed: the same clip hits the cache even if renamed or copied
+        mute_suffix = "-muted" if mute else ""
+        cache_key = f"{self._hash(input_path)}-360p10{mute_suffix}"
+        cached = self.media_cache.get(cache_key)
+        if cached:
             if mute:
-                print(f"[*] 使用已缓存的压缩视频 (已静音): {output_path}", file=sys.stderr)
-            return str(output_path)
+                print(f"[*] 使用已缓存的压缩视频 (已静音): {cached}", file=sys.stderr)
+            return str(cached)
+
+        output_path = self.media_cache.reserve(cache_key, ".mp4")
 
         print(f"[*] 正在为 AI 分析优化视频: {os.path.basename(input_path)}...", file=sys.stderr)
         if mute:
@@ -81,147 +168,464 @@ class AntigravityClient:
 
         audio_opt = ['-an'] if mute else ['-c:a', 'aac', '-b:a', '64k']
 
+        vf = 'scale=-2:360,fps=10'
+
         try:
-            # 优先尝试 GPU 加速
-            try:
-                print(f"[*] 尝试硬件加速 (NVENC) 压缩...", file=sys.stderr)
-                gpu_cmd = [
-                    'ffmpeg', '-y', '-i', input_path,
-                    '-c:v', 'h264_nvenc', '-preset', 'fast', '-cq', '38',
-                    '-vf', 'scale=-2:360,fps=10'
-                ] + audio_opt + [str(output_path)]
-                subprocess.run(gpu_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
-            except Exception:
-                # 回退到 CPU
-                print(f"[*] 硬件加速不可用，切换到 CPU (Ultrafast) 压缩...", file=sys.stderr)
-                cpu_cmd = [
-                    'ffmpeg', '-y', '-i', input_path,
-                    '-vcodec', 'libx264', '-crf', '35', '-preset', 'ultrafast',
-                    '-vf', 'scale=-2:360,fps=10'
-                ] + audio_opt + [str(output_path)]
-                subprocess.run(cpu_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+            self._transcode(input_path, output_path, video_tools.encoder_args, audio_opt, vf)
 
             new_size = os.path.getsize(output_path)
             print(f"[+] 优化完成: {new_size/1024/1024:.2f}MB", file=sys.stderr)
-            return str(output_path)
+            return str(self.media_cache.commit(cache_key, output_path, ".mp4", kind="transcode",
+                                               source=os.path.basename(input_path)))
         except Exception as e:
+            self.media_cache.discard(output_path)
             print(f"[-] 优化失败 (FFmpeg 可能未安装或文件损坏): {e}", file=sys.stderr)
             return input_path # Fallback to original
 
-    def upload_file(self, file_path):
+    def _transcode(self, input_path, output_path, video_args_for, audio_opt, vf):
         """
-        Stream large files to the server using the /files endpoint.
-        Try multiple formats and endpoints for compatibility.
+        Run FFmpeg with the best working encoder; video_args_for(encoder) gives the
+        video codec args. Long CPU encodes are split into parallel segments.
         """
-        if not os.path.exists(file_path):
+        with self.telemetry.span("transcode"):
+            self._run_transcode(input_path, output_path, video_args_for, audio_opt, vf)
+        self.telemetry.add_bytes("transcode_in", os.path.getsize(input_path))
+        self.telemetry.add_bytes("transcode_out", os.path.getsize(output_path))
+
+    def _run_transcode(self, input_path, output_path, video_args_for, audio_opt, vf):
+        encoders = video_tools.available_encoders(cache_root(self.config) / "encoders.json")
+        if not encoders:
+            raise RuntimeError("no working H.264 encoder")
+        encoder = encoders[0]
+        duration = video_tools.probe_duration(input_path) if encoder == "libx264" else None
+        min_seconds = float(self.config.get("parallel_transcode_min_seconds", 300))
+        workers = os.cpu_count() or 1
+
+        if (self.config.get("parallel_transcode", True) and duration and duration >= min_seconds
+                and workers > 1):
+            # 长视频: 按关键帧切段，多进程并行压缩后无损拼接
+            video_tools.transcode_segmented(input_path, output_path, video_args_for(encoder),
+                                            audio_opt, vf, duration, workers=workers)
+            return
+        if encoder == "h264_nvenc":
+            print(f"[*] 使用硬件加速 (NVENC) 压缩...", file=sys.stderr)
+        else:
+            print(f"[*] 使用 CPU (libx264) 压缩...", file=sys.stderr)
+        try:
+            video_tools.transcode(input_path, output_path, video_args_for(encoder), audio_opt, vf)
+        except subprocess.CalledProcessError:
+            if len(encoders) < 2:
+                raise
+            # 探测结果可能已过期 (例如驱动变化)，回退到下一个编码器
+            print(f"[*] {encoder} 压缩失败，切换到 {encoders[1]}...", file=sys.stderr)
+            video_tools.transcode(input_path, output_path, video_args_for(encoders[1]), audio_opt, vf)
+
+    def _fit_video(self, input_path, mute=False, target_mb=None):
+        """
+        Compress a video just enough for its base64 payload to fit target_mb
+        (config "video_target_mb", default 20): bitrate from the duration, then
+        the best resolution/fps that bitrate can feed. Inputs that already fit
+        are returned untouched.
+        """
+        target_mb = float(target_mb or self.config.get("video_target_mb", 20))
+        budget = int(target_mb * 1024 * 1024 * 3 / 4)  # base64 inflates by 4/3
+        if os.path.getsize(input_path) <= budget:
+            return input_path
+
+        info = video_tools.probe_media(input_path)
+        if not info:
+            print("[-] 无法读取视频信息 (ffprobe)，改用固定压缩参数", file=sys.stderr)
+            return self._optimize_video(input_path, mute=mute)
+
+        mute_suffix = "-muted" if mute else ""
+        cache_key = f"{self._hash(input_path)}-fit{budget}{mute_suffix}"
+        cached = self.media_cache.get(cache_key)
+        if cached:
+            return str(cached)
+
+        plan = video_tools.plan_for_budget(info, budget, mute=mute)
+        print(f"[*] 正在为 AI 分析优化视频: {os.path.basename(input_path)} -> 目标 {target_mb:g}MB "
+              f"({plan['height']}p {plan['fps']:g}fps, 视频 {plan['video_kbps']}kbps, 音频 {plan['audio_kbps']}kbps)",
+              file=sys.stderr)
+        audio_opt = ['-an'] if not plan["audio_kbps"] else ['-c:a', 'aac', '-b:a', f"{plan['audio_kbps']}k"]
+        if 0 < plan["audio_kbps"] <= 32:
+            audio_opt += ['-ac', '1']
+        vf = f"scale=-2:{plan['height']},fps={plan['fps']:g}"
+
+        output_path = self.media_cache.reserve(cache_key, ".mp4")
+        try:
+            video_kbps = plan["video_kbps"]
+            self._transcode(input_path, output_path,
+                            lambda encoder: video_tools.bitrate_args(encoder, video_kbps), audio_opt, vf)
+            new_size = os.path.getsize(output_path)
+            if new_size > budget and video_kbps > video_tools.MIN_VIDEO_KBPS:
+                # Single-pass rate control overshot; scale the bitrate down once and retry
+                video_kbps = max(video_tools.MIN_VIDEO_KBPS, int(video_kbps * budget / new_size * 0.9))
+                print(f"[*] 输出 {new_size/1024/1024:.2f}MB 超出预算，降低码率到 {video_kbps}kbps 重试...", file=sys.stderr)
+                self._transcode(input_path, output_path,
+                                lambda encoder: video_tools.bitrate_args(encoder, video_kbps), audio_opt, vf)
+                new_size = os.path.getsize(output_path)
+            print(f"[+] 优化完成: {new_size/1024/1024:.2f}MB", file=sys.stderr)
+            return str(self.media_cache.commit(cache_key, output_path, ".mp4", kind="transcode",
+                                               source=os.path.basename(input_path)))
+        except Exception as e:
+            self.media_cache.discard(output_path)
+            print(f"[-] 优化失败 (FFmpeg 可能未安装或文件损坏): {e}", file=sys.stderr)
+            return input_path
+
+    def _sample_frames(self, input_path):
+        """
+        Representative frames of a video as [(jpeg_path, seconds), ...]: one per
+        scene change plus at least one every "frame_interval" seconds, with
+        near-duplicates (perceptual hash) dropped and at most "frame_max" kept.
+        Frames are cached by content hash. Returns [] if extraction fails.
+        """
+        threshold = float(self.config.get("frame_scene_threshold", 0.3))
+        interval = float(self.config.get("frame_interval", 10))
+        max_frames = int(self.config.get("frame_max", 48))
+        cache_key = f"{self._hash(input_path)}-frames-s{threshold:g}-i{interval:g}-n{max_frames}"
+
+        manifest = self.media_cache.get(cache_key)
+        if manifest:
+            frames = [(self.media_cache.get(key), t) for key, t in json.loads(manifest.read_text(encoding="utf-8"))]
+            if all(path for path, _ in frames):
+                return [(str(path), t) for path, t in frames]
+
+        print(f"[*] 正在抽取关键帧: {os.path.basename(input_path)}", file=sys.stderr)
+        # Extract inside the cache root: frames are committed by rename, which cannot cross filesystems
+        work_dir = self.media_cache.reserve_dir(cache_key)
+        try:
+            with self.telemetry.span("frames"):
+                frames = video_tools.sample_frames(input_path, work_dir, scene_threshold=threshold, interval=interval)
+                frames = video_tools.dedupe_frames(frames, max_frames=max_frames)
+            keys = [f"{cache_key}-{i:03d}" for i in range(len(frames))]
+            manifest = work_dir / "manifest.json"
+            manifest.write_text(json.dumps([(key, t) for key, (_, t, _) in zip(keys, frames)]), encoding="utf-8")
+            # One commit for the whole set, so no frame evicts another
+            finals = self.media_cache.commit_many(
+                [(key, path, ".jpg", "frame") for key, (path, _, _) in zip(keys, frames)]
+                + [(cache_key, manifest, ".json", "frames")],
+                source=os.path.basename(input_path))
+            result = [(str(final), t) for final, (_, t, _) in zip(finals, frames)]
+            total = sum(os.path.getsize(path) for path, _ in result)
+            print(f"[+] 抽取 {len(result)} 帧 ({total/1024/1024:.2f}MB)", file=sys.stderr)
+            return result
+        except Exception as e:
+            print(f"[-] 抽帧失败 (FFmpeg 可能未安装或文件损坏): {e}", file=sys.stderr)
+            return []
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _extract_audio(self, input_path):
+        """
+        The audio track of a video as low-bitrate mono speech audio (config
+        "audio_codec": aac/opus, "audio_kbps"), cached by content hash.
+        Returns (path, mime_type), or None if there is no usable audio.
+        """
+        codec = self.config.get("audio_codec", "aac")
+        kbps = int(self.config.get("audio_kbps", 32))
+        suffix, mime_type, _ = video_tools.AUDIO_CODECS[codec]
+        cache_key = f"{self._hash(input_path)}-audio-{codec}{kbps}"
+        cached = self.media_cache.get(cache_key)
+        if cached:
+            return str(cached), mime_type
+
+        print(f"[*] 正在提取音轨: {os.path.basename(input_path)} ({codec} {kbps}kbps 单声道)", file=sys.stderr)
+        output_path = self.media_cache.reserve(cache_key, suffix)
+        try:
+            with self.telemetry.span("audio_extract"):
+                video_tools.extract_audio(input_path, output_path, codec=codec, kbps=kbps)
+            print(f"[+] 提取完成: {os.path.getsize(output_path)/1024/1024:.2f}MB", file=sys.stderr)
+            final = self.media_cache.commit(cache_key, output_path, suffix, kind="audio",
+                                            source=os.path.basename(input_path))
+            return str(final), mime_type
+        except Exception as e:
+            self.media_cache.discard(output_path)
+            print(f"[-] 提取音轨失败 (视频可能没有音轨): {e}", file=sys.stderr)
             return None
-            
-        file_name = os.path.basename(file_path)
-        file_size = os.path.getsize(file_path)
+
+    def _prepare_image(self, input_path):
+        """
+        Downscale an image so its longest edge is at most "image_max_edge"
+        (default 1536) and re-encode it as "image_format" (jpeg/webp, quality
+        "image_quality", default 85), cached by content hash. Files up to
+        "image_min_kb" (default 256) are used as-is. Returns (path, mime_type).
+        """
+        mime_type = mimetypes.guess_type(input_path)[0] or "image/png"
+        size = os.path.getsize(input_path)
+        if size <= int(self.config.get("image_min_kb", 256)) * 1024:
+            return input_path, mime_type
+
+        max_edge = int(self.config.get("image_max_edge", 1536))
+        quality = int(self.config.get("image_quality", 85))
+        fmt = image_tools.choose_format(input_path, self.config.get("image_format", "jpeg"))
+        suffix, out_mime = image_tools.FORMATS[fmt]
+        cache_key = f"{self._hash(input_path)}-img{max_edge}q{quality}{fmt}"
+        cached = self.media_cache.get(cache_key)
+        if cached:
+            return str(cached), out_mime
+
+        output_path = self.media_cache.reserve(cache_key, suffix)
+        with self.telemetry.span("image_shrink"):
+            shrunk = image_tools.shrink_image(input_path, output_path, max_edge=max_edge, quality=quality, fmt=fmt)
+        if not shrunk:
+            self.media_cache.discard(output_path)
+            return input_path, mime_type
+        new_size = os.path.getsize(output_path)
+        if new_size >= size:
+            # Already compact; keep the original rather than a bigger re-encode
+            self.media_cache.discard(output_path)
+            return input_path, mime_type
+        print(f"[*] 图片已压缩: {os.path.basename(input_path)} {size/1024/1024:.2f}MB -> {new_size/1024/1024:.2f}MB",
+              file=sys.stderr)
+        final = self.media_cache.commit(cache_key, output_path, suffix, kind="image",
+                                        source=os.path.basename(input_path))
+        return str(final), out_mime
+
+    def _upload_endpoints(self):
+        # Try a few common endpoints
+        endpoints = [f"{self.base_url}/files"]
+        if "/v1" in self.base_url:
+            endpoints.append(self.base_url.replace("/v1", "") + "/files")
+            endpoints.append(self.base_url.replace("/v1", "/upload/v1") + "/files")
+            endpoints.append(self.base_url.replace("/v1", "/upload/v1beta") + "/files")
+        return endpoints
+
+    def _post_upload(self, url, mode, fileobj, safe_file_name, mime_type):
+        """Send one upload attempt. Returns (file_uri or None, response)."""
+        if mode == "multipart":
+            # Mode 1: Multipart (Standard OpenAI compatible)
+            files = {
+                'file': (safe_file_name, fileobj, mime_type),
+                'purpose': (None, 'fine-tune')
+            }
+            headers = {"Authorization": f"Bearer {self.api_key}"}
+            response = self.session.post(url, headers=headers, files=files, timeout=self._timeout("upload"))
+            uri_keys = ("file_uri", "id", "uri")
+        else:
+            # Mode 2: Octet-stream
+            headers = {
+                "Authorization": f"Bearer {self.api_key}",
+                "X-File-Name": safe_file_name,
+                "X-File-Type": mime_type,
+                "Content-Type": "application/octet-stream"
+            }
+            response = self.session.post(url, headers=headers, data=fileobj, timeout=self._timeout("upload"))
+            uri_keys = ("file_uri", "uri")
+
+        if response.status_code != 200:
+            return None, response
+        result = response.json()
+        return next((result[k] for k in uri_keys if result.get(k)), None), response
+
+    def _discover_upload_endpoint(self):
+        """
+        Find a working endpoint/mode pair for this gateway by uploading a tiny probe
+        instead of the real file, and remember it. Returns (url, mode) or None.
+        """
+        for url in self._upload_endpoints():
+            for mode in UPLOAD_MODES:
+                try:
+                    file_uri, response = self._post_upload(
+                        url, mode, io.BytesIO(b"antigravity upload probe"), "probe.txt", "text/plain")
+                except Exception as e:
+                    print(f"[-] Probe {mode} failed for {url}: {e}", file=sys.stderr)
+                    continue
+                if file_uri:
+                    print(f"[*] Upload endpoint discovered: {url} ({mode})", file=sys.stderr)
+                    self.upload_cache.remember_endpoint(self.base_url, url, mode)
+                    return url, mode
+                print(f"[-] Probe {mode} failed ({response.status_code}) for {url}", file=sys.stderr)
+        return None
+
+    def _chunked_upload(self, file_path, file_name, mime_type, content_hash, progress=None):
+        known = self.upload_cache.endpoint(self.base_url)
+        uploader = ChunkedUploader(
+            self.http,
+            known[0] if known else f"{self.base_url}/files",
+            {"Authorization": f"Bearer {self.api_key}"},
+            cache_root(self.config) / "upload_manifests",
+            part_size=int(float(self.config.get("chunked_upload_part_mb", DEFAULT_PART_MB)) * 1024 * 1024),
+            parallel=int(self.config.get("chunked_upload_parallel", DEFAULT_PARALLEL)),
+            timeout=self._timeout("upload"),
+        )
+        try:
+            return uploader.upload(file_path, file_name, mime_type, content_hash, progress=progress)
+        except Exception as e:
+            print(f"[-] Chunked upload failed: {e}", file=sys.stderr)
+            return None
+
+    @staticmethod
+    def _upload_mime_type(file_path):
         mime_type, _ = mimetypes.guess_type(file_path)
         mime_type = mime_type or "application/octet-stream"
         
         if file_path.lower().endswith(('.mp4', '.mov', '.webm', '.ts')):
             mime_type = mime_type if "video" in mime_type else "video/mp4"
+        return mime_type
+
+    def upload_file(self, file_path, chunked=None, progress=None):
+        """
+        Stream large files to the server using the /files endpoint.
+
+        The working endpoint/mode pair is discovered once per gateway with a tiny
+        probe and remembered, and files already uploaded (by content hash) reuse
+        their file_uri until it expires, so the file itself is sent at most once.
+
+        With chunked=True (default: config "chunked_upload" for files of at least
+        "chunked_upload_min_mb") the file is sent as parallel, resumable parts; see
+        chunked_upload.py. progress(sent_bytes, total_bytes, bytes_per_sec) is called
+        periodically in that mode.
+        """
+        if not os.path.exists(file_path):
+            return None
+        with self.telemetry.request("upload", file=os.path.basename(file_path)) as record:
+            with self.telemetry.span("upload"):
+                result = self._upload_file(file_path, chunked, progress)
+            record.set(status="ok" if result else "failed")
+            return result
+
+    def _upload_file(self, file_path, chunked, progress):
+            
+        file_name = os.path.basename(file_path)
+        file_size = os.path.getsize(file_path)
+        mime_type = self._upload_mime_type(file_path)
+
+        content_hash = self._hash(file_path)
+        cached = self.upload_cache.file_uri(self.base_url, content_hash)
+        if cached:
+            print(f"[*] Reusing uploaded file: {cached['uri']}", file=sys.stderr)
+            self.telemetry.current.set(reused=True)
+            return cached
 
         # 安全处理文件名：Header 中不能包含非 ASCII 字符
         from urllib.parse import quote
         safe_file_name = quote(file_name)
 
         print(f"[*] Uploading {file_name} ({file_size/1024/1024:.2f}MB)...", file=sys.stderr)
-        
-        # Try a few common endpoints
-        endpoints = [f"{self.base_url}/files"]
-        if "/v1" in self.base_url:
-            endpoints.append(self.base_url.replace("/v1", "") + "/files")
-            endpoints.append(self.base_url.replace("/v1", "/upload/v1") + "/files")
-            endpoints.append(self.base_url.replace("/v1", "/upload/v1beta") + "/files")
-            
-        for url in endpoints:
+
+        if chunked is None:
+            chunked = (self.config.get("chunked_upload", False)
+                       and file_size >= float(self.config.get("chunked_upload_min_mb", 32)) * 1024 * 1024)
+        if chunked:
+            file_uri = self._chunked_upload(file_path, safe_file_name, mime_type, content_hash, progress)
+            if file_uri:
+                print(f"[+] Upload success: {file_uri}")
+                self.telemetry.add_bytes("upload", file_size)
+                self.upload_cache.remember_file(self.base_url, content_hash, file_uri, mime_type)
+                return {"uri": file_uri, "mime_type": mime_type}
+            print("[*] Falling back to single-request upload...", file=sys.stderr)
+
+        known = self.upload_cache.endpoint(self.base_url)
+        if known:
+            attempts = [known]
+        else:
+            discovered = self._discover_upload_endpoint()
+            # If no probe got through, fall back to trying every pair with the real file
+            attempts = [discovered] if discovered else [
+                (url, mode) for url in self._upload_endpoints() for mode in UPLOAD_MODES
+            ]
+
+        gone = False
+        for url, mode in attempts:
             try:
-                # Mode 1: Multipart (Standard OpenAI compatible)
                 with open(file_path, "rb") as f:
-                    files = {
-                        'file': (safe_file_name, f, mime_type),
-                        'purpose': (None, 'fine-tune')
-                    }
-                    headers = {"Authorization": f"Bearer {self.api_key}"}
-                    response = s.post(url, headers=headers, files=files, timeout=600)
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    file_uri = result.get("file_uri") or result.get("id") or result.get("uri")
-                    if file_uri:
-                        print(f"[+] Upload success: {file_uri}")
-                        return {"uri": file_uri, "mime_type": mime_type}
-                else:
-                    print(f"[-] Mode 1 failed ({response.status_code}) for {url}: {response.text[:100]}", file=sys.stderr)
-                
-                # Mode 2: Octet-stream
-                with open(file_path, "rb") as f:
-                    headers = {
-                        "Authorization": f"Bearer {self.api_key}",
-                        "X-File-Name": safe_file_name,
-                        "X-File-Type": mime_type,
-                        "Content-Type": "application/octet-stream"
-                    }
-                    response = s.post(url, headers=headers, data=f, timeout=600)
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    file_uri = result.get("file_uri") or result.get("uri")
-                    if file_uri:
-                        print(f"[+] Upload success: {file_uri}")
-                        return {"uri": file_uri, "mime_type": mime_type}
-                else:
-                    print(f"[-] Mode 2 failed ({response.status_code}) for {url}: {response.text[:100]}", file=sys.stderr)
-                        
+                    file_uri, response = self._post_upload(url, mode, f, safe_file_name, mime_type)
             except Exception as e:
                 print(f"[-] Attempt failed for {url}: {e}", file=sys.stderr)
-                
+                continue
+
+            if file_uri:
+                print(f"[+] Upload success: {file_uri}")
+                self.telemetry.add_bytes("upload", file_size)
+                self.upload_cache.remember_endpoint(self.base_url, url, mode)
+                self.upload_cache.remember_file(self.base_url, content_hash, file_uri, mime_type)
+                return {"uri": file_uri, "mime_type": mime_type}
+            print(f"[-] Mode {mode} failed ({response.status_code}) for {url}: {response.text[:100]}", file=sys.stderr)
+            gone = response.status_code in ENDPOINT_GONE
+
+        if known and gone:
+            # The gateway no longer serves the remembered endpoint; rediscover on the next call
+            self.upload_cache.forget_endpoint(self.base_url)
         return None
 
-    def chat_completion(self, messages, model=None, temperature=0.7, file_paths=None, file_path=None):
-        url = f"{self.base_url}/chat/completions"
-        model = model or self.config.get("default_chat_model", "claude-sonnet-4-5")
-        
+    def _headers(self, content_type="application/json", api_key=None):
+        headers = {
+            "Authorization": f"Bearer {api_key or self.api_key}",
+            "User-Agent": "Antigravity/4.0.6"
+        }
+        if content_type:
+            headers["Content-Type"] = content_type
+        return headers
+
+    @staticmethod
+    def _collect_paths(file_paths=None, file_path=None):
         paths = []
         if file_path: paths.append(file_path)
         if file_paths:
             if isinstance(file_paths, list): paths.extend(file_paths)
             else: paths.append(file_paths)
-            
+        return paths
+
+    def _build_chat_body(self, messages, model=None, temperature=0.7, file_paths=None, file_path=None, stream_body=None,
+                         video_mode=None):
+        """
+        Prepare the request body for chat_completion: optimize and encode media and
+        attach it to the last user message. Returns a StreamingJSONBody.
+        """
+        model = self.resolve_model(model or self.config.get("default_chat_model", "claude-sonnet-4-5"))
+        if stream_body is None:
+            stream_body = self.config.get("stream_body", True)
+        video_mode = video_mode or self.config.get("video_mode", "video")
+        if video_mode not in VIDEO_MODES:
+            raise ValueError(f"video_mode must be one of {VIDEO_MODES}, got {video_mode!r}")
+        
+        paths = self._collect_paths(file_paths, file_path)
+
         multimodal_content = []
+        media = []
         
         for path in paths:
             if not os.path.exists(path): continue
             
-            # Smart optimization: if it's a video and > 10MB, compress it first
-            is_video = path.lower().endswith(('.mp4', '.mov', '.webm', '.ts'))
-            file_size = os.path.getsize(path)
-            
-            working_path = path
-            if is_video and file_size > 10 * 1024 * 1024:
-                working_path = self._optimize_video(path)
-            
+            is_video = path.lower().endswith(VIDEO_EXTENSIONS)
+
+            if is_video and video_mode == "frames":
+                frames = self._sample_frames(path)
+                if frames:
+                    # Timestamped key frames instead of the clip: a fraction of the bytes
+                    multimodal_content.append({
+                        "type": "text",
+                        "text": f"视频 {os.path.basename(path)} 的关键帧 (按时间顺序，每帧前标注了其在视频中的时间):",
+                    })
+                    for frame_path, seconds in frames:
+                        stamp = time.strftime("%H:%M:%S", time.gmtime(seconds))
+                        multimodal_content.append({"type": "text", "text": f"[{stamp}]"})
+                        self._append_media(frame_path, "image/jpeg", False, stream_body, media, multimodal_content)
+                    continue
+                print("[-] 未能抽取关键帧，改为发送视频", file=sys.stderr)
+
+            if is_video and video_mode == "audio":
+                audio = self._extract_audio(path)
+                if audio:
+                    # Speech-centric analysis: the video track is never uploaded
+                    self._append_media(audio[0], audio[1], False, stream_body, media, multimodal_content)
+                    continue
+                print("[-] 未能提取音轨，改为发送视频", file=sys.stderr)
+
             # All media sent via Base64 for maximum compatibility
             try:
-                mime_type, _ = mimetypes.guess_type(working_path)
-                mime_type = mime_type or "application/octet-stream"
-                if is_video: mime_type = "video/mp4" # Ensure video mime type
-                
-                print(f"[*] Encoding media (Base64): {os.path.basename(working_path)}", file=sys.stderr)
-                with open(working_path, "rb") as f:
-                    b64_data = base64.b64encode(f.read()).decode("utf-8")
-                
-                multimodal_content.append({
-                    "type": "image_url",
-                    "image_url": {"url": f"data:{mime_type};base64,{b64_data}"}
-                })
+                working_path, mime_type = self._prepare_media(path)
+                self._append_media(working_path, mime_type, is_video, stream_body, media, multimodal_content)
             except Exception as e:
                 print(f"[-] Failed to process {path}: {e}", file=sys.stderr)
 
-        if multimodal_content and messages and messages[-1]['role'] == 'user':
+        if not (messages and messages[-1]['role'] == 'user'):
+            media = []
+        elif media:
+            # Streaming mode: attach placeholders to a copy so the caller's history stays clean
+            messages = self._attach_media_copy(messages, multimodal_content)
+        elif multimodal_content:
             original_text = messages[-1]['content']
             # Avoid nesting if it's already a list from a previous attempt
             if isinstance(original_text, list):
@@ -240,43 +644,257 @@ class AntigravityClient:
             "temperature": temperature,
             "stream": True
         }
-        
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-            "User-Agent": "Antigravity/4.0.6" 
-        }
-        
+        with self.telemetry.span("serialize"):
+            body = StreamingJSONBody(payload, media)
+            self.telemetry.add_bytes("payload", len(body))
+        return body
+
+    def _prepare_media(self, path):
+        """The file to send for an attachment, after video/image optimization, and its mime type."""
+        is_video = path.lower().endswith(VIDEO_EXTENSIONS)
+        # Smart optimization: compress videos to the payload budget ("adaptive"),
+        # or with the fixed 360p recipe when they are > 10MB ("fixed")
+        working_path = path
+        if is_video and self.config.get("video_optimize_mode", "adaptive") == "adaptive":
+            working_path = self._fit_video(path)
+        elif is_video and os.path.getsize(path) > 10 * 1024 * 1024:
+            working_path = self._optimize_video(path)
+
+        mime_type, _ = mimetypes.guess_type(working_path)
+        mime_type = mime_type or "application/octet-stream"
+        if is_video: mime_type = "video/mp4" # Ensure video mime type
+        elif mime_type.startswith("image/") and mime_type not in ("image/gif", "image/svg+xml"):
+            working_path, mime_type = self._prepare_image(working_path)
+        return working_path, mime_type
+
+    def _append_media(self, working_path, mime_type, is_video, stream_body, media, multimodal_content):
+        """Add one file as a base64 image_url part (streamed placeholder or inline data)."""
+        self.telemetry.add_bytes("media", os.path.getsize(working_path))
+        if stream_body:
+            item = None
+            if is_video or os.path.getsize(working_path) >= BLOB_MIN_BYTES:
+                # Reuse the ready base64 blob so re-analysis and failover retries skip the encoding step
+                try:
+                    with self.telemetry.span("encode"):
+                        item = EncodedMedia(self.media_cache.encoded_blob(working_path), mime_type)
+                except OSError as e:
+                    print(f"[-] Media cache unavailable, encoding on the fly: {e}", file=sys.stderr)
+            item = item or FileMedia(working_path, mime_type)
+            media.append(item)
+            data_url = item.url
+        else:
+            print(f"[*] Encoding media (Base64): {os.path.basename(working_path)}", file=sys.stderr)
+            with self.telemetry.span("encode"), open(working_path, "rb") as f:
+                b64_data = base64.b64encode(f.read()).decode("utf-8")
+            data_url = f"data:{mime_type};base64,{b64_data}"
+
+        multimodal_content.append({
+            "type": "image_url",
+            "image_url": {"url": data_url}
+        })
+
+    def _response_cache_key(self, messages, model, temperature, file_paths, file_path, video_mode):
+        model = self.resolve_model(model or self.config.get("default_chat_model", "claude-sonnet-4-5"))
+        hashes = [self._hash(p) for p in self._collect_paths(file_paths, file_path) if os.path.exists(p)]
+        return model, ResponseCache.key(model, messages, temperature, hashes,
+                                        video_mode=video_mode or self.config.get("video_mode", "video"))
+
+    def chat_completion(self, messages, model=None, temperature=0.7, file_paths=None, file_path=None, stream_body=None,
+                        video_mode=None, cache=None, priority=None, gateway=None):
+        """
+        Send a streaming chat request, attaching local media files as base64 data URLs.
+
+        With stream_body (default from config "stream_body", on unless disabled) the
+        media is base64-encoded chunk by chunk while the request is sent, so memory use
+        does not grow with file size and `messages` is left unmodified. With
+        stream_body=False the media is inlined into messages[-1] in memory.
+
+        video_mode (default from config "video_mode", "video") selects how videos
+        are sent: "video" sends the optimized clip, "frames" sends timestamped key
+        frames (see _sample_frames), "audio" sends only the audio track (see
+        _extract_audio).
+
+        With cache (default from config "response_cache", off) a completed stream
+        is stored on disk, and an identical request (same model, messages,
+        temperature and file contents) is answered from it without contacting
+        the server. The cached response replays the stream and has from_cache=True.
+
+        priority ("interactive", "normal" or "batch"; default config
+        "default_priority", else "interactive") orders requests waiting for the
+        client-side rate limiter (see rate_limit.py). gateway (a Gateway from
+        self.gateways) pins the request to one gateway, e.g. the one that holds
+        the file URIs referenced in messages.
+
+        The telemetry record of a successful call is attached to the response as
+        .telemetry and finished by sse.ChatStream once the stream has been read,
+        so it also carries ttft/stream timings.
+        """
+        url = f"{self.base_url}/chat/completions" if len(self.gateways) == 1 else f"{len(self.gateways)} gateways"
+        if cache is None:
+            cache = self.config.get("response_cache", False)
+
+        record = self.telemetry.record("chat", files=len(self._collect_paths(file_paths, file_path)))
+        outer = self.telemetry.attach(record)
         try:
-            print(f"[*] Sending Payload ({len(json.dumps(payload))/1024/1024:.1f}MB) to {url}...", file=sys.stderr)
+            if cache:
+                cache_model, cache_key = self._response_cache_key(
+                    messages, model, temperature, file_paths, file_path, video_mode)
+                hit = self.response_cache.get(cache_key)
+                if hit is not None:
+                    print(f"[*] Response cache hit ({len(hit)/1024:.1f}KB)", file=sys.stderr)
+                    record.set(model=cache_model, cache="hit")
+                    response = CachedResponse(hit)
+                    response.telemetry = record
+                    return response
+            with self.telemetry.span("prepare"):
+                body = self._build_chat_body(messages, model, temperature, file_paths, file_path, stream_body,
+                                             video_mode)
+            print(f"[*] Sending Payload ({len(body)/1024/1024:.1f}MB) to {url}...", file=sys.stderr)
             print("[*] Please wait, this may take a minute for large videos...", file=sys.stderr)
-            response = s.post(url, headers=headers, json=payload, stream=True, timeout=900) 
-            
-            # --- 自动降级逻辑 (Fallback) ---
-            # 如果请求的是 gemini-3-pro 且返回 503 (账号故障/负载过高)
-            if response.status_code == 503 and model == "gemini-3-pro":
-                print(f"[!] gemini-3-pro 返回 503 (繁忙/账号故障)，正在自动切换到 gemini-3-flash 进行重试...", file=sys.stderr)
-                payload["model"] = "gemini-3-flash"
-                response = s.post(url, headers=headers, json=payload, stream=True, timeout=900)
+            started = time.time()
+            response = self._post_with_failover("/chat/completions", body,
+                                                priority or self.config.get("default_priority", "interactive"),
+                                                gateway=gateway)
             
             print(f"[*] Response received: {response.status_code}", file=sys.stderr)
+            record.set(model=body.payload["model"], http_status=response.status_code)
+            # Lets sse.ChatStream measure time-to-first-token from the real request start
+            response.started_at = started
+            if response.status_code != 200:
+                record.finish(status="failed")
+                return response
+            response.telemetry = record
+            if cache:
+                response = self.response_cache.recording(response, cache_key, cache_model)
             return response
         except Exception as e:
             print(f"[-] Request failed: {e}", file=sys.stderr)
+            record.finish(status="error", error=f"{type(e).__name__}: {e}")
             return None
+        finally:
+            # From here on the record belongs to the response
+            self.telemetry.detach(outer)
 
-    def generate_image(self, prompt, size="1024x1024", image_path=None, quality="standard", n=1):
-        # According to the provided SDK, images are generated via the /chat/completions endpoint
-        url = f"{self.base_url}/chat/completions"
-        model = "gemini-3.1-flash-image"
+    def _wait_out(self, gateway, candidate, retry_after):
+        """
+        Whether a 429/503 asking to come back after retry_after seconds is worth
+        waiting for on the same gateway. The route is paused in the limiter, so
+        the next attempt's acquire does the waiting.
+        """
+        if retry_after is None or retry_after > self.retry_after_max:
+            return False
+        print(f"[*] {gateway.name} asked to retry {candidate} after {retry_after:g}s", file=sys.stderr)
+        return True
+
+    def _post_with_failover(self, path, body, priority="interactive", gateway=None):
+        """
+        POST the chat body, following the model's failover chain on 429/5xx and
+        connection errors. With several gateways, a failed attempt is first
+        retried on the other gateways before moving down the chain. A 429/503 with
+        a Retry-After of at most "retry_after_max" seconds is waited out and
+        retried once before that. Every attempt first takes a slot from the rate
+        limiter. Only the small JSON envelope is rebuilt when the model changes;
+        the media part is streamed again from the same source.
+        """
+        response = None
+        error = None
+        attempts = 0
+        pinned = gateway
+        requested = body.payload["model"]
+        for candidate, delay in self.failover.plan(requested):
+            if candidate != body.payload["model"]:
+                # --- 自动降级逻辑 (Fallback) ---
+                reason = response.status_code if response is not None else (error or "circuit open")
+                print(f"[!] {body.payload['model']} 请求失败 ({reason})，正在自动切换到 {candidate} 进行重试...", file=sys.stderr)
+                body.update(model=candidate)
+            if delay:
+                print(f"[*] Retrying {candidate} in {delay:.1f}s...", file=sys.stderr)
+                time.sleep(delay)
+            tried = []
+            waited_out = False
+            while len(tried) < (1 if pinned else len(self.gateways)):
+                gateway = pinned or self.gateways.pick(exclude=tried)
+                if gateway in tried:
+                    break
+                if tried:
+                    print(f"[*] Retrying {candidate} on gateway {gateway.name}...", file=sys.stderr)
+                tried.append(gateway)
+                if response is not None:
+                    self._read_and_close(response)
+                attempts += 1
+                keys = self.limiter.keys(candidate, gateway.name)
+                with self.telemetry.span("queue"):
+                    self.limiter.acquire(keys, priority, timeout=self.queue_timeout)
+                sent = time.perf_counter()
+                self.gateways.acquire(gateway)
+                try:
+                    raw = self.session.post(gateway.base_url + path, headers=self._headers(api_key=gateway.api_key),
+                                            data=body, stream=True, timeout=self._timeout("chat"))
+                except requests.RequestException as e:
+                    print(f"[-] Request to {candidate} failed: {e}", file=sys.stderr)
+                    self.limiter.observe(keys, None)
+                    self.gateways.release(gateway)
+                    self.gateways.record(gateway, ok=False)
+                    response, error = None, e
+                    continue
+                # Counts as in flight on the gateway until the stream is read or closed
+                response = TrackedResponse(raw, self.gateways, gateway)
+                retry_after = parse_retry_after(raw.headers.get("Retry-After"))
+                self.limiter.observe(keys, raw.status_code, retry_after)
+                if raw.status_code not in RETRYABLE_STATUSES:
+                    self.gateways.record(gateway, ok=True)
+                    self.failover.record(candidate, ok=True)
+                    # Request start to response headers; includes sending the (streamed) body
+                    self.telemetry.add_span("ttfb", time.perf_counter() - sent)
+                    if self.telemetry.current is not None:
+                        self.telemetry.current.set(attempts=attempts, gateway=gateway.name)
+                    if raw.status_code != 200:
+                        self._read_and_close(response)
+                    return response
+                self.gateways.record(gateway, ok=False)
+                if not waited_out and self._wait_out(gateway, candidate, retry_after):
+                    waited_out = True
+                    tried.remove(gateway)
+            self.failover.record(candidate, ok=False)
+        if response is None and error is not None:
+            raise error
+        if response is not None:
+            self._read_and_close(response)
+        return response
+
+    @staticmethod
+    def _read_and_close(response):
+        """Read a (small) error body so .text still works, and give the connection back."""
+        try:
+            response.content
+        except requests.RequestException:
+            pass
+        response.close()
+
+    @staticmethod
+    def _attach_media_copy(messages, multimodal_content):
+        """Return a shallow copy of messages with media appended to the last user turn."""
+        messages = list(messages)
+        last = dict(messages[-1])
+        content = last['content']
+        if isinstance(content, list):
+            content = list(content) + multimodal_content
+        else:
+            content = [{"type": "text", "text": content}] + multimodal_content
+        last['content'] = content
+        messages[-1] = last
+        return messages
+
+    def _image_payload(self, prompt, size="1024x1024", image_path=None):
+        model = self.resolve_model(self.config.get("default_image_model", "gemini-3.1-flash-image"))
         
         messages = []
         if image_path and os.path.exists(image_path):
             print(f"[*] Encoding reference image: {image_path}", file=sys.stderr)
             try:
-                mime_type, _ = mimetypes.guess_type(image_path)
-                mime_type = mime_type or "image/png"
-                img_data = base64.b64encode(open(image_path, "rb").read()).decode("utf-8")
+                working_path, mime_type = self._prepare_image(image_path)
+                with open(working_path, "rb") as f:
+                    img_data = base64.b64encode(f.read()).decode("utf-8")
                 
                 messages.append({
                     "role": "user",
@@ -301,45 +919,194 @@ class AntigravityClient:
             "size": size, # Using extra_body logic as top level for simplicity in REST
             "stream": False # Getting full response usually contains the URL/Image Markdown
         }
-        
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-            "User-Agent": "Antigravity/4.0.6"
-        }
-        
-        print(f"[*] Sending Image Request via Chat API to {model}...", file=sys.stderr)
-        try:
-            response = s.post(url, headers=headers, json=payload, timeout=120)
+        return payload
+
+    def _post_image(self, payload, priority="interactive"):
+        gateway = self.gateways.pick()
+        url = f"{gateway.base_url}/chat/completions"
+        keys = self.limiter.keys(payload["model"], gateway.name)
+        with self.telemetry.request("image", model=payload["model"], gateway=gateway.name) as record:
+            with self.telemetry.span("queue"):
+                self.limiter.acquire(keys, priority, timeout=self.queue_timeout)
+            with self.telemetry.span("request"), self.gateways.using(gateway):
+                try:
+                    response = self.session.post(url, headers=self._headers(api_key=gateway.api_key), json=payload,
+                                                 timeout=self._timeout("image"))
+                    content = response.content
+                except requests.RequestException:
+                    self.limiter.observe(keys, None)
+                    self.gateways.record(gateway, ok=False)
+                    raise
+            self.limiter.observe(keys, response.status_code, parse_retry_after(response.headers.get("Retry-After")))
+            self.gateways.record(gateway, ok=response.status_code not in RETRYABLE_STATUSES)
+            self.telemetry.add_bytes("response", len(content))
+            record.set(http_status=response.status_code, status="ok" if response.status_code == 200 else "failed")
             if response.status_code == 200:
                 return response.json()
-            else:
-                print(f"[-] API Error {response.status_code}: {response.text}")
+            print(f"[-] API Error {response.status_code}: {response.text}")
+            return None
+
+    def generate_image(self, prompt, size="1024x1024", image_path=None, quality="standard", n=1):
+        """
+        Generate an image via the chat endpoint. With n > 1, n requests run
+        concurrently (see generate_images) and their choices are merged into one
+        response, as an OpenAI-style n-choice result.
+        """
+        if n > 1:
+            results = [r["result"] for r in self.generate_images([prompt] * n, size, image_path) if r["result"]]
+            if not results:
                 return None
+            choices = [dict(choice, index=i) for i, choice in
+                       enumerate(c for result in results for c in result.get("choices", []))]
+            return dict(results[0], choices=choices)
+
+        # According to the provided SDK, images are generated via the /chat/completions endpoint
+        try:
+            payload = self._image_payload(prompt, size, image_path)
+            print(f"[*] Sending Image Request via Chat API to {payload['model']}...", file=sys.stderr)
+            return self._post_image(payload)
         except Exception as e:
             print(f"[-] Image Request failed: {e}", file=sys.stderr)
             return None
 
-    def get_models(self):
+    @staticmethod
+    def _with_prompt(payload, prompt):
+        """Copy of an image payload with a different prompt (the encoded reference image is shared)."""
+        message = dict(payload["messages"][0])
+        if isinstance(message["content"], list):
+            message["content"] = [{"type": "text", "text": prompt}] + message["content"][1:]
+        else:
+            message["content"] = prompt
+        return dict(payload, messages=[message])
+
+    def generate_images(self, prompts, size="1024x1024", image_path=None, max_concurrency=None):
+        """
+        Generate one image per prompt, with up to max_concurrency requests in flight
+        (default: config "image_concurrency", 4). The reference image is prepared
+        once for all prompts. Returns [{"prompt", "result", "latency_s"}, ...] in
+        prompt order; "result" is None for a failed request.
+        """
+        if not prompts:
+            return []
+        workers = max_concurrency or int(self.config.get("image_concurrency", 4))
+        try:
+            template = self._image_payload(prompts[0], size, image_path)
+        except Exception as e:
+            print(f"[-] Image Request failed: {e}", file=sys.stderr)
+            return [{"prompt": p, "result": None, "latency_s": 0.0} for p in prompts]
+        print(f"[*] Sending {len(prompts)} Image Requests to {template['model']} ({workers} concurrent)...",
+              file=sys.stderr)
+
+        def run(prompt):
+            started = time.time()
+            try:
+                result = self._post_image(self._with_prompt(template, prompt))
+            except Exception as e:
+                print(f"[-] Image Request failed: {e}", file=sys.stderr)
+                result = None
+            return {"prompt": prompt, "result": result, "latency_s": round(time.time() - started, 3)}
+
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(prompts)))) as pool:
+            return list(pool.map(run, prompts))
+
+    def iter_download(self, url, chunk_size=1024 * 1024):
+        """Yield the body of url in chunks, over the pooled session."""
+        with self.session.get(url, stream=True, timeout=self._timeout("image")) as response:
+            response.raise_for_status()
+            yield from response.iter_content(chunk_size=chunk_size)
+
+    def download_file(self, url, save_path, chunk_size=1024 * 1024):
+        """Stream url straight to save_path over the pooled session. Returns bytes written."""
+        save_path = Path(save_path)
+        tmp = save_path.with_name(save_path.name + ".part")
+        written = 0
+        try:
+            with open(tmp, "wb") as f:
+                for chunk in self.iter_download(url, chunk_size):
+                    f.write(chunk)
+                    written += len(chunk)
+            os.replace(tmp, save_path)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+        return written
+
+    @staticmethod
+    def _parse_models(data):
+        # Unified parsing: some APIs return {'data': [...]}, some return list directly
+        if isinstance(data, dict) and 'data' in data:
+            return data['data']
+        elif isinstance(data, list):
+            return data
+        return []
+
+    def _check_gateway(self, gateway):
+        """Health check for the gateway pool: GET /models answers without a server or auth error."""
+        response = self.session.get(f"{gateway.base_url}/models", headers=self._headers(None, api_key=gateway.api_key),
+                                    timeout=self._timeout("models"))
+        response.close()
+        return response.status_code < 500 and response.status_code not in (401, 403, 429)
+
+    def get_models(self, refresh=False):
+        """
+        Models offered by the gateway. Served from the catalog cache while fresh
+        (config "models_cache_ttl_minutes", default 60); a stale entry is
+        revalidated with If-None-Match / If-Modified-Since. If the gateway cannot
+        be reached the stale list is returned.
+        """
+        entry = self.model_catalog.entry(self.base_url)
+        if not refresh and self.model_catalog.is_fresh(entry):
+            return entry["models"]
+
         url = f"{self.base_url}/models"
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "User-Agent": "Antigravity/4.0.6"
-        }
+        headers = self._headers(content_type=None)
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
         
         try:
-            response = s.get(url, headers=headers, timeout=10)
+            response = self.session.get(url, headers=headers, timeout=self._timeout("models"))
+            if response.status_code == 304 and entry:
+                self.model_catalog.touch(self.base_url)
+                return entry["models"]
             if response.status_code == 200:
-                data = response.json()
-                # Unified parsing: some APIs return {'data': [...]}, some return list directly
-                if isinstance(data, dict) and 'data' in data:
-                    return data['data']
-                elif isinstance(data, list):
-                    return data
-                return []
-            else:
-                print(f"[-] API Error {response.status_code}: {response.text}")
+                models = self._parse_models(response.json())
+                self.model_catalog.store(self.base_url, models, etag=response.headers.get("ETag"),
+                                         last_modified=response.headers.get("Last-Modified"))
+                self._models_failed_at = None
+                return models
+            print(f"[-] API Error {response.status_code}: {response.text}", file=sys.stderr)
+            if response.status_code in (404, 405, 501):
+                # No catalog on this gateway: remember that instead of asking on every run
+                self.model_catalog.store(self.base_url, [])
                 return []
         except Exception as e:
             print(f"[-] Models Request failed: {e}", file=sys.stderr)
-            return []
+        self._models_failed_at = time.time()
+        return entry["models"] if entry else []
+
+    def resolve_model(self, model):
+        """
+        Check a model name against the cached catalog before any media is
+        encoded: config "model_aliases" remaps short names, and an unknown name
+        raises model_catalog.UnknownModelError with suggestions. Disabled with
+        "model_preflight": false; names pass through if no catalog is available.
+        """
+        aliases = self.config.get("model_aliases", {})
+        if not self.config.get("model_preflight", True):
+            return aliases.get(model, model)
+        entry = self.model_catalog.entry(self.base_url)
+        if self.model_catalog.is_fresh(entry):
+            models = entry["models"]
+        elif self._models_failed_at and time.time() - self._models_failed_at < 60:
+            # Gateway did not answer /models a moment ago; do not stall every request on it
+            models = entry["models"] if entry else []
+        else:
+            models = self.get_models()
+        if not models:
+            return aliases.get(model, model)
+        resolved = ModelCatalog.resolve(model, models, aliases)
+        if resolved != model:
+            print(f"[*] Model '{model}' -> '{resolved}'", file=sys.stderr)
+        return resolved
@@ -0,0 +1,380 @@
+"""
+asyncio counterpart of AntigravityClient, built on aiohttp (optional: `pip install aiohttp`).
+
+It has the same surface as the blocking client: chat_completion, generate_image,
+get_models and upload_file. A semaphore bounds the number of requests in flight
+("async_max_concurrency" in config, default 32). A streaming chat keeps its slot
+until the stream is read or closed. Transcoding, hashing and base64 encoding run
+in worker threads, so one event loop can drive hundreds of concurrent streams.
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+from urllib.parse import quote
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from api_client import AntigravityClient, ENDPOINT_GONE, UPLOAD_MODES
+from failover import RETRYABLE_STATUSES
+from rate_limit import parse_retry_after
+from media_cache import fast_hash
+from sse import DONE, SSEDecoder
+from streaming_body import StreamingJSONBody
+
+DEFAULT_MAX_CONCURRENCY = 32
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+class AsyncChatResponse:
+    """Streaming chat response. Holds a concurrency slot until fully read or closed."""
+
+    def __init__(self, response, release, record=None, started=None):
+        self._response = response
+        self._release = release
+        self.status_code = response.status
+        self.telemetry = record
+        self.started_at = started or time.time()
+        self.received_bytes = 0
+
+    async def text(self):
+        try:
+            return await self._response.text()
+        finally:
+            self.close()
+
+    async def iter_lines(self):
+        # Split lines ourselves: aiohttp's line iterator rejects very long lines (inline images)
+        buffer = bytearray()
+        try:
+            async for chunk in self._response.content.iter_any():
+                buffer += chunk
+                *lines, rest = buffer.split(b"\n")
+                buffer = bytearray(rest)
+                for line in lines:
+                    yield bytes(line.rstrip(b"\r"))
+            if buffer:
+                yield bytes(buffer)
+        finally:
+            self.close()
+
+    async def iter_deltas(self):
+        """Yield the text content of each SSE delta until [DONE]."""
+        decoder = SSEDecoder()
+        try:
+            async for chunk in self._response.content.iter_any():
+                self.received_bytes += len(chunk)
+                for payload in decoder.feed(chunk):
+                    if payload == DONE:
+                        return
+                    try:
+                        event = json.loads(payload)
+                    except ValueError:
+                        continue
+                    content = (event.get("choices") or [{}])[0].get("delta", {}).get("content")
+                    if content:
+                        if self.telemetry is not None and "ttft" not in self.telemetry.spans:
+                            self.telemetry.add_span("ttft", time.time() - self.started_at)
+                        yield content
+        finally:
+            self.close()
+
+    def close(self):
+        if self._release:
+            self._response.release()
+            self._release()
+            self._release = None
+        if self.telemetry is not None and not self.telemetry.finished:
+            self.telemetry.add_span("stream", time.time() - self.started_at)
+            self.telemetry.add_bytes("response", self.received_bytes)
+            self.telemetry.finish(status="ok")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+
+class AsyncAntigravityClient:
+    def __init__(self, api_key=None, base_url=None, max_concurrency=None):
+        if aiohttp is None:
+            raise ImportError("AsyncAntigravityClient requires aiohttp: pip install aiohttp")
+        # The blocking client supplies config, caches and payload preparation
+        self._sync = AntigravityClient(api_key=api_key, base_url=base_url)
+        self.config = self._sync.config
+        self.base_url = self._sync.base_url
+        self.api_key = self._sync.api_key
+        self.max_concurrency = max_concurrency or int(
+            self.config.get("async_max_concurrency", DEFAULT_MAX_CONCURRENCY))
+        self._slots = None
+        self._session = None
+
+    def _ensure_session(self):
+        # Created lazily so they bind to the running event loop
+        if self._session is None or self._session.closed:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+                trust_env=False,
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    @staticmethod
+    async def _iter_off_loop(iterable):
+        """Drive a blocking iterator (file reads, base64 encoding) from a worker thread."""
+        it = iter(iterable)
+        while True:
+            chunk = await asyncio.to_thread(next, it, None)
+            if chunk is None:
+                return
+            yield chunk
+
+    @staticmethod
+    def _file_chunks(file_path):
+        with open(file_path, "rb") as f:
+            yield from iter(lambda: f.read(READ_CHUNK_SIZE), b"")
+
+    async def chat_completion(self, messages, model=None, temperature=0.7, file_paths=None, file_path=None,
+                              video_mode=None, priority=None):
+        """Async version of AntigravityClient.chat_completion. Returns an AsyncChatResponse or None."""
+        gateways = self._sync.gateways
+        url = f"{self.base_url}/chat/completions" if len(gateways) == 1 else f"{len(gateways)} gateways"
+        session = self._ensure_session()
+        telemetry = self._sync.telemetry
+        record = telemetry.record("chat", files=len(self._sync._collect_paths(file_paths, file_path)))
+        try:
+            body = await asyncio.to_thread(
+                self._build_chat_body, record, messages, model, temperature, file_paths, file_path, video_mode)
+        except Exception as e:
+            print(f"[-] Failed to prepare request: {e}", file=sys.stderr)
+            record.finish(status="error", error=f"{type(e).__name__}: {e}")
+            return None
+
+        timeout = aiohttp.ClientTimeout(total=900)
+        await self._slots.acquire()
+        try:
+            print(f"[*] Sending Payload ({len(body)/1024/1024:.1f}MB) to {url}...", file=sys.stderr)
+            started = time.time()
+            response, gateway = await self._post_with_failover(
+                session, "/chat/completions", body, timeout,
+                priority or self.config.get("default_priority", "interactive"))
+        except Exception as e:
+            self._slots.release()
+            print(f"[-] Request failed: {e}", file=sys.stderr)
+            record.finish(status="error", error=f"{type(e).__name__}: {e}")
+            return None
+
+        print(f"[*] Response received: {response.status}", file=sys.stderr)
+        record.add_span("ttfb", time.time() - started)
+        record.set(model=body.payload["model"], http_status=response.status, gateway=gateway.name)
+        if response.status != 200:
+            record.finish(status="failed")
+            record = None
+
+        def release():
+            gateways.release(gateway)
+            self._slots.release()
+
+        return AsyncChatResponse(response, release, record, started)
+
+    def _build_chat_body(self, record, messages, model, temperature, file_paths, file_path, video_mode):
+        # Runs in a worker thread: collect the preparation spans into this call's record
+        telemetry = self._sync.telemetry
+        outer = telemetry.attach(record)
+        try:
+            with telemetry.span("prepare"):
+                return self._sync._build_chat_body(messages, model, temperature, file_paths, file_path, True,
+                                                   video_mode)
+        finally:
+            telemetry.detach(outer)
+
+    async def _post_with_failover(self, session, path, body, timeout, priority="interactive"):
+        """
+        Async version of AntigravityClient._post_with_failover (same policy, breakers
+        and gateways, including waiting out a short Retry-After, which happens in
+        acquire_async without blocking the loop). Returns (response, gateway); the
+        gateway counts the request as in flight until the caller releases it.
+        """
+        failover = self._sync.failover
+        gateways = self._sync.gateways
+        limiter = self._sync.limiter
+        response = None
+        response_gateway = None  # gateway holding `response` in flight
+        error = None
+        for candidate, delay in failover.plan(body.payload["model"]):
+            if candidate != body.payload["model"]:
+                reason = response.status if response is not None else (error or "circuit open")
+                print(f"[!] {body.payload['model']} 请求失败 ({reason})，正在自动切换到 {candidate} 进行重试...", file=sys.stderr)
+                body.update(model=candidate)
+            if delay:
+                await asyncio.sleep(delay)
+            tried = []
+            waited_out = False
+            while len(tried) < len(gateways):
+                gateway = gateways.pick(exclude=tried)
+                if gateway in tried:
+                    break
+                tried.append(gateway)
+                if response is not None:
+                    response.release()
+                    gateways.release(response_gateway)
+                headers = self._sync._headers(api_key=gateway.api_key)
+                headers["Content-Length"] = str(len(body))
+                keys = limiter.keys(candidate, gateway.name)
+                await limiter.acquire_async(keys, priority, self._sync.queue_timeout)
+                gateways.acquire(gateway)
+                try:
+                    response = await session.post(gateway.base_url + path, headers=headers,
+                                                  data=self._iter_off_loop(body), timeout=timeout)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    print(f"[-] Request to {candidate} failed: {e}", file=sys.stderr)
+                    limiter.observe(keys, None)
+                    gateways.release(gateway)
+                    gateways.record(gateway, ok=False)
+                    response, error = None, e
+                    continue
+                response_gateway = gateway
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                limiter.observe(keys, response.status, retry_after)
+                if response.status not in RETRYABLE_STATUSES:
+                    gateways.record(gateway, ok=True)
+                    failover.record(candidate, ok=True)
+                    return response, gateway
+                gateways.record(gateway, ok=False)
+                if not waited_out and self._sync._wait_out(gateway, candidate, retry_after):
+                    waited_out = True
+                    tried.remove(gateway)
+            failover.record(candidate, ok=False)
+        if response is None:
+            raise error or RuntimeError("no gateway available")
+        return response, response_gateway
+
+    async def generate_image(self, prompt, size="1024x1024", image_path=None, quality="standard", n=1,
+                             priority=None):
+        """Async version of AntigravityClient.generate_image (one image; same gateways, limiter and failover)."""
+        session = self._ensure_session()
+        gateways = self._sync.gateways
+        try:
+            body = await asyncio.to_thread(
+                lambda: StreamingJSONBody(self._sync._image_payload(prompt, size, image_path)))
+        except Exception as e:
+            print(f"[-] Image Request failed: {e}", file=sys.stderr)
+            return None
+        record = self._sync.telemetry.record("image", model=body.payload["model"])
+
+        print(f"[*] Sending Image Request via Chat API to {body.payload['model']}...", file=sys.stderr)
+        try:
+            async with self._slots:
+                started = time.time()
+                response, gateway = await self._post_with_failover(
+                    session, "/chat/completions", body, aiohttp.ClientTimeout(total=120),
+                    priority or self.config.get("default_priority", "interactive"))
+                try:
+                    content = await response.read()
+                finally:
+                    response.release()
+                    gateways.release(gateway)
+        except Exception as e:
+            print(f"[-] Image Request failed: {e}", file=sys.stderr)
+            record.finish(status="error", error=f"{type(e).__name__}: {e}")
+            return None
+
+        record.add_span("request", time.time() - started)
+        record.add_bytes("response", len(content))
+        record.set(model=body.payload["model"], http_status=response.status, gateway=gateway.name)
+        if response.status == 200:
+            record.finish(status="ok")
+            return json.loads(content)
+        record.finish(status="failed")
+        print(f"[-] API Error {response.status}: {content.decode('utf-8', 'replace')}")
+        return None
+
+    async def get_models(self, refresh=False):
+        # Shares the blocking client's on-disk catalog cache (usually answered without a request)
+        return await asyncio.to_thread(self._sync.get_models, refresh)
+
+    async def _post_upload(self, session, url, mode, file_path, safe_file_name, mime_type):
+        headers = self._sync._headers(content_type=None)
+        timeout = aiohttp.ClientTimeout(total=600)
+        if mode == "multipart":
+            form = aiohttp.FormData()
+            form.add_field("file", self._iter_off_loop(self._file_chunks(file_path)),
+                           filename=safe_file_name, content_type=mime_type)
+            form.add_field("purpose", "fine-tune")
+            data, uri_keys = form, ("file_uri", "id", "uri")
+        else:
+            headers.update({
+                "X-File-Name": safe_file_name,
+                "X-File-Type": mime_type,
+                "Content-Type": "application/octet-stream",
+                "Content-Length": str(os.path.getsize(file_path)),
+            })
+            data, uri_keys = self._iter_off_loop(self._file_chunks(file_path)), ("file_uri", "uri")
+
+        async with session.post(url, headers=headers, data=data, timeout=timeout) as response:
+            if response.status != 200:
+                return None, response.status, (await response.text())[:100]
+            result = await response.json(content_type=None)
+            return next((result[k] for k in uri_keys if result.get(k)), None), response.status, ""
+
+    async def upload_file(self, file_path):
+        """Async version of AntigravityClient.upload_file (single-request mode)."""
+        if not os.path.exists(file_path):
+            return None
+        session = self._ensure_session()
+        cache = self._sync.upload_cache
+        mime_type = self._sync._upload_mime_type(file_path)
+        safe_file_name = quote(os.path.basename(file_path))
+
+        content_hash = await asyncio.to_thread(fast_hash, file_path)
+        cached = cache.file_uri(self.base_url, content_hash)
+        if cached:
+            print(f"[*] Reusing uploaded file: {cached['uri']}", file=sys.stderr)
+            return cached
+
+        known = cache.endpoint(self.base_url)
+        if not known:
+            # One-off per gateway; the result is remembered on disk
+            known = await asyncio.to_thread(self._sync._discover_upload_endpoint)
+        attempts = [known] if known else [
+            (url, mode) for url in self._sync._upload_endpoints() for mode in UPLOAD_MODES
+        ]
+
+        print(f"[*] Uploading {os.path.basename(file_path)} ({os.path.getsize(file_path)/1024/1024:.2f}MB)...",
+              file=sys.stderr)
+        gone = False
+        for url, mode in attempts:
+            try:
+                async with self._slots:
+                    file_uri, status, error = await self._post_upload(
+                        session, url, mode, file_path, safe_file_name, mime_type)
+            except Exception as e:
+                print(f"[-] Attempt failed for {url}: {e}", file=sys.stderr)
+                continue
+            if file_uri:
+                print(f"[+] Upload success: {file_uri}", file=sys.stderr)
+                cache.remember_endpoint(self.base_url, url, mode)
+                cache.remember_file(self.base_url, content_hash, file_uri, mime_type)
+                return {"uri": file_uri, "mime_type": mime_type}
+            print(f"[-] Mode {mode} failed ({status}) for {url}: {error}", file=sys.stderr)
+            gone = status in ENDPOINT_GONE
+
+        if known and gone:
+            # The gateway no longer serves the remembered endpoint; rediscover on the next call
+            cache.forget_endpoint(self.base_url)
+        return None
@@ -0,0 +1,203 @@
+"""
+Resumable, parallel chunked uploads.
+
+The file is split into fixed-size parts, and several parts are uploaded at once
+over the client's shared connection pool. Each part is retried on its own. Finished
+parts are recorded in an on-disk manifest, so an interrupted upload resumes
+where it stopped.
+
+Protocol, served under the gateway's files endpoint (e.g. .../v1/files):
+
+    POST {files}/uploads                 {"file_name", "mime_type", "size", "part_size"} -> {"upload_id"}
+    PUT  {files}/uploads/{id}/parts/{n}  raw bytes of part n (0-based)                   -> 200
+    GET  {files}/uploads/{id}                                                            -> {"parts": [n, ...]}
+    POST {files}/uploads/{id}/complete                                                   -> {"file_uri"}
+
+scripts/mock_gateway.py implements it for local testing.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+DEFAULT_PART_MB = 8
+DEFAULT_PARALLEL = 4
+DEFAULT_RETRIES = 3
+
+
+class ProgressMeter:
+    """Thread-safe byte counter that reports throughput at most once per interval."""
+
+    def __init__(self, total, callback=None, interval=1.0):
+        self.total = total
+        self.callback = callback
+        self.interval = interval
+        self.sent = 0
+        self.started = time.time()
+        self._last_report = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self):
+        elapsed = time.time() - self.started
+        return self.sent / elapsed if elapsed > 0 else 0.0
+
+    def add(self, n, force=False):
+        with self._lock:
+            self.sent += n
+            now = time.time()
+            if not force and now - self._last_report < self.interval:
+                return
+            self._last_report = now
+        if self.callback:
+            self.callback(self.sent, self.total, self.rate)
+        else:
+            pct = self.sent * 100 / self.total if self.total else 100
+            print(f"[*] Uploaded {self.sent/1024/1024:.1f}/{self.total/1024/1024:.1f}MB "
+                  f"({pct:.0f}%) at {self.rate/1024/1024:.2f}MB/s", file=sys.stderr)
+
+
+class ChunkedUploader:
+    def __init__(self, http, files_url, headers, manifest_dir, part_size=DEFAULT_PART_MB * 1024 * 1024,
+                 parallel=DEFAULT_PARALLEL, retries=DEFAULT_RETRIES, timeout=120):
+        self.http = http
+        self.files_url = files_url.rstrip("/")
+        self.headers = headers
+        self.manifest_dir = Path(manifest_dir)
+        self.part_size = part_size
+        self.parallel = parallel
+        self.retries = retries
+        self.timeout = timeout
+        self._lock = threading.Lock()
+
+    # --- manifest ---
+
+    def _manifest_path(self, content_hash):
+        return self.manifest_dir / f"{content_hash}.json"
+
+    def _load_manifest(self, content_hash, size):
+        try:
+            manifest = json.loads(self._manifest_path(content_hash).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        # Parts of another size do not line up with ours: start a new upload session
+        if (manifest.get("files_url") != self.files_url or manifest.get("size") != size
+                or manifest.get("part_size") != self.part_size):
+            return None
+        return manifest
+
+    def _save_manifest(self, content_hash, manifest):
+        self.manifest_dir.mkdir(parents=True, exist_ok=True)
+        path = self._manifest_path(content_hash)
+        tmp = path.with_name(f".{path.stem}-{uuid.uuid4().hex[:8]}.json")
+        tmp.write_text(json.dumps(manifest), encoding="utf-8")
+        os.replace(tmp, path)
+
+    # --- protocol ---
+
+    def _start(self, file_name, mime_type, size):
+        body = {"file_name": file_name, "mime_type": mime_type, "size": size, "part_size": self.part_size}
+        response = self.http.session.post(f"{self.files_url}/uploads", headers=self.headers, json=body,
+                                          timeout=self.timeout)
+        if response.status_code != 200:
+            print(f"[-] Chunked upload not accepted ({response.status_code}) by {self.files_url}", file=sys.stderr)
+            return None
+        return response.json().get("upload_id")
+
+    def _server_parts(self, upload_id):
+        """Parts the server already holds, or None if the upload session is gone."""
+        try:
+            response = self.http.session.get(f"{self.files_url}/uploads/{upload_id}", headers=self.headers,
+                                             timeout=self.timeout)
+        except Exception:
+            return None
+        if response.status_code != 200:
+            return None
+        return set(response.json().get("parts", []))
+
+    def _upload_part(self, file_path, upload_id, n, size, meter):
+        offset = n * self.part_size
+        length = min(self.part_size, size - offset)
+        url = f"{self.files_url}/uploads/{upload_id}/parts/{n}"
+        for attempt in range(self.retries + 1):
+            try:
+                with open(file_path, "rb") as f:
+                    f.seek(offset)
+                    data = f.read(length)
+                response = self.http.session.put(url, headers=dict(self.headers, **{
+                    "Content-Type": "application/octet-stream",
+                    "Content-Range": f"bytes {offset}-{offset + length - 1}/{size}",
+                }), data=data, timeout=self.timeout)
+                if response.status_code == 200:
+                    meter.add(length)
+                    return True
+                error = f"HTTP {response.status_code}"
+            except Exception as e:
+                error = e
+            if attempt < self.retries:
+                time.sleep(min(2 ** attempt, 10))
+        print(f"[-] Part {n} failed after {self.retries + 1} attempts: {error}", file=sys.stderr)
+        return False
+
+    def upload(self, file_path, file_name, mime_type, content_hash, progress=None):
+        """Upload file_path in parts. Returns the file_uri, or None on failure."""
+        size = os.path.getsize(file_path)
+        part_count = max(1, -(-size // self.part_size))
+
+        manifest = self._load_manifest(content_hash, size)
+        done = set()
+        if manifest:
+            done = self._server_parts(manifest["upload_id"])
+            if done is None:
+                manifest = None
+            else:
+                print(f"[*] Resuming chunked upload: {len(done)}/{part_count} parts already sent", file=sys.stderr)
+        if not manifest:
+            upload_id = self._start(file_name, mime_type, size)
+            if not upload_id:
+                return None
+            manifest = {"upload_id": upload_id, "files_url": self.files_url, "size": size,
+                        "part_size": self.part_size, "parts": []}
+            done = set()
+        manifest["parts"] = sorted(done)
+        self._save_manifest(content_hash, manifest)
+
+        upload_id = manifest["upload_id"]
+        pending = [n for n in range(part_count) if n not in done]
+        meter = ProgressMeter(sum(min(self.part_size, size - n * self.part_size) for n in pending), progress)
+        print(f"[*] Chunked upload: {len(pending)} parts of {self.part_size/1024/1024:g}MB, "
+              f"{self.parallel} in parallel", file=sys.stderr)
+
+        def run(n):
+            ok = self._upload_part(file_path, upload_id, n, size, meter)
+            if ok:
+                with self._lock:
+                    manifest["parts"].append(n)
+                    self._save_manifest(content_hash, manifest)
+            return ok
+
+        with ThreadPoolExecutor(max_workers=self.parallel) as pool:
+            results = list(pool.map(run, pending))
+        meter.add(0, force=True)
+        if not all(results):
+            print(f"[-] {results.count(False)} parts failed; run again to resume", file=sys.stderr)
+            return None
+
+        response = self.http.session.post(f"{self.files_url}/uploads/{upload_id}/complete",
+                                          headers=self.headers, timeout=self.timeout)
+        if response.status_code != 200:
+            print(f"[-] Completing chunked upload failed ({response.status_code}): {response.text[:100]}",
+                  file=sys.stderr)
+            return None
+        result = response.json()
+        file_uri = result.get("file_uri") or result.get("uri") or result.get("id")
+        if file_uri:
+            try:
+                self._manifest_path(content_hash).unlink()
+            except OSError:
+                pass
+        return file_uri
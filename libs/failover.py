@@ -0,0 +1,108 @@
+"""
+Model failover: per-model fallback chains, jittered exponential backoff and
+circuit breakers.
+
+FailoverPolicy.plan(model) yields (model, delay) pairs, one per attempt. The
+caller sleeps for `delay`, sends, and reports the outcome with record(). A model
+whose breaker is open (too many consecutive failures within the cooldown
+window) is skipped, so failing models are not retried on every request.
+"""
+import random
+import threading
+import time
+
+# Statuses that say "this model/backend is unavailable right now", not "bad request"
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+DEFAULT_FALLBACKS = {"gemini-3-pro": ["gemini-3-flash"]}
+
+
+def backoff_delay(attempt, base=0.5, cap=8.0):
+    """Full-jitter exponential backoff for retry number `attempt` (1-based)."""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures; lets one trial through after `cooldown` seconds."""
+
+    def __init__(self, threshold=3, cooldown=60.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return self.opened_at is not None and time.time() - self.opened_at < self.cooldown
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.time() - self.opened_at >= self.cooldown:
+                # Half-open: allow a trial request; a failure re-opens immediately
+                self.opened_at = time.time()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.time()
+
+
+class FailoverPolicy:
+    def __init__(self, config=None):
+        config = config or {}
+        self.fallbacks = config.get("model_fallbacks", DEFAULT_FALLBACKS)
+        self.retries = int(config.get("model_retries", 0))
+        self.backoff_base = float(config.get("backoff_base", 0.5))
+        self.backoff_max = float(config.get("backoff_max", 8.0))
+        self.threshold = int(config.get("circuit_failure_threshold", 3))
+        self.cooldown = float(config.get("circuit_cooldown", 60.0))
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, model):
+        with self._lock:
+            if model not in self._breakers:
+                self._breakers[model] = CircuitBreaker(self.threshold, self.cooldown)
+            return self._breakers[model]
+
+    def chain(self, model):
+        chain = [model]
+        for fallback in self.fallbacks.get(model, []):
+            if fallback not in chain:
+                chain.append(fallback)
+        return chain
+
+    def plan(self, model):
+        """
+        Yield (model, delay_seconds) for each attempt, in chain order. Models with
+        an open breaker are skipped, unless every model in the chain is open, in
+        which case the requested model is tried anyway.
+        """
+        attempt = 0
+        for candidate in self.chain(model):
+            if not self.breaker(candidate).allow():
+                continue
+            for _ in range(self.retries + 1):
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_max) if attempt else 0.0
+                attempt += 1
+                yield candidate, delay
+        if not attempt:
+            yield model, 0.0
+
+    def record(self, model, ok):
+        if ok:
+            self.breaker(model).record_success()
+        else:
+            self.breaker(model).record_failure()
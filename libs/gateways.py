@@ -0,0 +1,236 @@
+"""
+Load balancing across several Antigravity Manager gateways.
+
+config.json may list gateways instead of a single base_url/api_key:
+
+    "gateways": [
+        {"base_url": "http://10.0.0.2:8045/v1", "api_key": "sk-a", "weight": 2},
+        {"base_url": "http://10.0.0.3:8045/v1", "api_key": "sk-b"}
+    ]
+
+GatewayPool.pick() chooses a gateway per request: "least_in_flight" (default;
+fewest open requests relative to weight) or "weighted_round_robin" (smooth
+weighted round-robin, as in nginx). A gateway is ejected after
+`gateway_eject_after` consecutive failed requests. Readmission is half-open:
+once a background /models health check passes (or, without health checks,
+after the cooldown) one trial request is sent to it. Success puts it back in
+rotation; failure ejects it again. Health checks never count as successes for
+gateways in rotation, so intermittent request failures still add up.
+"""
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+STRATEGIES = ("least_in_flight", "weighted_round_robin")
+
+
+class Gateway:
+    def __init__(self, base_url, api_key, weight=1, name=None, threshold=3, cooldown=30.0):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.weight = max(1, int(weight))
+        self.name = name or urlsplit(self.base_url).netloc or self.base_url
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejected_at = None  # time of ejection; None while in rotation
+        self.probe_passed = False  # an ejected gateway passed a health check since
+        self.trial_at = None  # start of the trial request of a readmission
+        self.current_weight = 0  # smooth weighted round-robin state
+
+    @property
+    def healthy(self):
+        return self.ejected_at is None
+
+    def stats(self):
+        return {"name": self.name, "base_url": self.base_url, "weight": self.weight, "healthy": self.healthy,
+                "in_flight": self.in_flight, "requests": self.requests, "failures": self.failures}
+
+
+class GatewayPool:
+    def __init__(self, gateways, strategy="least_in_flight"):
+        if not gateways:
+            raise ValueError("at least one gateway is required")
+        if strategy not in STRATEGIES:
+            raise ValueError(f"gateway_strategy must be one of {STRATEGIES}, got {strategy!r}")
+        self.gateways = list(gateways)
+        self.strategy = strategy
+        self._lock = threading.Lock()
+        self._rotation = 0
+        self._health_thread = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_config(cls, config, base_url=None, api_key=None):
+        """Gateways from config "gateways", or the single base_url/api_key (explicit arguments win)."""
+        threshold = int(config.get("gateway_eject_after", 3))
+        cooldown = float(config.get("gateway_readmit_after", 30))
+        entries = config.get("gateways") or []
+        if base_url or not entries:
+            entries = [{"base_url": base_url or config.get("base_url", ""),
+                        "api_key": api_key or config.get("api_key", "")}]
+        gateways = [
+            Gateway(entry.get("base_url", ""), entry.get("api_key") or api_key or config.get("api_key", ""),
+                    weight=entry.get("weight", 1), name=entry.get("name"), threshold=threshold, cooldown=cooldown)
+            for entry in entries
+        ]
+        return cls(gateways, strategy=config.get("gateway_strategy", "least_in_flight"))
+
+    @property
+    def primary(self):
+        """The first configured gateway: uploads, the model catalog and caches are keyed on it."""
+        return self.gateways[0]
+
+    def __len__(self):
+        return len(self.gateways)
+
+    def _trial_ready(self, gateway, now):
+        """An ejected gateway may take one trial request (none is under way)."""
+        if gateway.ejected_at is None:
+            return False
+        # A trial that never reported back (e.g. it timed out in the rate limiter) expires
+        if gateway.trial_at is not None and now - gateway.trial_at < gateway.cooldown:
+            return False
+        if self._health_thread:
+            return gateway.probe_passed
+        return now - gateway.ejected_at >= gateway.cooldown
+
+    def pick(self, exclude=()):
+        """
+        Choose a gateway for one request, skipping `exclude` (e.g. ones that just
+        failed it) while others are available. An ejected gateway that is due a
+        trial gets the request. Other ejected gateways are only used when every
+        gateway is ejected; then the first is returned.
+        """
+        with self._lock:
+            now = time.time()
+            for gateway in self.gateways:
+                if gateway not in exclude and self._trial_ready(gateway, now):
+                    gateway.trial_at = now
+                    return gateway
+            candidates = [g for g in self.gateways if g.healthy and g not in exclude]
+            if not candidates:
+                return ([g for g in self.gateways if g not in exclude] or self.gateways)[0]
+            if self.strategy == "weighted_round_robin":
+                total = sum(g.weight for g in candidates)
+                for g in candidates:
+                    g.current_weight += g.weight
+                chosen = max(candidates, key=lambda g: g.current_weight)
+                chosen.current_weight -= total
+                return chosen
+            # Least in flight relative to weight; rotate the start so ties spread evenly
+            self._rotation = (self._rotation + 1) % len(candidates)
+            rotated = candidates[self._rotation:] + candidates[:self._rotation]
+            return min(rotated, key=lambda g: g.in_flight / g.weight)
+
+    def acquire(self, gateway):
+        with self._lock:
+            gateway.in_flight += 1
+            gateway.requests += 1
+
+    def release(self, gateway):
+        with self._lock:
+            gateway.in_flight = max(0, gateway.in_flight - 1)
+
+    @contextmanager
+    def using(self, gateway):
+        self.acquire(gateway)
+        try:
+            yield gateway
+        finally:
+            self.release(gateway)
+
+    def record(self, gateway, ok):
+        """Outcome of a request sent to gateway."""
+        with self._lock:
+            if ok:
+                readmitted = not gateway.healthy
+                gateway.consecutive_failures = 0
+                gateway.ejected_at = gateway.trial_at = None
+                gateway.probe_passed = False
+                if readmitted:
+                    print(f"[+] Gateway {gateway.name} healthy again, readmitted", file=sys.stderr)
+                return
+            gateway.failures += 1
+            gateway.consecutive_failures += 1
+            if gateway.trial_at is not None:
+                # The trial failed: eject again and wait for the next passing check
+                gateway.ejected_at = time.time()
+                gateway.trial_at = None
+                gateway.probe_passed = False
+                print(f"[!] Gateway {gateway.name} failed its trial request, ejected again", file=sys.stderr)
+            elif gateway.healthy and gateway.consecutive_failures >= gateway.threshold:
+                gateway.ejected_at = time.time()
+                if len(self.gateways) > 1:
+                    print(f"[!] Gateway {gateway.name} ejected after repeated failures", file=sys.stderr)
+
+    def stats(self):
+        return [g.stats() for g in self.gateways]
+
+    def start_health_checks(self, check, interval):
+        """
+        Call check(gateway) -> bool for every gateway each `interval` seconds in a
+        daemon thread. A passing check lets an ejected gateway take one trial
+        request; failures count towards ejection like failed requests.
+        """
+        if self._health_thread or interval <= 0:
+            return
+        self._health_thread = threading.Thread(target=self._health_loop, args=(check, interval),
+                                               name="gateway-health", daemon=True)
+        self._health_thread.start()
+
+    def _health_loop(self, check, interval):
+        while not self._stop.wait(interval):
+            for gateway in self.gateways:
+                try:
+                    ok = check(gateway)
+                except Exception:
+                    ok = False
+                if gateway.healthy:
+                    # A passing check says nothing about chat; only failures count
+                    if not ok:
+                        self.record(gateway, ok=False)
+                    continue
+                with self._lock:
+                    if ok and not gateway.probe_passed:
+                        print(f"[*] Gateway {gateway.name} passed its health check, sending a trial request",
+                              file=sys.stderr)
+                    gateway.probe_passed = ok
+
+    def close(self):
+        self._stop.set()
+
+
+class TrackedResponse:
+    """A streaming response that counts as in flight on its gateway until closed or fully read."""
+
+    def __init__(self, response, pool, gateway):
+        self._response = response
+        self._pool = pool
+        self.gateway = gateway
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def _done(self):
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.release(self.gateway)
+
+    def iter_content(self, chunk_size=None, decode_unicode=False):
+        try:
+            yield from self._response.iter_content(chunk_size=chunk_size, decode_unicode=decode_unicode)
+        finally:
+            self._done()
+
+    def close(self):
+        self._response.close()
+        self._done()
+
+    def __del__(self):
+        self._done()
@@ -0,0 +1,93 @@
+"""
+Connection pooling for AntigravityClient.
+
+All threads share one HTTPAdapter, and with it one urllib3 pool per host, so
+connections are kept alive and reused across threads. Each thread gets its own
+requests.Session on top of that adapter, because a Session's own state
+(cookies, mounts) is not safe to share between threads.
+"""
+import socket
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+
+DEFAULT_POOL_CONNECTIONS = 4
+DEFAULT_POOL_MAXSIZE = 32
+DEFAULT_TIMEOUTS = {
+    "connect": 10,
+    "chat": 900,
+    "upload": 600,
+    "image": 120,
+    "models": 10,
+}
+
+
+def _keepalive_socket_options(idle=60, interval=15, count=4):
+    options = list(HTTPConnection.default_socket_options) + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    # Not every platform exposes the tuning knobs (e.g. TCP_KEEPIDLE is missing on macOS/Windows)
+    for name, value in (("TCP_KEEPIDLE", idle), ("TCP_KEEPINTVL", interval), ("TCP_KEEPCNT", count)):
+        if hasattr(socket, name):
+            options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+    return options
+
+
+class _KeepAliveAdapter(HTTPAdapter):
+    def __init__(self, socket_options=None, **kwargs):
+        self._socket_options = socket_options
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self._socket_options:
+            kwargs["socket_options"] = self._socket_options
+        super().init_poolmanager(*args, **kwargs)
+
+
+class HTTPPool:
+    def __init__(self, pool_connections=DEFAULT_POOL_CONNECTIONS, pool_maxsize=DEFAULT_POOL_MAXSIZE,
+                 pool_block=False, tcp_keepalive=True):
+        self.adapter = _KeepAliveAdapter(
+            socket_options=_keepalive_socket_options() if tcp_keepalive else None,
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+        )
+        # Sessions live and die with their thread; the connections all belong to the adapter
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        """The calling thread's Session (created on first use)."""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            # Globally disable proxies to prevent localhost connection issues
+            session.trust_env = False
+            session.mount("http://", self.adapter)
+            session.mount("https://", self.adapter)
+            self._local.session = session
+        return session
+
+    def stats(self):
+        """Connection counters summed over all host pools."""
+        new, requests_made, idle = 0, 0, 0
+        manager = self.adapter.poolmanager
+        with manager.pools.lock:
+            pools = list(manager.pools._container.values())
+        for pool in pools:
+            new += pool.num_connections
+            requests_made += pool.num_requests
+            # The queue is pre-filled with None placeholders; only real connections count
+            idle += sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool else 0
+        return {
+            "pools": len(pools),
+            "requests": requests_made,
+            "new_connections": new,
+            "reused_connections": max(0, requests_made - new),
+            "idle_connections": idle,
+        }
+
+    def close(self):
+        """Close every pooled connection (the sessions of all threads share the adapter)."""
+        self.adapter.close()
@@ -0,0 +1,150 @@
+"""
+Image preprocessing before base64 encoding: cap the longest edge and re-encode.
+
+Pillow is used when installed (`pip install Pillow`): it also applies the EXIF
+orientation and keeps transparency. Otherwise FFmpeg does the scaling. With
+neither available, images are sent unchanged.
+
+ImageWriter stores generated images: bytes are streamed to disk, the real
+format is detected from magic bytes and the file is named by content hash, so
+identical outputs are stored once.
+"""
+import base64
+import hashlib
+import os
+import subprocess
+import uuid
+from pathlib import Path
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+# format -> (file suffix, mime type)
+FORMATS = {
+    "jpeg": (".jpg", "image/jpeg"),
+    "webp": (".webp", "image/webp"),
+    "png": (".png", "image/png"),
+}
+
+
+def _has_alpha(img):
+    return img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info)
+
+
+def choose_format(input_path, preferred="jpeg"):
+    """Output format for input_path: `preferred`, unless that would drop transparency."""
+    if preferred != "jpeg":
+        return preferred
+    if Image is not None:
+        try:
+            with Image.open(input_path) as img:
+                return "png" if _has_alpha(img) else preferred
+        except OSError:
+            return preferred
+    # Without Pillow transparency cannot be checked; keep PNGs lossless
+    return "png" if str(input_path).lower().endswith(".png") else preferred
+
+
+def shrink_image(input_path, output_path, max_edge=1536, quality=85, fmt="jpeg"):
+    """
+    Write input_path to output_path with the longest edge capped at max_edge,
+    encoded as `fmt`. Returns False when no backend (Pillow or FFmpeg) could.
+    """
+    if Image is not None:
+        try:
+            with Image.open(input_path) as img:
+                img = ImageOps.exif_transpose(img)
+                img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+                if fmt == "jpeg" and img.mode != "RGB":
+                    img = img.convert("RGB")
+                options = {"quality": quality} if fmt in ("jpeg", "webp") else {"optimize": True}
+                img.save(output_path, format=fmt.upper(), **options)
+            return True
+        except OSError:
+            pass
+
+    scale = (f"scale='min(iw,{max_edge})':'min(ih,{max_edge})':force_original_aspect_ratio=decrease")
+    if fmt == "jpeg":
+        # FFmpeg's JPEG scale runs 2 (best) .. 31 (worst)
+        codec = ["-q:v", str(max(2, min(31, round(2 + (100 - quality) * 0.3))))]
+    elif fmt == "webp":
+        codec = ["-c:v", "libwebp", "-quality", str(quality)]
+    else:
+        codec = []
+    try:
+        subprocess.run(["ffmpeg", "-y", "-i", str(input_path), "-vf", scale, "-frames:v", "1"] + codec
+                       + [str(output_path)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        return True
+    except (subprocess.SubprocessError, OSError):
+        return False
+
+
+def sniff_format(head):
+    """File extension for image bytes starting with `head`, from magic numbers."""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[4:8] == b"ftyp":
+        brand = head[8:12]
+        if brand in (b"avif", b"avis"):
+            return "avif"
+        if brand in (b"heic", b"heix", b"mif1", b"msf1"):
+            return "heic"
+    if head.startswith(b"BM"):
+        return "bmp"
+    return "bin"
+
+
+class ImageWriter:
+    """Stream image bytes into out_dir; finish() names the file by content hash and format."""
+
+    def __init__(self, out_dir, prefix="antigravity_"):
+        self.out_dir = Path(out_dir)
+        self.prefix = prefix
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self._tmp = self.out_dir / f".{uuid.uuid4().hex}.part"
+        self._file = open(self._tmp, "wb")
+        self._hash = hashlib.sha256()
+        self._head = b""
+        self.size = 0
+
+    def write(self, data):
+        if len(self._head) < 16:
+            self._head += data[:16 - len(self._head)]
+        self._hash.update(data)
+        self._file.write(data)
+        self.size += len(data)
+
+    def write_base64(self, text, start=0, end=None, chunk_chars=1 << 20):
+        """Decode text[start:end] (base64) in chunks, without materialising the whole blob."""
+        end = len(text) if end is None else end
+        step = chunk_chars - chunk_chars % 4
+        for pos in range(start, end, step):
+            piece = text[pos:min(pos + step, end)]
+            if pos + step >= end:
+                piece += "=" * (-len(piece) % 4)  # tolerate stripped padding
+            self.write(base64.b64decode(piece))
+
+    def finish(self):
+        """Returns (path, is_new); is_new is False when identical bytes were already stored."""
+        self._file.close()
+        path = self.out_dir / f"{self.prefix}{self._hash.hexdigest()[:16]}.{sniff_format(self._head)}"
+        if path.exists():
+            os.remove(self._tmp)
+            return path, False
+        os.replace(self._tmp, path)
+        return path, True
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.remove(self._tmp)
+        except OSError:
+            pass
@@ -0,0 +1,268 @@
+"""
+Content-addressed cache for media derivatives (video transcodes, base64 blobs).
+
+Entries are keyed on a fast content hash of the source file, so a renamed or
+copied clip still hits. A JSON index records each entry's size; a hit touches
+the entry's file, so its mtime is the last access time. The total size is kept
+under a byte budget by evicting the least recently used entries. Processes
+sharing the cache (warm worker, batch runs, one-shot scripts) serialize index
+updates with a lock file (on platforms with fcntl).
+"""
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of one process are serialized
+    fcntl = None
+
+from streaming_body import FileMedia
+
+FULL_HASH_LIMIT = 8 * 1024 * 1024
+SAMPLE_COUNT = 32
+SAMPLE_SIZE = 64 * 1024
+DEFAULT_MAX_MB = 4096
+PARTIAL_MAX_AGE = 24 * 3600
+
+
+def cache_root(config=None):
+    """Root directory for all on-disk caches ("cache_dir" in config.json)."""
+    custom = (config or {}).get("cache_dir")
+    if custom:
+        return Path(custom).expanduser()
+    return Path.home() / ".cache" / "antigravity-api-skill"
+
+
+def fast_hash(path):
+    """
+    Hash file content quickly: small files are hashed in full; larger ones by
+    their size plus evenly spaced sample blocks. Returns a hex string.
+    """
+    size = os.path.getsize(path)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(size).encode())
+    with open(path, "rb") as f:
+        if size <= FULL_HASH_LIMIT:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(block)
+        else:
+            step = (size - SAMPLE_SIZE) // (SAMPLE_COUNT - 1)
+            for i in range(SAMPLE_COUNT):
+                f.seek(i * step)
+                h.update(f.read(SAMPLE_SIZE))
+    return h.hexdigest()
+
+
+class MediaCache:
+    def __init__(self, root, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.index_path = self.root / "index.json"
+        self._lock = threading.Lock()
+
+    # --- index ---
+
+    @contextmanager
+    def _locked(self):
+        """Hold the index for a load-modify-save, against other threads and processes."""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            self.root.mkdir(parents=True, exist_ok=True)
+            with open(self.root / "index.lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load(self):
+        try:
+            return json.loads(self.index_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, index):
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.index_path.with_name(f".index-{uuid.uuid4().hex[:8]}.json")
+        tmp.write_text(json.dumps(index, indent=1), encoding="utf-8")
+        os.replace(tmp, self.index_path)
+
+    # --- entries ---
+
+    def get(self, key):
+        """Return the cached file for key (marking it recently used), or None."""
+        entry = self._load().get(key)
+        if not entry:
+            return None
+        path = self.root / entry["file"]
+        try:
+            # The file's mtime is its last use; no index write on a hit
+            os.utime(path)
+            return path
+        except FileNotFoundError:
+            pass
+        except OSError:
+            return path if path.exists() else None
+        with self._locked():
+            index = self._load()
+            if index.pop(key, None):
+                self._save(index)
+        return None
+
+    def reserve(self, key, suffix):
+        """Temporary path inside the cache to write a new entry into before commit()."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        return self.root / f".{key}-{uuid.uuid4().hex[:8]}.partial{suffix}"
+
+    def reserve_dir(self, key):
+        """Temporary directory inside the cache (same filesystem, so its files can be committed by rename)."""
+        path = self.root / f".{key}-{uuid.uuid4().hex[:8]}.partial"
+        path.mkdir(parents=True)
+        return path
+
+    def commit(self, key, tmp_path, suffix, kind=None, source=None):
+        """Move a finished file into the cache under key and enforce the budget."""
+        return self.commit_many([(key, tmp_path, suffix, kind)], source=source)[0]
+
+    def commit_many(self, entries, source=None):
+        """
+        commit() for files that belong together, e.g. the frames of one video plus
+        their manifest: (key, tmp_path, suffix, kind) each, added under one lock.
+        Eviction spares the whole set. Returns the final paths.
+        """
+        finals = []
+        # Under the lock, or a concurrent prune() could delete the files as unindexed
+        with self._locked():
+            index = self._load()
+            now = time.time()
+            for key, tmp_path, suffix, kind in entries:
+                final = self.root / f"{key}{suffix}"
+                os.replace(tmp_path, final)
+                index[key] = {
+                    "file": final.name,
+                    "size": final.stat().st_size,
+                    "kind": kind or suffix.lstrip("."),
+                    "source": source,
+                    "created": now,
+                    "atime": now,
+                }
+                finals.append(final)
+            self._evict(index, self.max_bytes, keep={entry[0] for entry in entries})
+            self._save(index)
+        return finals
+
+    def discard(self, tmp_path):
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+    def encoded_blob(self, path, source_key=None):
+        """
+        Return a cached file holding the base64 encoding of path, creating it
+        (by streaming, in constant memory) on a miss.
+        """
+        key = source_key or fast_hash(path)
+        hit = self.get(key)
+        if hit:
+            return hit
+        tmp = self.reserve(key, ".b64")
+        try:
+            with open(tmp, "wb") as out:
+                for chunk in FileMedia(path, "application/octet-stream").iter_encoded():
+                    out.write(chunk)
+        except Exception:
+            self.discard(tmp)
+            raise
+        return self.commit(key, tmp, ".b64", kind="b64", source=os.path.basename(path))
+
+    # --- housekeeping ---
+
+    def _last_used(self, entry):
+        try:
+            return (self.root / entry["file"]).stat().st_mtime
+        except OSError:
+            return entry["atime"]
+
+    def _evict(self, index, max_bytes, keep=()):
+        removed, freed = 0, 0
+        total = sum(e["size"] for e in index.values())
+        if total <= max_bytes:
+            return removed, freed
+        for key, entry in sorted(index.items(), key=lambda kv: self._last_used(kv[1])):
+            if total <= max_bytes:
+                break
+            if key in keep:
+                continue
+            try:
+                os.remove(self.root / entry["file"])
+            except OSError:
+                pass
+            del index[key]
+            total -= entry["size"]
+            removed += 1
+            freed += entry["size"]
+        if removed:
+            print(f"[*] Media cache evicted {removed} entries ({freed/1024/1024:.1f}MB)", file=sys.stderr)
+        return removed, freed
+
+    def stats(self):
+        index = self._load()
+        kinds = {}
+        for entry in index.values():
+            count, size = kinds.get(entry["kind"], (0, 0))
+            kinds[entry["kind"]] = (count + 1, size + entry["size"])
+        return {
+            "root": str(self.root),
+            "entries": len(index),
+            "bytes": sum(e["size"] for e in index.values()),
+            "max_bytes": self.max_bytes,
+            "kinds": kinds,
+        }
+
+    def prune(self, max_bytes=None):
+        """
+        Evict LRU entries down to max_bytes (default: the configured budget) and
+        remove stale partial files and files missing from the index.
+        Returns (entries_removed, bytes_freed).
+        """
+        with self._locked():
+            index = self._load()
+            removed, freed = 0, 0
+            for key in [k for k, e in index.items() if not (self.root / e["file"]).exists()]:
+                del index[key]
+                removed += 1
+            r, f = self._evict(index, self.max_bytes if max_bytes is None else max_bytes)
+            removed += r
+            freed += f
+            known = {e["file"] for e in index.values()} | {self.index_path.name}
+            if self.root.exists():
+                now = time.time()
+                for p in self.root.iterdir():
+                    if p.is_dir():
+                        # Leftover work directories from reserve_dir()
+                        if ".partial" in p.name and now - p.stat().st_mtime >= PARTIAL_MAX_AGE:
+                            shutil.rmtree(p, ignore_errors=True)
+                            removed += 1
+                        continue
+                    if p.name in known:
+                        continue
+                    if ".partial" in p.name and now - p.stat().st_mtime < PARTIAL_MAX_AGE:
+                        continue
+                    if p.name.startswith(".index-") or p.name == "index.lock":
+                        continue
+                    freed += p.stat().st_size
+                    p.unlink()
+                    removed += 1
+            self._save(index)
+        return removed, freed
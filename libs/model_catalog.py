@@ -0,0 +1,104 @@
+"""
+Cached /models catalog per gateway, used to validate model names before any
+expensive media encoding.
+
+The catalog is stored in cache_root/models.json with the gateway's ETag /
+Last-Modified, so a stale entry is revalidated with a conditional request
+(a 304 costs no body) instead of a full download.
+"""
+import difflib
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+DEFAULT_TTL_MINUTES = 60
+
+
+def model_id(model):
+    return model["id"] if isinstance(model, dict) else str(model)
+
+
+def categorize(models):
+    """Split model ids into chat / image / other by their names."""
+    groups = {"chat": [], "image": [], "other": []}
+    for mid in map(model_id, models):
+        if "image" in mid or "paint" in mid:
+            groups["image"].append(mid)
+        elif "claude" in mid or "gpt" in mid or "gemini" in mid:
+            groups["chat"].append(mid)
+        else:
+            groups["other"].append(mid)
+    return {kind: sorted(ids) for kind, ids in groups.items()}
+
+
+class UnknownModelError(ValueError):
+    pass
+
+
+class ModelCatalog:
+    def __init__(self, path, ttl=DEFAULT_TTL_MINUTES * 60):
+        self.path = Path(path)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            return json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, state):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f".{self.path.stem}-{uuid.uuid4().hex[:8]}.json")
+        tmp.write_text(json.dumps(state, indent=1), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def entry(self, base_url):
+        """The cached entry for base_url ({"models", "fetched", "etag", ...}), or None."""
+        return self._load().get(base_url)
+
+    def is_fresh(self, entry):
+        return entry is not None and time.time() - entry["fetched"] < self.ttl
+
+    def store(self, base_url, models, etag=None, last_modified=None):
+        with self._lock:
+            state = self._load()
+            state[base_url] = {
+                "models": models,
+                "fetched": time.time(),
+                "etag": etag,
+                "last_modified": last_modified,
+            }
+            self._save(state)
+
+    def touch(self, base_url):
+        """Mark the cached entry as revalidated (the gateway answered 304)."""
+        with self._lock:
+            state = self._load()
+            if base_url in state:
+                state[base_url]["fetched"] = time.time()
+                self._save(state)
+
+    @staticmethod
+    def resolve(model, models, aliases=None):
+        """
+        Map a requested name to a model id in `models`: config aliases first,
+        then an exact or case-insensitive match, then a unique prefix match.
+        Raises UnknownModelError (with close matches) otherwise.
+        """
+        model = (aliases or {}).get(model, model)
+        ids = [model_id(m) for m in models]
+        if model in ids:
+            return model
+        lowered = {mid.lower(): mid for mid in ids}
+        if model.lower() in lowered:
+            return lowered[model.lower()]
+        prefixed = [mid for mid in ids if mid.lower().startswith(model.lower())]
+        if len(prefixed) == 1:
+            return prefixed[0]
+        close = difflib.get_close_matches(model, ids, n=3, cutoff=0.5) or prefixed[:3]
+        hint = f"; did you mean {', '.join(close)}?" if close else ""
+        raise UnknownModelError(f"Model '{model}' is not offered by this gateway{hint}")
@@ -0,0 +1,260 @@
+"""
+Client-side rate limiting with priorities.
+
+Every request acquires a token from each of its buckets before it is sent:
+one per model, one per gateway and one per route (model on a gateway).
+Limits are configured in requests per minute:
+
+    "rate_limits": {"model": {"gemini-3-pro": 30, "*": 60}, "gateway": {"*": 120}}
+
+Buckets without a configured rate are unlimited but still honour pauses.
+Waiting requests are served by priority ("interactive" before "normal"
+before "batch"), then first come, first served. A request only waits behind
+higher-priority requests that share one of its buckets. Blocking code calls
+acquire(); asyncio code calls acquire_async(), which waits in the same queue
+without tying up a thread.
+
+Feedback from responses:
+  - a 429/503 with Retry-After pauses the route for that long, so other
+    gateways keep serving the model;
+  - 429/503 halve the configured rate of the model and gateway buckets, and
+    successes restore it step by step (AIMD).
+"""
+import asyncio
+import email.utils
+import itertools
+import threading
+import time
+
+PRIORITIES = {"interactive": 0, "normal": 1, "batch": 2}
+THROTTLE_STATUSES = frozenset({429, 503})
+
+
+def parse_retry_after(value, now=None):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    return max(0.0, when.timestamp() - (now or time.time()))
+
+
+class TokenBucket:
+    """rate tokens per second (None = unlimited), holding at most `burst`; not thread-safe on its own."""
+
+    def __init__(self, rate=None, burst=None):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst or (max(1.0, rate) if rate else 1.0)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now):
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """Seconds until a token is available (0 if one is available now)."""
+        self._refill(now)
+        wait = max(0.0, self.paused_until - now)
+        if self.rate and self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def take(self):
+        if self.rate:
+            self.tokens -= 1
+
+    def pause(self, seconds, now):
+        self.paused_until = max(self.paused_until, now + seconds)
+
+    def throttled(self, floor):
+        """Multiplicative decrease after a 429/503."""
+        if self.max_rate:
+            self.rate = max(self.max_rate * floor, self.rate / 2)
+
+    def succeeded(self, step):
+        """Additive increase after a success, back up to the configured rate."""
+        if self.max_rate and self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * step)
+
+
+class _Ticket:
+    __slots__ = ("rank", "keys")
+
+    def __init__(self, rank, keys):
+        self.rank = rank
+        self.keys = keys
+
+
+class RateLimiter:
+    def __init__(self, limits=None, floor=0.1, step=0.05):
+        # limits: {"model": {name or "*": requests_per_minute}, "gateway": {...}}
+        self.limits = limits or {}
+        self.floor = floor
+        self.step = step
+        self._buckets = {}
+        self._waiting = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._async_waiters = set()  # (event loop, asyncio.Event) of acquire_async callers
+        self._waits = {name: {"count": 0, "total_s": 0.0, "max_s": 0.0} for name in PRIORITIES}
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get("rate_limits"), floor=float(config.get("rate_limit_floor", 0.1)))
+
+    def _bucket(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            kind, name = key[0], key[1]
+            per_kind = self.limits.get(kind, {}) if kind in ("model", "gateway") else {}
+            rpm = per_kind.get(name, per_kind.get("*"))
+            bucket = self._buckets[key] = TokenBucket(float(rpm) / 60 if rpm else None)
+        return bucket
+
+    @staticmethod
+    def keys(model, gateway):
+        return (("model", model), ("gateway", gateway), ("route", f"{model}@{gateway}"))
+
+    def _ticket(self, keys, priority):
+        if priority not in PRIORITIES:
+            raise ValueError(f"priority must be one of {tuple(PRIORITIES)}, got {priority!r}")
+        return _Ticket((PRIORITIES[priority], next(self._seq)), frozenset(keys))
+
+    def _poll(self, ticket, now):
+        """
+        Take the tokens for ticket if it may go now and return 0; otherwise return
+        the seconds until its buckets refill (None while a higher-priority request
+        sharing a bucket is waiting). Called with the lock held.
+        """
+        if any(other.rank < ticket.rank and other.keys & ticket.keys for other in self._waiting):
+            return None
+        wait = max(self._bucket(key).wait_time(now) for key in ticket.keys)
+        if wait > 0:
+            return wait
+        for key in ticket.keys:
+            self._bucket(key).take()
+        return 0.0
+
+    @staticmethod
+    def _next_wait(wait, started, timeout, now):
+        """How long to sleep before polling again; raises TimeoutError past the deadline."""
+        if timeout is not None:
+            left = started + timeout - now
+            if left <= 0:
+                raise TimeoutError(f"rate limiter: no slot within {timeout:g}s")
+            wait = left if wait is None else min(wait, left)
+        # Re-check at least every second: pauses and rates change under us
+        return min(wait, 1.0) if wait is not None else 1.0
+
+    def _notify(self):
+        """Wake every waiter, blocking and asyncio alike. Called with the lock held."""
+        self._cond.notify_all()
+        for loop, event in list(self._async_waiters):
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:  # the waiter's loop is closed
+                self._async_waiters.discard((loop, event))
+
+    def _done(self, ticket, priority, started):
+        self._waiting.remove(ticket)
+        self._notify()
+        waited = time.monotonic() - started
+        stats = self._waits[priority]
+        stats["count"] += 1
+        stats["total_s"] += waited
+        stats["max_s"] = max(stats["max_s"], waited)
+        return waited
+
+    def acquire(self, keys, priority="interactive", timeout=None):
+        """
+        Block until every bucket in `keys` has a token and no higher-priority
+        request is waiting on a shared bucket. Returns the seconds waited.
+        Raises TimeoutError if `timeout` seconds pass first.
+        """
+        ticket = self._ticket(keys, priority)
+        started = time.monotonic()
+        with self._cond:
+            self._waiting.append(ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = self._poll(ticket, now)
+                    if wait == 0:
+                        break
+                    self._cond.wait(self._next_wait(wait, started, timeout, now))
+            finally:
+                waited = self._done(ticket, priority, started)
+        return waited
+
+    async def acquire_async(self, keys, priority="interactive", timeout=None):
+        """
+        acquire() for asyncio code: waits on the event loop instead of blocking a
+        thread, in the same queue as blocking callers.
+        """
+        ticket = self._ticket(keys, priority)
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        started = time.monotonic()
+        with self._cond:
+            self._waiting.append(ticket)
+            self._async_waiters.add(waiter)
+        try:
+            while True:
+                with self._cond:
+                    waiter[1].clear()
+                    now = time.monotonic()
+                    wait = self._poll(ticket, now)
+                if wait == 0:
+                    break
+                delay = self._next_wait(wait, started, timeout, now)
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._cond:
+                self._async_waiters.discard(waiter)
+                waited = self._done(ticket, priority, started)
+        return waited
+
+    def observe(self, keys, status, retry_after=None):
+        """Feed back the outcome of a request sent with `keys` (status None = connection error)."""
+        with self._cond:
+            now = time.monotonic()
+            buckets = [(key, self._bucket(key)) for key in keys]
+            if status in THROTTLE_STATUSES:
+                for key, bucket in buckets:
+                    if key[0] == "route" and retry_after:
+                        bucket.pause(retry_after, now)
+                    else:
+                        bucket.throttled(self.floor)
+            elif status is not None and status < 500:
+                for _, bucket in buckets:
+                    bucket.succeeded(self.step)
+            self._notify()
+
+    def stats(self):
+        with self._cond:
+            now = time.monotonic()
+            depth = {name: 0 for name in PRIORITIES}
+            by_rank = {rank: name for name, rank in PRIORITIES.items()}
+            for ticket in self._waiting:
+                depth[by_rank[ticket.rank[0]]] += 1
+            waits = {name: dict(s, mean_s=s["total_s"] / s["count"] if s["count"] else 0.0)
+                     for name, s in self._waits.items()}
+            buckets = {
+                "/".join(key): {"rpm": round(b.rate * 60, 2) if b.rate else None,
+                                "paused_s": round(max(0.0, b.paused_until - now), 2)}
+                for key, b in self._buckets.items() if b.rate or b.paused_until > now
+            }
+            return {"queue_depth": depth, "waits": waits, "buckets": buckets}
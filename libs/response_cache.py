@@ -0,0 +1,208 @@
+"""
+Opt-in on-disk cache of chat completion streams (SQLite).
+
+Entries are keyed on model, messages, temperature and the content hashes of the
+attached files, and hold the raw SSE body as received. A hit is returned as a
+CachedResponse that replays that body event by event through iter_content(),
+so sse.ChatStream and the scripts consume it exactly like a live response.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from sse import DONE
+
+DEFAULT_TTL_HOURS = 24 * 7
+DEFAULT_MAX_MB = 256
+
+
+class CachedResponse:
+    """Stand-in for a streaming requests.Response, replaying a stored SSE body."""
+
+    status_code = 200
+    from_cache = True
+
+    def __init__(self, body):
+        self._body = body
+        self.headers = {"Content-Type": "text/event-stream"}
+        self.started_at = time.time()
+
+    @property
+    def content(self):
+        return self._body
+
+    @property
+    def text(self):
+        return self._body.decode("utf-8", errors="replace")
+
+    def iter_content(self, chunk_size=None, decode_unicode=False):
+        # One SSE event per chunk, as a live stream would deliver them
+        for event in self._body.split(b"\n\n"):
+            if event:
+                yield event + b"\n\n"
+
+    def iter_lines(self, chunk_size=None, decode_unicode=False):
+        yield from self._body.splitlines()
+
+    def close(self):
+        pass
+
+
+class _CompletionScanner:
+    """
+    Watches raw SSE bytes for the line that ends a stream (exactly `data: [DONE]`)
+    and for error events (`event: error`, or a `data:` payload with a top-level
+    "error"). Only line starts are inspected, so long inline-media lines cost no copies.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._scanned = 0  # bytes of the buffered partial line already searched for "\n"
+        self.done = False
+        self.failed = False
+
+    def feed(self, chunk):
+        buf = self._buffer
+        buf += chunk
+        start = 0
+        while not self.done:
+            nl = buf.find(b"\n", max(start, self._scanned))
+            if nl < 0:
+                break
+            head = bytes(buf[start:min(nl, start + 32)]).strip()
+            if head.startswith(b"data:"):
+                value = head[5:].strip()
+                if value == DONE and nl - start < 32:
+                    self.done = True
+                elif value.startswith(b"{") and value[1:].lstrip().startswith(b'"error"'):
+                    self.failed = True
+            elif head.startswith(b"event:") and head[6:].strip() == b"error":
+                self.failed = True
+            start = nl + 1
+        del buf[:start]
+        self._scanned = len(buf)
+
+
+class _RecordingResponse:
+    """Wraps a live streaming response and stores its body once fully read."""
+
+    def __init__(self, response, on_complete):
+        self._response = response
+        self._on_complete = on_complete
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def iter_content(self, chunk_size=None, decode_unicode=False):
+        parts = []
+        scanner = _CompletionScanner()
+        for chunk in self._response.iter_content(chunk_size=chunk_size):
+            parts.append(chunk)
+            if not scanner.done:
+                scanner.feed(chunk)
+                # Only a stream that ran to completion without an error is worth replaying.
+                # Consumers stop reading at [DONE], so store before handing that chunk over
+                if scanner.done and not scanner.failed:
+                    self._on_complete(b"".join(parts))
+            yield chunk
+
+
+class ResponseCache:
+    def __init__(self, path, ttl=DEFAULT_TTL_HOURS * 3600, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._ready = False
+
+    def _connect(self):
+        if not self._ready:
+            # SQLite creates the file but not its directory (a fresh cache root)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=30)
+        if not self._ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, model TEXT, body BLOB, "
+                         "size INTEGER, created REAL, accessed REAL)")
+            self._ready = True
+        return conn
+
+    @staticmethod
+    def key(model, messages, temperature, media_hashes=(), **options):
+        """Stable key for a request; media is identified by content hash, not path."""
+        blob = json.dumps({
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "media": list(media_hashes),
+            "options": options,
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """The stored SSE body for key, or None if missing or expired."""
+        with self._lock:
+            conn = self._connect()
+            try:
+                row = conn.execute("SELECT body, created FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                if time.time() - row[1] > self.ttl:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    conn.commit()
+                    return None
+                conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+                conn.commit()
+                return bytes(row[0])
+            finally:
+                conn.close()
+
+    def put(self, key, model, body):
+        with self._lock:
+            conn = self._connect()
+            try:
+                now = time.time()
+                conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                             (key, model, body, len(body), now, now))
+                self._evict(conn, self.max_bytes)
+                conn.commit()
+            finally:
+                conn.close()
+
+    def recording(self, response, key, model):
+        """Wrap a live 200 response so its body is stored once it has been read to the end."""
+        return _RecordingResponse(response, lambda body: self.put(key, model, body))
+
+    def _evict(self, conn, max_bytes):
+        removed = conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,)).rowcount
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total > max_bytes:
+            for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+                if total <= max_bytes:
+                    break
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                total -= size
+                removed += 1
+        return removed
+
+    def prune(self, max_bytes=None):
+        """Drop expired entries, then LRU entries down to max_bytes. Returns entries removed."""
+        with self._lock:
+            conn = self._connect()
+            try:
+                removed = self._evict(conn, self.max_bytes if max_bytes is None else max_bytes)
+                conn.commit()
+                return removed
+            finally:
+                conn.close()
+
+    def stats(self):
+        with self._lock:
+            conn = self._connect()
+            try:
+                count, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            finally:
+                conn.close()
+        return {"path": str(self.path), "entries": count, "bytes": size, "max_bytes": self.max_bytes}
@@ -0,0 +1,211 @@
+"""
+Multi-turn chat sessions persisted on disk.
+
+A session keeps the conversation as plain text turns plus references to
+uploaded media, never base64. Attachments are uploaded once with upload_file
+and every later turn points at their file_uri, so turn N sends about as many
+bytes as turn 1:
+
+    session = ChatSession(client, "trip-video")
+    response = session.ask("这段视频里有什么?", ["clip.mp4"])
+    stream = ChatStream(response)
+    for text in stream: ...
+    session.add_reply(stream.text)
+
+History lives in cache_root/sessions/<name>.json. Before each request the
+oldest turns are dropped until the estimated prompt fits the token budget
+(config "session_token_budget"); media of dropped turns stays referenced.
+"""
+import json
+import os
+import re
+import sys
+import time
+import uuid
+from pathlib import Path
+
+from media_cache import cache_root
+
+DEFAULT_TOKEN_BUDGET = 32000
+DEFAULT_MEDIA_TOKENS = 1000  # rough prompt cost of one referenced attachment
+
+
+def estimate_tokens(text):
+    """Rough token count: ~4 ASCII characters per token, one token per other character (CJK)."""
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return ascii_chars // 4 + (len(text) - ascii_chars) + 1
+
+
+class ChatSession:
+    def __init__(self, client, name, model=None, token_budget=None, path=None):
+        self.client = client
+        self.name = name
+        safe_name = re.sub(r"[^\w.-]", "_", name) or "default"
+        self.path = Path(path) if path else cache_root(client.config) / "sessions" / f"{safe_name}.json"
+        self.token_budget = int(token_budget or client.config.get("session_token_budget", DEFAULT_TOKEN_BUDGET))
+        self.media_tokens = int(client.config.get("session_media_tokens", DEFAULT_MEDIA_TOKENS))
+        self.state = self._load()
+        if model:
+            self.state["model"] = model
+        self._pending = None
+
+    def _load(self):
+        try:
+            state = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            state = {}
+        state.setdefault("name", self.name)
+        state.setdefault("model", None)
+        state.setdefault("created", time.time())
+        state.setdefault("turns", [])
+        return state
+
+    def _save(self):
+        self.state["updated"] = time.time()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f".{self.path.stem}-{uuid.uuid4().hex[:8]}.json")
+        tmp.write_text(json.dumps(self.state, ensure_ascii=False, indent=1), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    @property
+    def model(self):
+        return self.state["model"]
+
+    @property
+    def turns(self):
+        return self.state["turns"]
+
+    def reset(self):
+        """Forget the conversation (the session file is removed)."""
+        self.state = {"name": self.name, "model": self.state["model"], "created": time.time(), "turns": []}
+        self._pending = None
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+    # --- media ---
+
+    def _upload(self, path):
+        """Upload one attachment (after the usual video/image optimization); returns a media ref or None."""
+        try:
+            working_path, mime_type = self.client._prepare_media(path)
+        except Exception as e:
+            print(f"[-] Failed to process {path}: {e}", file=sys.stderr)
+            return None
+        uploaded = self.client.upload_file(working_path)
+        if not uploaded:
+            return None
+        return {
+            "name": os.path.basename(path),
+            "path": os.path.abspath(path),
+            "hash": self.client._hash(working_path),
+            "uri": uploaded["uri"],
+            "mime_type": uploaded.get("mime_type") or mime_type,
+        }
+
+    def _refresh(self, ref):
+        """Make sure ref still has a live file_uri, re-uploading expired ones; False if it is gone."""
+        if not ref.get("uri"):
+            return False
+        if self.client.upload_cache.file_uri(self.client.base_url, ref["hash"]):
+            return True
+        if not os.path.exists(ref["path"]):
+            print(f"[!] Session attachment {ref['name']} expired and its file is gone; dropping it", file=sys.stderr)
+            ref["uri"] = None
+            return False
+        fresh = self._upload(ref["path"])
+        if not fresh:
+            return False
+        ref.update(fresh)
+        return True
+
+    def _media_part(self, ref):
+        if self.client.config.get("session_uri_part", "image_url") == "file":
+            return {"type": "file", "file": {"file_id": ref["uri"], "mime_type": ref["mime_type"]}}
+        return {"type": "image_url", "image_url": {"url": ref["uri"]}}
+
+    # --- history ---
+
+    def _cost(self, turn):
+        return estimate_tokens(turn["text"]) + self.media_tokens * sum(1 for ref in turn["media"] if ref.get("uri"))
+
+    def _window(self, turns):
+        """
+        The newest turns that fit the token budget (the last one always stays),
+        starting with a user turn. Media of dropped turns moves to the first kept
+        turn: a URI reference is cheap, and follow-up questions often need it.
+        """
+        kept = []
+        total = 0
+        for turn in reversed(turns):
+            total += self._cost(turn)
+            if kept and total > self.token_budget:
+                break
+            kept.insert(0, turn)
+        while len(kept) > 1 and kept[0]["role"] != "user":
+            kept.pop(0)
+        dropped = turns[:len(turns) - len(kept)]
+        if dropped:
+            print(f"[*] Session {self.name}: {len(dropped)} older turn(s) left out to fit "
+                  f"~{self.token_budget} tokens", file=sys.stderr)
+            carried = [ref for turn in dropped for ref in turn["media"] if ref.get("uri")]
+            if carried:
+                first = dict(kept[0], media=carried + kept[0]["media"])
+                kept = [first] + kept[1:]
+        return kept
+
+    def messages(self, turns=None):
+        """Chat messages for the history (plus turns), trimmed to the token budget."""
+        messages = []
+        for turn in self._window(self.turns + (turns or [])):
+            refs = [ref for ref in turn["media"] if self._refresh(ref)]
+            if refs:
+                content = [{"type": "text", "text": turn["text"]}] + [self._media_part(ref) for ref in refs]
+            else:
+                content = turn["text"]
+            messages.append({"role": turn["role"], "content": content})
+        return messages
+
+    def ask(self, prompt, file_paths=None, model=None, **kwargs):
+        """
+        Send prompt with the session history; returns the chat_completion response.
+        New attachments are uploaded and referenced by file_uri. One that cannot be
+        uploaded is sent inline for this turn only; later turns just mention its name.
+        Call add_reply() with the assistant's text to keep the exchange.
+        """
+        refs = []
+        inline = []
+        for path in file_paths or []:
+            if not os.path.exists(path):
+                continue
+            ref = self._upload(path)
+            if ref:
+                refs.append(ref)
+            else:
+                print(f"[!] {os.path.basename(path)} could not be uploaded; sending it inline for this turn only",
+                      file=sys.stderr)
+                inline.append(path)
+                refs.append({"name": os.path.basename(path), "path": os.path.abspath(path), "uri": None})
+
+        self._pending = {"role": "user", "text": prompt, "media": refs, "time": time.time()}
+        messages = self.messages([self._pending])
+        if inline:
+            # Stored history only mentions what was sent inline
+            self._pending = dict(self._pending, text=prompt + "\n" + "".join(
+                f"[附件: {os.path.basename(path)}]" for path in inline))
+
+        # File URIs belong to the gateway they were uploaded to
+        gateway = self.client.gateways.primary if any(
+            isinstance(message["content"], list) for message in messages) else None
+        return self.client.chat_completion(messages, model=model or self.state["model"],
+                                           file_paths=inline or None, gateway=gateway, **kwargs)
+
+    def add_reply(self, text):
+        """Store the pending user turn and the assistant's reply."""
+        if self._pending is None:
+            raise RuntimeError("add_reply() without a preceding ask()")
+        self.turns.append(self._pending)
+        self.turns.append({"role": "assistant", "text": text, "media": [], "time": time.time()})
+        self._pending = None
+        self._save()
@@ -0,0 +1,149 @@
+"""
+Incremental SSE parsing for streaming chat completions.
+
+SSEDecoder works on raw byte chunks as they arrive from the socket and yields
+the payload of each `data:` line. ChatStream wraps the response returned by
+AntigravityClient.chat_completion. Iterating it yields the text deltas. Along
+the way it records finish_reason, usage, time-to-first-token and inter-token
+latency, and it accumulates the full answer in a list instead of by repeated
+string concatenation.
+
+If the response carries a telemetry record (AntigravityClient.chat_completion
+attaches one), ChatStream finishes it when the stream ends, adding ttft,
+stream time and response bytes.
+"""
+import json
+import time
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+DONE = b"[DONE]"
+
+
+class SSEDecoder:
+    """Sans-IO decoder: feed() raw bytes, get back complete `data:` payloads."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, chunk):
+        self._buffer += chunk
+        buf = self._buffer
+        start = 0
+        payloads = []
+        while True:
+            nl = buf.find(b"\n", start)
+            if nl < 0:
+                break
+            if buf.startswith(b"data:", start):
+                payloads.append(bytes(buf[start + 5:nl]).strip())
+            start = nl + 1
+        del buf[:start]
+        return payloads
+
+    def flush(self):
+        """Payload of a final line that was not newline-terminated, if any."""
+        rest, self._buffer = bytes(self._buffer), bytearray()
+        if rest.startswith(b"data:"):
+            return [rest[5:].strip()]
+        return []
+
+
+class ChatStream:
+    """
+    Iterate the text deltas of a streaming chat response.
+
+    After (or during) iteration: .text, .finish_reason, .usage, .ttft (seconds
+    from request start to first token) and .stats().
+    """
+
+    def __init__(self, response, started=None):
+        self.response = response
+        self.started = started or getattr(response, "started_at", None) or time.time()
+        self.finish_reason = None
+        self.usage = None
+        self.ttft = None
+        self.done = False
+        self._parts = []
+        self._token_times = []
+        self.received_bytes = 0
+
+    @property
+    def text(self):
+        return "".join(self._parts)
+
+    def _payloads(self):
+        decoder = SSEDecoder()
+        for chunk in self.response.iter_content(chunk_size=None):
+            self.received_bytes += len(chunk)
+            yield from decoder.feed(chunk)
+        yield from decoder.flush()
+
+    def events(self):
+        """Yield each parsed JSON chunk of the stream until [DONE]."""
+        try:
+            for payload in self._payloads():
+                if payload == DONE:
+                    break
+                try:
+                    event = _loads(payload)
+                except ValueError:
+                    continue
+                if not isinstance(event, dict):
+                    continue
+                if event.get("usage"):
+                    self.usage = event["usage"]
+                choice = (event.get("choices") or [{}])[0]
+                if choice.get("finish_reason"):
+                    self.finish_reason = choice["finish_reason"]
+                yield event
+            self.done = True
+        finally:
+            self.response.close()
+            self._finish_telemetry()
+
+    def _finish_telemetry(self):
+        record = getattr(self.response, "telemetry", None)
+        if record is None or record.finished:
+            return
+        if self._token_times:
+            record.add_span("ttft", self._token_times[0] - self.started)
+        record.add_span("stream", time.time() - self.started)
+        record.add_bytes("response", self.received_bytes)
+        usage = self.usage or {}
+        record.finish(status="ok" if self.done else "incomplete", finish_reason=self.finish_reason,
+                      completion_tokens=usage.get("completion_tokens"))
+
+    def __iter__(self):
+        for event in self.events():
+            content = (event.get("choices") or [{}])[0].get("delta", {}).get("content")
+            if content:
+                now = time.time()
+                if self.ttft is None:
+                    self.ttft = now - self.started
+                self._token_times.append(now)
+                self._parts.append(content)
+                yield content
+
+    def read(self):
+        """Consume the whole stream and return the full text."""
+        for _ in self:
+            pass
+        return self.text
+
+    def stats(self):
+        gaps = [b - a for a, b in zip(self._token_times, self._token_times[1:])]
+        end = self._token_times[-1] if self._token_times else time.time()
+        return {
+            "ttft_s": self.ttft,
+            "itl_mean_s": sum(gaps) / len(gaps) if gaps else None,
+            "itl_max_s": max(gaps) if gaps else None,
+            "chunks": len(self._parts),
+            "total_s": end - self.started,
+            "finish_reason": self.finish_reason,
+            "usage": self.usage,
+        }
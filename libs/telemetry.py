@@ -0,0 +1,240 @@
+"""
+Per-request performance telemetry for AntigravityClient.
+
+A request record collects named spans (seconds, summed if a span repeats),
+byte counts and attributes while the call runs. When the request finishes,
+the record is passed to every hook:
+
+    client.telemetry.add_hook(lambda record: ship(record))
+
+Built-in sinks are enabled from config: "telemetry_jsonl" (append one JSON line
+per record) and "telemetry_prometheus" (a node_exporter textfile with
+cumulative counters). Spans started outside any request are emitted as a
+record of their own.
+
+Chat requests stay open until the stream has been read: sse.ChatStream (or
+AsyncChatResponse) adds the ttft/stream spans and finishes the record attached
+to the response. ttfb, ttft and stream are all measured from the moment the
+request is sent.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+
+class RequestRecord:
+    def __init__(self, telemetry, kind, **attrs):
+        self._telemetry = telemetry
+        self.kind = kind
+        self.id = uuid.uuid4().hex[:12]
+        self.started = time.time()
+        self.attrs = dict(attrs)
+        self.spans = {}
+        self.bytes = {}
+        self.finished = False
+
+    def add_span(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def add_bytes(self, name, count):
+        self.bytes[name] = self.bytes.get(name, 0) + int(count)
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def finish(self, **attrs):
+        """Close the record and deliver it to the hooks (only the first call counts)."""
+        if self.finished:
+            return
+        self.finished = True
+        self.attrs.update(attrs)
+        self.attrs.setdefault("status", "ok")
+        self._telemetry.emit(self)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "ts": round(self.started, 3),
+            "total_s": round(time.time() - self.started, 6),
+            "spans": {name: round(seconds, 6) for name, seconds in self.spans.items()},
+            "bytes": dict(self.bytes),
+            **self.attrs,
+        }
+
+
+class JsonlSink:
+    def __init__(self, path):
+        self.path = Path(path).expanduser()
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+
+class PrometheusTextfile:
+    """
+    Cumulative counters in the Prometheus text format, for node_exporter's
+    textfile collector. Totals are kept in a JSON sidecar so they keep growing
+    across short-lived processes.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path).expanduser()
+        self.state_path = self.path.with_name(self.path.name + ".state.json")
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            return json.loads(self.state_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {"requests": {}, "span_sum": {}, "span_count": {}, "bytes": {}}
+
+    @staticmethod
+    def _bump(table, key, value):
+        table[key] = table.get(key, 0) + value
+
+    def __call__(self, record):
+        kind = record["kind"]
+        with self._lock:
+            state = self._load()
+            self._bump(state["requests"], f"{kind}|{record.get('status', '')}", 1)
+            for name, seconds in record["spans"].items():
+                self._bump(state["span_sum"], f"{kind}|{name}", seconds)
+                self._bump(state["span_count"], f"{kind}|{name}", 1)
+            for name, count in record["bytes"].items():
+                self._bump(state["bytes"], f"{kind}|{name}", count)
+            self._write(state)
+
+    def _write(self, state):
+        lines = [
+            "# HELP antigravity_requests_total Client requests by kind and status.",
+            "# TYPE antigravity_requests_total counter",
+        ]
+        for key, value in sorted(state["requests"].items()):
+            kind, status = key.split("|", 1)
+            lines.append(f'antigravity_requests_total{{kind="{kind}",status="{status}"}} {value}')
+        lines += [
+            "# HELP antigravity_span_seconds Time spent per request phase.",
+            "# TYPE antigravity_span_seconds summary",
+        ]
+        for key, value in sorted(state["span_sum"].items()):
+            kind, span = key.split("|", 1)
+            labels = f'kind="{kind}",span="{span}"'
+            lines.append(f"antigravity_span_seconds_sum{{{labels}}} {value:.6f}")
+            lines.append(f"antigravity_span_seconds_count{{{labels}}} {state['span_count'][key]}")
+        lines += [
+            "# HELP antigravity_bytes_total Bytes processed per request phase.",
+            "# TYPE antigravity_bytes_total counter",
+        ]
+        for key, value in sorted(state["bytes"].items()):
+            kind, name = key.split("|", 1)
+            lines.append(f'antigravity_bytes_total{{kind="{kind}",name="{name}"}} {value}')
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        for target, text in ((self.state_path, json.dumps(state)), (self.path, "\n".join(lines) + "\n")):
+            tmp = target.with_name(f".{target.name}-{uuid.uuid4().hex[:8]}")
+            tmp.write_text(text, encoding="utf-8")
+            os.replace(tmp, target)
+
+
+class Telemetry:
+    def __init__(self, jsonl_path=None, prometheus_path=None):
+        self.hooks = []
+        if jsonl_path:
+            self.hooks.append(JsonlSink(jsonl_path))
+        if prometheus_path:
+            self.hooks.append(PrometheusTextfile(prometheus_path))
+        self._local = threading.local()
+
+    def add_hook(self, hook):
+        """hook(record_dict) is called for every finished record."""
+        self.hooks.append(hook)
+        return hook
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    @property
+    def current(self):
+        """The request record open on this thread, or None."""
+        return getattr(self._local, "record", None)
+
+    def record(self, kind, **attrs):
+        """A new open record that is not current on any thread (see attach)."""
+        return RequestRecord(self, kind, **attrs)
+
+    def start(self, kind, **attrs):
+        """Open a record and make it current on this thread. The caller must finish() it."""
+        record = self.record(kind, **attrs)
+        self.attach(record)
+        return record
+
+    def attach(self, record):
+        """
+        Collect this thread's spans into record, e.g. in a worker thread doing
+        part of a request. Returns the record that was current before, to hand
+        back to detach() so nested calls restore the outer one.
+        """
+        previous = self.current
+        self._local.record = record
+        return previous
+
+    def detach(self, previous=None):
+        """Stop collecting into the current record without finishing it (e.g. it now belongs to a stream)."""
+        self._local.record = previous
+
+    @contextmanager
+    def request(self, kind, **attrs):
+        record = self.record(kind, **attrs)
+        outer = self.attach(record)
+        try:
+            yield record
+        except BaseException as e:
+            record.set(status="error", error=f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            self._local.record = outer
+            record.finish()
+
+    @contextmanager
+    def span(self, name):
+        """Time a block into the current record, or into a record of its own if there is none."""
+        started = time.perf_counter()
+        record = self.current
+        try:
+            yield
+        finally:
+            self.add_span(name, time.perf_counter() - started, record)
+
+    def add_span(self, name, seconds, record=None):
+        record = record or self.current
+        if record is not None:
+            record.add_span(name, seconds)
+        else:
+            standalone = self.record(name)
+            standalone.add_span(name, seconds)
+            standalone.finish()
+
+    def add_bytes(self, name, count):
+        if self.current is not None:
+            self.current.add_bytes(name, count)
+
+    def emit(self, record):
+        if not self.hooks:
+            return
+        data = record.to_dict()
+        for hook in list(self.hooks):
+            try:
+                hook(data)
+            except Exception as e:
+                print(f"[-] Telemetry hook failed: {e}", file=sys.stderr)
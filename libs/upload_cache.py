@@ -0,0 +1,85 @@
+"""
+Persistent memory for upload_file: which endpoint/mode pair works on each
+gateway, and which file (by content hash) already has a valid file_uri there.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+DEFAULT_URI_TTL_HOURS = 47  # Gemini file URIs expire after 48h
+
+
+class UploadCache:
+    def __init__(self, path, uri_ttl=DEFAULT_URI_TTL_HOURS * 3600):
+        self.path = Path(path)
+        self.uri_ttl = uri_ttl
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            state = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            state = {}
+        state.setdefault("endpoints", {})
+        state.setdefault("files", {})
+        return state
+
+    def _save(self, state):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f".{self.path.stem}-{uuid.uuid4().hex[:8]}.json")
+        tmp.write_text(json.dumps(state, indent=1), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    # --- endpoint discovery ---
+
+    def endpoint(self, base_url):
+        """Return (url, mode) known to work for base_url, or None."""
+        entry = self._load()["endpoints"].get(base_url)
+        return (entry["url"], entry["mode"]) if entry else None
+
+    def remember_endpoint(self, base_url, url, mode):
+        with self._lock:
+            state = self._load()
+            state["endpoints"][base_url] = {"url": url, "mode": mode, "checked": time.time()}
+            self._save(state)
+
+    def forget_endpoint(self, base_url):
+        with self._lock:
+            state = self._load()
+            if state["endpoints"].pop(base_url, None):
+                self._save(state)
+
+    # --- uploaded files ---
+
+    @staticmethod
+    def _file_key(base_url, content_hash):
+        return f"{base_url}|{content_hash}"
+
+    def file_uri(self, base_url, content_hash):
+        """Return the cached upload result for this content, if it has not expired."""
+        entry = self._load()["files"].get(self._file_key(base_url, content_hash))
+        if entry and time.time() - entry["uploaded"] < self.uri_ttl:
+            return {"uri": entry["uri"], "mime_type": entry["mime_type"]}
+        return None
+
+    def remember_file(self, base_url, content_hash, uri, mime_type):
+        with self._lock:
+            state = self._load()
+            now = time.time()
+            # Drop expired entries while we are here so the file stays small
+            state["files"] = {
+                k: v for k, v in state["files"].items() if now - v["uploaded"] < self.uri_ttl
+            }
+            state["files"][self._file_key(base_url, content_hash)] = {
+                "uri": uri, "mime_type": mime_type, "uploaded": now,
+            }
+            self._save(state)
+
+    def forget_file(self, base_url, content_hash):
+        with self._lock:
+            state = self._load()
+            if state["files"].pop(self._file_key(base_url, content_hash), None):
+                self._save(state)
@@ -0,0 +1,353 @@
+"""
+FFmpeg helpers for _optimize_video / _fit_video.
+
+- available_encoders(): which H.264 encoders actually work on this host. A
+  trial encode is needed because ffmpeg lists h264_nvenc even without a GPU.
+  The result is cached on disk per ffmpeg build, so a GPU-less host does not
+  launch a doomed NVENC run on every cache miss.
+- transcode_segmented(): splits a long input on keyframes (stream copy),
+  transcodes the segments in parallel FFmpeg processes across all cores, and
+  joins them with the concat demuxer without re-encoding.
+- plan_for_budget(): turns a payload budget into bitrates plus the largest
+  resolution/fps that bitrate can feed, so short clips keep detail and long
+  ones degrade gracefully instead of all being squeezed to 360p.
+- split_windows(): cuts a video into analysis windows (optionally moved onto
+  scene cuts) and reports the real start offset of each window.
+- sample_frames(): representative JPEG frames (scene changes plus a minimum
+  rate), with a 64-bit difference hash per frame for near-duplicate removal.
+- extract_audio(): the audio track alone, as low-bitrate mono speech audio.
+"""
+import csv
+import functools
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ENCODER_CACHE_TTL = 7 * 24 * 3600
+
+# Preferred order; each entry is (encoder, video args)
+H264_ENCODERS = [
+    ("h264_nvenc", ["-c:v", "h264_nvenc", "-preset", "fast", "-cq", "38"]),
+    ("libx264", ["-c:v", "libx264", "-crf", "35", "-preset", "ultrafast"]),
+]
+
+
+def _run(cmd, **kwargs):
+    return subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True, **kwargs)
+
+
+@functools.lru_cache(maxsize=None)
+def ffmpeg_version():
+    """First line of `ffmpeg -version`, read once per process."""
+    out = subprocess.run(["ffmpeg", "-hide_banner", "-version"], capture_output=True, text=True, check=True)
+    return out.stdout.splitlines()[0] if out.stdout else "unknown"
+
+
+def vfr_args():
+    """
+    Output option for variable frame rate: -fps_mode needs FFmpeg 5.1+, older
+    builds (e.g. 4.4 on Ubuntu 22.04) only know -vsync. Git builds report no
+    release number and are new.
+    """
+    try:
+        match = re.match(r"ffmpeg version n?(\d+)\.(\d+)", ffmpeg_version())
+    except (subprocess.SubprocessError, OSError):
+        match = None
+    if match and (int(match.group(1)), int(match.group(2))) < (5, 1):
+        return ["-vsync", "vfr"]
+    return ["-fps_mode", "vfr"]
+
+
+def _trial_encode(encoder):
+    try:
+        _run(["ffmpeg", "-hide_banner", "-f", "lavfi", "-i", "color=c=black:s=256x256:d=0.2",
+              "-frames:v", "2", "-c:v", encoder, "-f", "null", "-"], timeout=30)
+        return True
+    except (subprocess.SubprocessError, OSError):
+        return False
+
+
+@functools.lru_cache(maxsize=None)
+def available_encoders(cache_path=None):
+    """
+    Names of the H.264 encoders from H264_ENCODERS that work here, in preference
+    order. The result is memoized per process (a long-running worker checks
+    once) and cached in cache_path (JSON), keyed on the ffmpeg version.
+    Returns [] if ffmpeg is not installed.
+    """
+    try:
+        version = ffmpeg_version()
+    except (subprocess.SubprocessError, OSError):
+        return []
+
+    cache = {}
+    if cache_path:
+        try:
+            cache = json.loads(Path(cache_path).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            cache = {}
+        entry = cache.get(version)
+        if entry and time.time() - entry["checked"] < ENCODER_CACHE_TTL:
+            return entry["encoders"]
+
+    print("[*] 正在检测可用的视频编码器...", file=sys.stderr)
+    working = [name for name, _ in H264_ENCODERS if _trial_encode(name)]
+    if cache_path:
+        cache[version] = {"encoders": working, "checked": time.time()}
+        try:
+            Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+            Path(cache_path).write_text(json.dumps(cache, indent=1), encoding="utf-8")
+        except OSError:
+            pass
+    return working
+
+
+def encoder_args(name):
+    return dict(H264_ENCODERS)[name]
+
+
+def probe_duration(path):
+    """Duration in seconds via ffprobe, or None if it cannot be read."""
+    try:
+        out = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "json", str(path)],
+            capture_output=True, text=True, check=True, timeout=60)
+        return float(json.loads(out.stdout)["format"]["duration"])
+    except (subprocess.SubprocessError, OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def probe_media(path):
+    """
+    Duration, first video stream geometry/fps and audio presence via ffprobe.
+    Returns a dict, or None if the file cannot be probed.
+    """
+    try:
+        out = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_format", "-show_streams", "-of", "json", str(path)],
+            capture_output=True, text=True, check=True, timeout=60)
+        data = json.loads(out.stdout)
+        duration = float(data["format"]["duration"])
+    except (subprocess.SubprocessError, OSError, ValueError, KeyError, TypeError):
+        return None
+
+    info = {"duration": duration, "width": None, "height": None, "fps": None, "has_audio": False}
+    for stream in data.get("streams", []):
+        if stream.get("codec_type") == "video" and info["height"] is None:
+            info["width"], info["height"] = stream.get("width"), stream.get("height")
+            num, _, den = (stream.get("avg_frame_rate") or "0/1").partition("/")
+            try:
+                info["fps"] = float(num) / float(den or 1) or None
+            except (ValueError, ZeroDivisionError):
+                pass
+        elif stream.get("codec_type") == "audio":
+            info["has_audio"] = True
+    return info
+
+
+# (height, fps) rungs from best to smallest; the first rung the bitrate can feed is used
+QUALITY_LADDER = [(720, 15), (540, 12), (480, 10), (360, 10), (360, 6), (240, 5), (144, 2)]
+MIN_BITS_PER_PIXEL = 0.06
+MAX_BITS_PER_PIXEL = 0.15
+MIN_VIDEO_KBPS = 24
+CONTAINER_OVERHEAD = 0.97
+
+
+def plan_for_budget(info, budget_bytes, mute=False):
+    """
+    Choose audio/video bitrates, output height and fps so that the encode of a
+    media file described by `info` (see probe_media) fits in budget_bytes.
+    """
+    total_kbps = budget_bytes * 8 * CONTAINER_OVERHEAD / max(info["duration"], 0.1) / 1000
+    if mute or not info["has_audio"]:
+        audio_kbps = 0
+    else:
+        audio_kbps = 64 if total_kbps >= 400 else 32 if total_kbps >= 120 else 16
+    video_kbps = max(MIN_VIDEO_KBPS, total_kbps - audio_kbps)
+
+    src_height = info.get("height") or 720
+    src_fps = info.get("fps") or 30
+    aspect = (info["width"] / info["height"]) if info.get("width") and info.get("height") else 16 / 9
+    for height, fps in QUALITY_LADDER:
+        height, fps = min(height, src_height), min(fps, src_fps)
+        pixel_rate = height * aspect * height * fps
+        if video_kbps * 1000 / pixel_rate >= MIN_BITS_PER_PIXEL:
+            break
+    # Spending more than the rung needs only makes the upload bigger
+    video_kbps = min(video_kbps, pixel_rate * MAX_BITS_PER_PIXEL / 1000)
+    return {
+        "height": int(height) // 2 * 2,
+        "fps": round(fps, 2),
+        "video_kbps": max(MIN_VIDEO_KBPS, int(video_kbps)),
+        "audio_kbps": audio_kbps,
+    }
+
+
+def bitrate_args(encoder, kbps):
+    """Video args for average-bitrate encoding with the given encoder."""
+    rate = ["-b:v", f"{kbps}k", "-maxrate", f"{int(kbps * 1.5)}k", "-bufsize", f"{kbps * 2}k"]
+    if encoder == "h264_nvenc":
+        return ["-c:v", "h264_nvenc", "-preset", "fast", "-rc", "vbr"] + rate
+    return ["-c:v", "libx264", "-preset", "veryfast"] + rate
+
+
+def transcode(input_path, output_path, video_args, audio_args, vf, extra_args=()):
+    _run(["ffmpeg", "-y", "-i", str(input_path)] + list(video_args) + ["-vf", vf]
+         + list(extra_args) + list(audio_args) + [str(output_path)])
+
+
+def transcode_segmented(input_path, output_path, video_args, audio_args, vf, duration, workers=None,
+                        min_segment_seconds=30):
+    """
+    Transcode input_path into output_path using parallel segments.
+    Raises subprocess.CalledProcessError if any FFmpeg step fails.
+    """
+    workers = workers or os.cpu_count() or 1
+    segment_seconds = max(min_segment_seconds, duration / workers)
+    # Split the cores between the concurrent encoders instead of oversubscribing them
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    work_dir = Path(tempfile.mkdtemp(prefix="antigravity_segments_"))
+    try:
+        # 1. Split on keyframes without re-encoding
+        _run(["ffmpeg", "-y", "-i", str(input_path), "-map", "0:v:0", "-map", "0:a:0?", "-c", "copy",
+              "-f", "segment", "-segment_time", f"{segment_seconds:.3f}", "-reset_timestamps", "1",
+              str(work_dir / "src_%04d.mkv")])
+        sources = sorted(work_dir.glob("src_*.mkv"))
+        print(f"[*] 分段并行压缩: {len(sources)} 段, {workers} 个并发进程", file=sys.stderr)
+
+        # 2. Transcode the segments concurrently (each in its own FFmpeg process)
+        def encode(src):
+            dst = src.with_name(src.name.replace("src_", "out_")).with_suffix(".mp4")
+            transcode(src, dst, video_args, audio_args, vf, extra_args=["-threads", str(threads)])
+            return dst
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            outputs = list(pool.map(encode, sources))
+
+        # 3. Join without re-encoding
+        list_file = work_dir / "concat.txt"
+        list_file.write_text("".join(f"file '{p.as_posix()}'\n" for p in outputs), encoding="utf-8")
+        _run(["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", str(list_file), "-c", "copy",
+              "-movflags", "+faststart", str(output_path)])
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def scene_cuts(path, threshold=0.3):
+    """Timestamps (seconds) where FFmpeg's scene-change score exceeds threshold."""
+    # Scores are computed on downscaled frames; cut detection does not need detail
+    out = subprocess.run(["ffmpeg", "-hide_banner", "-i", str(path), "-an", "-vf",
+                          f"scale=160:-2,select='gt(scene,{threshold})',showinfo", "-f", "null", "-"],
+                         capture_output=True, text=True)
+    if out.returncode != 0:
+        return []
+    return [float(t) for t in re.findall(r"pts_time:([\d.]+)", out.stderr)]
+
+
+def split_points(duration, window, cuts=(), slack=0.25):
+    """
+    Window boundaries roughly every `window` seconds. Each boundary moves to the
+    nearest scene cut within window * slack, so shots are not cut in half.
+    """
+    points = []
+    t = window
+    while t < duration - window * slack:
+        near = [c for c in cuts if abs(c - t) <= window * slack and (not points or c > points[-1])]
+        points.append(min(near, key=lambda c: abs(c - t)) if near else t)
+        t = points[-1] + window
+    return points
+
+
+def split_windows(input_path, out_dir, times):
+    """
+    Split input_path at `times` (stream copy, so cuts snap to keyframes) into
+    out_dir. Returns [(path, start_seconds), ...] with the actual start offsets.
+    """
+    if not times:
+        return [(Path(input_path), 0.0)]
+    out_dir = Path(out_dir)
+    list_path = out_dir / "windows.csv"
+    _run(["ffmpeg", "-y", "-i", str(input_path), "-map", "0:v:0", "-map", "0:a:0?", "-c", "copy",
+          "-f", "segment", "-segment_times", ",".join(f"{t:.3f}" for t in times),
+          "-segment_list", str(list_path), "-segment_list_type", "csv", "-reset_timestamps", "1",
+          str(out_dir / "win_%04d.mp4")])
+    with open(list_path, newline="", encoding="utf-8") as f:
+        return [(out_dir / row[0], float(row[1])) for row in csv.reader(f) if row]
+
+
+def _dhash(gray9x8):
+    """64-bit difference hash from a 9x8 grayscale frame (row-major bytes)."""
+    bits = 0
+    for row in range(8):
+        line = gray9x8[row * 9:row * 9 + 9]
+        for col in range(8):
+            bits = (bits << 1) | (line[col] > line[col + 1])
+    return bits
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def sample_frames(input_path, out_dir, scene_threshold=0.3, interval=10, height=480, quality=5):
+    """
+    Extract a JPEG for every scene change (score > scene_threshold), plus one at
+    least every `interval` seconds (0 disables), scaled to `height`.
+    Returns [(path, seconds, dhash), ...] in time order.
+    """
+    out_dir = Path(out_dir)
+    rules = ["isnan(prev_selected_t)"]
+    if scene_threshold:
+        rules.append(f"gt(scene,{scene_threshold})")
+    if interval:
+        rules.append(f"gte(t-prev_selected_t,{interval})")
+    graph = (f"[0:v]scale=-2:{height},select='{'+'.join(rules)}',showinfo,split=2[f][h];"
+             f"[h]scale=9:8,format=gray[g]")
+    out = subprocess.run(["ffmpeg", "-hide_banner", "-y", "-i", str(input_path), "-an", "-filter_complex", graph,
+                          "-map", "[f]", *vfr_args(), "-q:v", str(quality), str(out_dir / "frame_%05d.jpg"),
+                          "-map", "[g]", *vfr_args(), "-f", "rawvideo", "pipe:1"],
+                         capture_output=True)
+    if out.returncode != 0:
+        raise subprocess.CalledProcessError(out.returncode, "ffmpeg", stderr=out.stderr)
+
+    times = [float(t) for t in re.findall(rb"pts_time:\s*([\d.]+)", out.stderr)]
+    paths = sorted(out_dir.glob("frame_*.jpg"))
+    hashes = [_dhash(out.stdout[i:i + 72]) for i in range(0, len(out.stdout) - 71, 72)]
+    return list(zip(paths, times, hashes))
+
+
+def dedupe_frames(frames, max_distance=6, max_frames=None):
+    """
+    Drop frames within max_distance bits of the last kept frame, then thin the
+    rest evenly down to max_frames.
+    """
+    kept = []
+    for frame in frames:
+        if kept and hamming(kept[-1][2], frame[2]) <= max_distance:
+            continue
+        kept.append(frame)
+    if max_frames and len(kept) > max_frames:
+        step = len(kept) / max_frames
+        kept = [kept[int(i * step)] for i in range(max_frames)]
+    return kept
+
+
+# codec -> (file suffix, mime type, encoder args)
+AUDIO_CODECS = {
+    "aac": (".aac", "audio/aac", ["-c:a", "aac"]),
+    "opus": (".ogg", "audio/ogg", ["-c:a", "libopus", "-application", "voip"]),
+}
+
+
+def extract_audio(input_path, output_path, codec="aac", kbps=32, sample_rate=16000):
+    """Write the first audio track of input_path as mono `codec` audio at kbps."""
+    _run(["ffmpeg", "-y", "-i", str(input_path), "-vn", "-map", "0:a:0", "-ac", "1", "-ar", str(sample_rate)]
+         + AUDIO_CODECS[codec][2] + ["-b:a", f"{kbps}k", str(output_path)])
@@ -0,0 +1,84 @@
+"""
+Client side of the warm worker (scripts/serve.py).
+
+Scripts call forward() right after the sys.path setup and before importing
+requests/api_client. If a worker is listening on the Unix socket, the call is
+run there on an already-configured AntigravityClient with open connections,
+and its output is streamed back. Otherwise forward() returns None and the
+script runs in-process as before. Only the standard library is imported here,
+so the check costs well under a millisecond when no worker is running.
+
+Set ANTIGRAVITY_NO_WORKER=1 to always run in-process, or
+ANTIGRAVITY_WORKER_SOCKET to use a different socket path.
+"""
+import json
+import os
+import socket
+import sys
+
+DEFAULT_SOCKET = os.path.join("~", ".cache", "antigravity-api-skill", "worker.sock")
+
+
+def socket_path():
+    return os.path.expanduser(os.environ.get("ANTIGRAVITY_WORKER_SOCKET") or DEFAULT_SOCKET)
+
+
+def connect(timeout=0.5):
+    """A connected socket to the worker, or None if none is running (or unsupported)."""
+    if not hasattr(socket, "AF_UNIX") or os.environ.get("ANTIGRAVITY_NO_WORKER"):
+        return None
+    path = socket_path()
+    if not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    sock.settimeout(None)
+    return sock
+
+
+def send(sock, message):
+    sock.sendall(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+
+
+def messages(sock):
+    """Yield the newline-delimited JSON messages read from sock."""
+    with sock.makefile("rb") as stream:
+        for line in stream:
+            yield json.loads(line)
+
+
+def forward(script, argv):
+    """
+    Run `script` with `argv` in the warm worker, echoing its stdout/stderr.
+    Returns the exit code, or None if no worker is available.
+    """
+    sock = connect()
+    if sock is None:
+        return None
+    # The worker has its own working directory; make existing relative paths absolute
+    argv = [os.path.abspath(arg) if os.path.exists(arg) else arg for arg in argv]
+    try:
+        send(sock, {"script": script, "argv": argv})
+    except OSError:
+        sock.close()
+        return None
+    try:
+        for message in messages(sock):
+            if "exit" in message:
+                return message["exit"]
+            stream = sys.stdout if message.get("stream") == "stdout" else sys.stderr
+            stream.write(message["data"])
+            stream.flush()
+    except (OSError, ValueError):
+        pass
+    finally:
+        sock.close()
+    # The worker may already have sent the request (paid generations): report
+    # failure rather than running it a second time in-process
+    print("[-] Warm worker disconnected", file=sys.stderr)
+    return 1
@@ -0,0 +1,154 @@
+"""
+Run many chat prompts in one process over a shared keep-alive session.
+
+Usage: python batch_chat.py input.jsonl output.jsonl [--workers 8] [--model NAME]
+
+Each input line: {"id": "...", "messages": [...], "model": "...", "files": ["path", ...]}
+("prompt": "..." may be used instead of "messages"). Results are appended to
+output.jsonl as they finish; ids that already have a successful result there are
+skipped, so an interrupted run can simply be restarted.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+# Add libs to path
+current_dir = Path(__file__).parent
+libs_path = current_dir.parent / "libs"
+sys.path.append(str(libs_path))
+
+try:
+    from api_client import AntigravityClient
+    from sse import ChatStream
+except ImportError:
+    print("[-] Error: libs module not found")
+    sys.exit(1)
+
+
+def load_jobs(path):
+    jobs = []
+    with open(path, encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                job = json.loads(line)
+            except ValueError as e:
+                print(f"[-] Skipping invalid JSON on line {lineno}: {e}", file=sys.stderr)
+                continue
+            job.setdefault("id", str(lineno))
+            if "messages" not in job and "prompt" in job:
+                job["messages"] = [{"role": "user", "content": job["prompt"]}]
+            jobs.append(job)
+    return jobs
+
+
+def completed_ids(path):
+    done = set()
+    if not Path(path).exists():
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if "error" not in record:
+                done.add(str(record.get("id")))
+    return done
+
+
+def run_job(client, job, default_model):
+    started = time.time()
+    record = {"id": job["id"], "model": job.get("model") or default_model}
+    # Batch priority: interactive requests sharing the client jump ahead in the rate limiter queue
+    response = client.chat_completion(job["messages"], model=record["model"], file_paths=job.get("files") or [],
+                                      priority="batch")
+    if response is None or response.status_code != 200:
+        record["status"] = response.status_code if response is not None else None
+        record["error"] = response.text[:500] if response is not None else "request failed"
+        record["latency_s"] = round(time.time() - started, 3)
+        return record
+
+    stream = ChatStream(response, started=started)
+    stream.read()
+    stats = stream.stats()
+    record.update({
+        "status": 200,
+        "content": stream.text,
+        "finish_reason": stream.finish_reason,
+        "usage": stream.usage,
+        # Without usage from the gateway, each streamed delta counts as one token
+        "completion_tokens": (stream.usage or {}).get("completion_tokens", stats["chunks"]),
+        "ttft_s": round(stream.ttft, 3) if stream.ttft is not None else None,
+        "latency_s": round(time.time() - started, 3),
+    })
+    return record
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch chat runner (JSONL in, JSONL out)")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--model", default=None, help="default model for jobs that do not set one")
+    args = parser.parse_args()
+
+    # One pooled connection per worker so no request waits on (or churns) a connection
+    client = AntigravityClient(pool_maxsize=max(args.workers, 1))
+    default_model = args.model or client.config.get("default_chat_model")
+
+    jobs = load_jobs(args.input)
+    done = completed_ids(args.output)
+    pending = [job for job in jobs if str(job["id"]) not in done]
+    print(f"[*] {len(jobs)} jobs, {len(jobs) - len(pending)} already done, running {len(pending)} "
+          f"with {args.workers} workers", file=sys.stderr)
+    if not pending:
+        return
+
+    write_lock = threading.Lock()
+    latencies = []
+    tokens = 0
+    failures = 0
+    started = time.time()
+
+    with open(args.output, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(run_job, client, job, default_model): job for job in pending}
+        for n, future in enumerate(as_completed(futures), 1):
+            job = futures[future]
+            try:
+                record = future.result()
+            except Exception as e:
+                record = {"id": job["id"], "error": str(e)}
+            with write_lock:
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+            if "error" in record:
+                failures += 1
+                print(f"[-] [{n}/{len(pending)}] {record['id']} failed: {record['error'][:100]}", file=sys.stderr)
+            else:
+                latencies.append(record["latency_s"])
+                tokens += record["completion_tokens"] or 0
+                print(f"[+] [{n}/{len(pending)}] {record['id']} done in {record['latency_s']:.1f}s", file=sys.stderr)
+
+    elapsed = time.time() - started
+    print("\n" + "-" * 30)
+    print(f"Requests:   {len(pending)} ({failures} failed) in {elapsed:.1f}s")
+    print(f"Throughput: {len(pending)/elapsed:.2f} req/s, {tokens/elapsed:.1f} tokens/s")
+    print(f"Latency:    p50 {percentile(latencies, 50):.2f}s, p95 {percentile(latencies, 95):.2f}s")
+    conn = client.connection_stats()
+    print(f"Connections: {conn['new_connections']} opened, {conn['reused_connections']} reused")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+Client benchmarks against the local mock gateway (mock_gateway.py), no live backend needed.
+
+Usage: python benchmark.py [--sizes 1,8,32] [--repeat 3] [--only encode,chat,upload,sse,image]
+       python benchmark.py --save-baseline        store the results as this machine's baseline
+       python benchmark.py --tolerance 0.25       exit 1 if a case is >25% slower than its baseline
+
+Cases (median of --repeat runs):
+  encode_{n}mb_cold    hash + base64 + serialize a fresh n MB attachment (full body iterated)
+  encode_{n}mb_cached  the same attachment again (cached base64 blob)
+  chat_{n}mb           chat_completion round trip with an n MB attachment, stream read to the end
+  upload_{n}mb         upload_file of a fresh n MB file
+  sse_{n}_events       ChatStream parsing of an n-event stream held in memory
+  image_{n}mb          generate_image.py extraction and storage of an n MB inline base64 image
+
+Baselines are machine-specific and live in the cache root (benchmark_baseline.json).
+"""
+import argparse
+import base64
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add libs to path
+current_dir = Path(__file__).parent
+libs_path = current_dir.parent / "libs"
+sys.path.append(str(libs_path))
+
+try:
+    from api_client import AntigravityClient
+    from media_cache import MediaCache, cache_root
+    from model_catalog import ModelCatalog
+    from response_cache import CachedResponse
+    from sse import ChatStream
+    from upload_cache import UploadCache
+    import mock_gateway
+except ImportError:
+    print("[-] Error: libs module not found")
+    sys.exit(1)
+
+CASES = ("encode", "chat", "upload", "sse", "image")
+MB = 1024 * 1024
+
+
+def load_generate_image():
+    spec = importlib.util.spec_from_file_location("bench_generate_image", current_dir / "generate_image.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@contextlib.contextmanager
+def quiet():
+    """Hide the client's progress messages while timing."""
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        yield
+
+
+class Bench:
+    def __init__(self, work_dir, repeat):
+        self.work_dir = Path(work_dir)
+        self.repeat = repeat
+        self.results = {}  # name -> (median seconds, bytes processed or None)
+        self._files = 0
+
+    def fresh_file(self, size):
+        """A new file of random bytes (new content hash, so nothing is cached)."""
+        self._files += 1
+        path = self.work_dir / f"payload_{self._files}.bin"
+        with open(path, "wb") as f:
+            for _ in range(size // MB):
+                f.write(os.urandom(MB))
+            f.write(os.urandom(size % MB))
+        return path
+
+    def run(self, name, fn, setup=None, nbytes=None):
+        """Time fn(setup()) `repeat` times; setup runs outside the timed region."""
+        times = []
+        for _ in range(self.repeat):
+            arg = setup() if setup else None
+            with quiet():
+                started = time.perf_counter()
+                fn(arg)
+                times.append(time.perf_counter() - started)
+        self.results[name] = (statistics.median(times), nbytes)
+        print(f"    {name:<24} {statistics.median(times) * 1000:9.1f} ms")
+
+
+def make_client(base_url, work_dir):
+    with quiet():
+        client = AntigravityClient(api_key="bench", base_url=base_url)
+    # Isolated caches, so runs do not touch (or benefit from) the user's cache
+    client.media_cache = MediaCache(Path(work_dir) / "media")
+    client.upload_cache = UploadCache(Path(work_dir) / "uploads.json")
+    client.model_catalog = ModelCatalog(Path(work_dir) / "models.json")
+    client.config.update(response_cache=False, chunked_upload=False, default_chat_model="gemini-3-flash",
+                         default_image_model="gemini-3.1-flash-image", model_fallbacks={})
+    return client
+
+
+def bench_encode(bench, client, sizes):
+    messages = [{"role": "user", "content": "describe"}]
+    for size in sizes:
+        nbytes = size * MB
+        paths = []
+
+        def encode(path):
+            body = client._build_chat_body(messages, file_paths=[str(path)], stream_body=True)
+            for _ in body:
+                pass
+
+        def cold_setup():
+            paths.append(bench.fresh_file(nbytes))
+            return paths[-1]
+
+        bench.run(f"encode_{size}mb_cold", encode, cold_setup, nbytes)
+        bench.run(f"encode_{size}mb_cached", encode, lambda: paths[-1], nbytes)
+
+
+def bench_chat(bench, client, sizes):
+    messages = [{"role": "user", "content": "describe"}]
+    for size in sizes:
+        path = bench.fresh_file(size * MB)
+
+        def chat(_):
+            response = client.chat_completion(messages, file_paths=[str(path)], cache=False)
+            if response is None or response.status_code != 200:
+                raise RuntimeError("chat request failed")
+            ChatStream(response).read()
+
+        bench.run(f"chat_{size}mb", chat, nbytes=size * MB)
+
+
+def bench_upload(bench, client, sizes):
+    for size in sizes:
+        def upload(path):
+            if not client.upload_file(str(path), chunked=False):
+                raise RuntimeError("upload failed")
+
+        bench.run(f"upload_{size}mb", upload, lambda: bench.fresh_file(size * MB), size * MB)
+
+
+def bench_sse(bench, counts=(1000, 10000)):
+    for count in counts:
+        events = [b'data: {"choices": [{"index": 0, "delta": {"content": "token%d "}}]}\n\n' % i
+                  for i in range(count)]
+        body = b"".join(events) + b"data: [DONE]\n\n"
+        bench.run(f"sse_{count}_events", lambda _: ChatStream(CachedResponse(body)).read(), nbytes=len(body))
+
+
+def bench_image(bench, sizes):
+    generate_image = load_generate_image()
+    out_dir = bench.work_dir / "images"
+    for size in sizes:
+        raw = b"\x89PNG\r\n\x1a\n" + os.urandom(size * MB)
+        content = "Here you go: ![image](data:image/png;base64," + base64.b64encode(raw).decode("ascii") + ")"
+
+        def extract(_):
+            for match in generate_image.extract_images(content):
+                if match[0] == "b64":
+                    writer = generate_image.ImageWriter(out_dir)
+                    writer.write_base64(content, match[1], match[2])
+                    path, _ = writer.finish()
+                    os.remove(path)
+
+        bench.run(f"image_{size}mb", extract, nbytes=len(raw))
+
+
+def compare(results, baseline, tolerance):
+    """Print the results table; returns the names of cases slower than baseline * (1 + tolerance)."""
+    regressions = []
+    print(f"\n{'case':<24} {'median':>10} {'MB/s':>8} {'baseline':>10} {'change':>8}")
+    for name, (seconds, nbytes) in results.items():
+        rate = f"{nbytes / MB / seconds:8.1f}" if nbytes and seconds else f"{'':>8}"
+        base = baseline.get(name)
+        if base:
+            change = seconds / base - 1
+            flag = ""
+            if change > tolerance:
+                flag = "  <-- REGRESSION"
+                regressions.append(name)
+            print(f"{name:<24} {seconds * 1000:8.1f}ms {rate} {base * 1000:8.1f}ms {change:+7.0%}{flag}")
+        else:
+            print(f"{name:<24} {seconds * 1000:8.1f}ms {rate} {'-':>10} {'':>8}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the client against the local mock gateway")
+    parser.add_argument("--sizes", default="1,8,32", help="attachment sizes in MB, comma-separated")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case (the median is reported)")
+    parser.add_argument("--only", help=f"comma-separated subset of: {', '.join(CASES)}")
+    parser.add_argument("--baseline", help="baseline file (default: benchmark_baseline.json in the cache root)")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before flagging (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    cases = args.only.split(",") if args.only else CASES
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        parser.error(f"unknown case(s): {', '.join(sorted(unknown))}")
+
+    server, base_url = mock_gateway.start_in_thread(tokens=64)
+    work_dir = tempfile.mkdtemp(prefix="antigravity_bench_")
+    try:
+        client = make_client(base_url, work_dir)
+        baseline_path = Path(args.baseline) if args.baseline else cache_root(client.config) / "benchmark_baseline.json"
+        bench = Bench(work_dir, max(1, args.repeat))
+        print(f"[*] Mock gateway at {base_url}; {bench.repeat} runs per case")
+
+        if "encode" in cases:
+            bench_encode(bench, client, sizes)
+        if "chat" in cases:
+            bench_chat(bench, client, sizes)
+        if "upload" in cases:
+            bench_upload(bench, client, sizes)
+        if "sse" in cases:
+            bench_sse(bench)
+        if "image" in cases:
+            bench_image(bench, sizes)
+        client.close()
+    finally:
+        server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    baseline = {}
+    if baseline_path.exists():
+        baseline = json.loads(baseline_path.read_text(encoding="utf-8")).get("results", {})
+    regressions = compare(bench.results, baseline, args.tolerance)
+
+    if args.save_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        merged = dict(baseline, **{name: seconds for name, (seconds, _) in bench.results.items()})
+        baseline_path.write_text(json.dumps({
+            "machine": platform.node(),
+            "python": platform.python_version(),
+            "saved_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "results": merged,
+        }, indent=2), encoding="utf-8")
+        print(f"[+] Baseline saved: {baseline_path}")
+    elif not baseline:
+        print("[*] No baseline yet; run with --save-baseline to store one")
+
+    if regressions and not args.save_baseline:
+        print(f"[-] {len(regressions)} regression(s) beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
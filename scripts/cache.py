@@ -0,0 +1,41 @@
+import sys
+from pathlib import Path
+
+# Add libs to path
+current_dir = Path(__file__).parent
+libs_path = current_dir.parent / "libs"
+sys.path.append(str(libs_path))
+
+try:
+    from api_client import AntigravityClient
+except ImportError:
+    print("[-] Error: libs module not found")
+    sys.exit(1)
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ("stats", "prune"):
+        print("Usage: python cache.py stats | prune [max_mb]")
+        return
+
+    client = AntigravityClient()
+    cache = client.media_cache
+
+    if sys.argv[1] == "prune":
+        max_bytes = int(float(sys.argv[2]) * 1024 * 1024) if len(sys.argv) > 2 else None
+        removed, freed = cache.prune(max_bytes)
+        print(f"[+] Pruned {removed} entries, freed {freed/1024/1024:.1f}MB")
+        print(f"[+] Pruned {client.response_cache.prune()} cached responses")
+
+    stats = cache.stats()
+    print(f"[*] Media cache: {stats['root']}")
+    print(f"    {stats['entries']} entries, {stats['bytes']/1024/1024:.1f}MB / {stats['max_bytes']/1024/1024:.0f}MB")
+    for kind, (count, size) in sorted(stats["kinds"].items()):
+        print(f"    {kind:<10} {count:>5} entries  {size/1024/1024:>9.1f}MB")
+
+    responses = client.response_cache.stats()
+    print(f"[*] Response cache: {responses['path']}")
+    print(f"    {responses['entries']} entries, {responses['bytes']/1024/1024:.1f}MB / "
+          f"{responses['max_bytes']/1024/1024:.0f}MB")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,5 @@
 import sys
 import os
-import json
 from pathlib import Path
 
 # 强制设置标准输出为 UTF-8，解决 Windows 乱码问题
@@ -17,63 +16,88 @@ current_dir = Path(__file__).parent
 libs_path = current_dir.parent / "libs"
 sys.path.append(str(libs_path))
 
+# Hand the call to a running warm worker (scripts/serve.py) before importing anything heavy
+if __name__ == "__main__":
+    import warm
+    exit_code = warm.forward("chat", sys.argv[1:])
+    if exit_code is not None:
+        sys.exit(exit_code)
+
 try:
     from api_client import AntigravityClient
+    from session import ChatSession
+    from sse import ChatStream
 except ImportError:
     print("[-] Error: libs module not found")
     sys.exit(1)
 
-def main():
-    if len(sys.argv) < 2:
+def main(argv=None, client=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # --session NAME: continue a saved multi-turn conversation; --reset starts it over
+    session_name = None
+    if "--session" in argv:
+        i = argv.index("--session")
+        session_name = argv[i + 1] if i + 1 < len(argv) else None
+        del argv[i:i + 2]
+        if not session_name:
+            print("[-] --session needs a name")
+            return
+    reset = "--reset" in argv
+    if reset:
+        argv.remove("--reset")
+
+    if len(argv) < 1 and not (reset and session_name):
         print("Usage: python chat.py \"Your prompt here\" [model_name] [media_path]")
+        print("       python chat.py --session NAME [--reset] \"Your prompt here\" [model_name] [media_path]")
         return
 
-    prompt = sys.argv[1]
+    prompt = argv[0] if argv else None
     # Try to find file path in args
     media_paths = []
     # Collect all existing file paths from arguments
-    for arg in sys.argv[2:]:
+    for arg in argv[1:]:
         if os.path.exists(arg):
             media_paths.append(arg)
             
     # Set model if it was provided and isn't a file path
     model = None
-    if len(sys.argv) > 2 and not os.path.exists(sys.argv[2]):
-        model = sys.argv[2]
-    
-    client = AntigravityClient()
-    
-    messages = [{"role": "user", "content": prompt}]
+    if len(argv) > 1 and not os.path.exists(argv[1]):
+        model = argv[1]
     
+    client = client or AntigravityClient()
+
+    session = None
+    if session_name:
+        session = ChatSession(client, session_name, model=model)
+        if reset:
+            session.reset()
+            print(f"[*] Session {session_name} cleared")
+            if not argv:
+                return
+        model = session.model
+        print(f"[*] Session {session_name}: {len(session.turns) // 2} earlier turn(s)")
+
     print(f"[*] Asking {model or client.config.get('default_chat_model')}...")
-    
-    response = client.chat_completion(messages, model=model, file_paths=media_paths)
+
+    if session:
+        response = session.ask(prompt, media_paths)
+    else:
+        messages = [{"role": "user", "content": prompt}]
+        response = client.chat_completion(messages, model=model, file_paths=media_paths)
     
     if not response or response.status_code != 200:
         if response:
             print(f"[-] AI Request failed ({response.status_code}): {response.text}")
         return
 
-    full_content = ""
     print("\nStarting response stream:\n" + "-"*30)
     
-    # Simple SSE parser
-    for line in response.iter_lines():
-        if not line: continue
-        line_str = line.decode('utf-8')
-        if line_str.startswith("data: "):
-            data_str = line_str[6:]
-            if data_str.strip() == "[DONE]":
-                break
-            try:
-                data = json.loads(data_str)
-                delta = data.get("choices", [{}])[0].get("delta", {})
-                content = delta.get("content", "")
-                if content:
-                    print(content, end="", flush=True)
-                    full_content += content
-            except:
-                pass
+    stream = ChatStream(response)
+    for content in stream:
+        print(content, end="", flush=True)
+
+    if session and stream.done:
+        session.add_reply(stream.text)
                 
     print("\n" + "-"*30 + "\n[Done]")
 
@@ -1,9 +1,9 @@
+import argparse
 import sys
 import os
 import time
-import base64
 import re
-import requests
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Add libs to path
@@ -11,82 +11,144 @@ current_dir = Path(__file__).parent
 libs_path = current_dir.parent / "libs"
 sys.path.append(str(libs_path))
 
+# Hand the call to a running warm worker (scripts/serve.py) before importing anything heavy
+if __name__ == "__main__":
+    import warm
+    # The worker has its own cwd: default --out-dir to ours (an explicit one, given later, wins)
+    # and pin a relative --out-dir to ours as well
+    argv = ["--out-dir", os.getcwd()] + sys.argv[1:]
+    for i in range(2, len(argv)):
+        if argv[i - 1] == "--out-dir":
+            argv[i] = os.path.abspath(argv[i])
+        elif argv[i].startswith("--out-dir="):
+            argv[i] = "--out-dir=" + os.path.abspath(argv[i].split("=", 1)[1])
+    exit_code = warm.forward("generate_image", argv)
+    if exit_code is not None:
+        sys.exit(exit_code)
+
 try:
     from api_client import AntigravityClient
+    from image_tools import ImageWriter
 except ImportError:
     print("[-] Error: libs module not found")
     sys.exit(1)
 
-def main():
-    if len(sys.argv) < 2:
-        print("Usage: python generate_image.py \"Prompt\" [size] [image_path]")
+# One pass over the content finds both inline base64 images and plain URLs
+IMAGE_RE = re.compile(
+    r"(?:data:image/[\w.+-]+;)?base64,(?P<b64>[A-Za-z0-9+/]{16,}=*)"
+    r"|(?P<url>https?://[^\s()<>\[\]\"']+)"
+)
+
+
+def extract_images(content):
+    """Yield ("url", url) or ("b64", start, end) spans in a response's message content."""
+    for m in IMAGE_RE.finditer(content):
+        if m.group("b64"):
+            yield "b64", m.start("b64"), m.end("b64")
+        else:
+            yield "url", m.group("url").rstrip(".,;:!?")
+
+
+def main(argv=None, client=None):
+    parser = argparse.ArgumentParser(prog="generate_image.py", description="Generate images (several requests run concurrently)")
+    parser.add_argument("prompt", nargs="?", help="prompt (or use --prompts)")
+    parser.add_argument("size", nargs="?", default="1024x1024", help="WxH or 16:9 / 9:16 / 1:1")
+    parser.add_argument("image_path", nargs="?", default=None, help="optional reference image")
+    parser.add_argument("-n", type=int, default=1, help="variations per prompt")
+    parser.add_argument("--prompts", help="file with one prompt per line")
+    parser.add_argument("--workers", type=int, default=None, help="concurrent requests/downloads (default 4)")
+    parser.add_argument("--out-dir", default=None, help="where generated_assets/ is created (default: cwd)")
+    args = parser.parse_args(argv)
+
+    prompts = [args.prompt] if args.prompt else []
+    if args.prompts:
+        prompts = [line.strip() for line in Path(args.prompts).read_text(encoding="utf-8").splitlines() if line.strip()]
+    if not prompts:
+        parser.print_usage()
         return
+    prompts = [p for p in prompts for _ in range(max(1, args.n))]
 
-    prompt = sys.argv[1]
-    size_arg = sys.argv[2] if len(sys.argv) > 2 else "1024x1024"
-    image_path = sys.argv[3] if len(sys.argv) > 3 else None
-    
     ratio_map = {
         "16:9": "1280x720",
-        "9:16": "720x1280", 
+        "9:16": "720x1280",
         "1:1": "1024x1024"
     }
-    
-    target_size = ratio_map.get(size_arg, size_arg)
-    
-    client = AntigravityClient()
-    res = client.generate_image(prompt, size=target_size, image_path=image_path)
-    
-    if res and "choices" in res:
+
+    target_size = ratio_map.get(args.size, args.size)
+
+    client = client or AntigravityClient()
+    workers = args.workers or int(client.config.get("image_concurrency", 4))
+    started = time.time()
+    results = client.generate_images(prompts, size=target_size, image_path=args.image_path, max_concurrency=workers)
+
+    save_dir = Path(args.out_dir or os.getcwd()) / "generated_assets"
+    save_dir.mkdir(parents=True, exist_ok=True)
+    saved = []  # (job, path, generation latency, download seconds)
+    downloads = []
+
+    def store(job, fill, started_at=None):
+        # Streamed to disk, named by content hash and real format; identical outputs are kept once
+        writer = ImageWriter(save_dir)
+        try:
+            fill(writer)
+        except Exception:
+            writer.abort()
+            raise
+        path, is_new = writer.finish()
+        if not is_new:
+            print(f"[=] Same image as {path.name}, not stored again")
+        seconds = time.time() - started_at if started_at else 0.0
+        saved.append((job, path, results[job]["latency_s"], seconds))
+
+    for job, item in enumerate(results):
+        res = item["result"]
+        if not (res and "choices" in res):
+            print(f"[-] Generation {job} failed ({item['latency_s']:.1f}s)")
+            continue
         content = res["choices"][0].get("message", {}).get("content", "")
-        print(f"[*] Response content received (Length: {len(content)})")
-        
-        save_dir = Path(os.getcwd()) / "generated_assets"
-        save_dir.mkdir(parents=True, exist_ok=True)
-        saved_any = False
-
-        # 1. Look for plain URLs
-        urls = re.findall(r"http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+", content)
-        if urls:
-            for i, url in enumerate(urls):
-                try:
-                    print(f"[*] Downloading image from {url}...")
-                    img_resp = requests.get(url, timeout=30)
-                    if img_resp.status_code == 200:
-                        fname = f"antigravity_{int(time.time())}_url_{i}.png"
-                        save_path = save_dir / fname
-                        save_path.write_bytes(img_resp.content)
-                        print(f"[+] Image saved: {save_path}")
-                        saved_any = True
-                except Exception as e:
-                    print(f"[-] Download failed: {e}")
-
-        # 2. Look for Base64 Data (common in Markdown or raw)
-        # Pattern: data:image/png;base64,xxxx or just long base64 string inside parentheses
-        b64_matches = re.findall(r"data:image\/[a-zA-Z]+;base64,([a-zA-Z0-9+/=]+)", content)
-        if not b64_matches:
-            # Try to find base64-like blobs in Markdown image syntax ![alt](data:...)
-            b64_matches = re.findall(r"base64,([a-zA-Z0-9+/=]{100,})", content)
-
-        if b64_matches:
-            for i, b64_str in enumerate(b64_matches):
-                try:
-                    print(f"[*] Decoding Base64 image {i}...")
-                    img_data = base64.b64decode(b64_str)
-                    fname = f"antigravity_{int(time.time())}_b64_{i}.png"
-                    save_path = save_dir / fname
-                    save_path.write_bytes(img_data)
-                    print(f"[+] Image saved: {save_path}")
-                    saved_any = True
-                except Exception as e:
-                    print(f"[-] Base64 decode failed: {e}")
-
-        if not saved_any:
-            print("[-] No image URL or Base64 data found in response")
+        print(f"[*] Response {job} content received (Length: {len(content)}, {item['latency_s']:.1f}s)")
+
+        found = False
+        for match in extract_images(content):
+            found = True
+            if match[0] == "url":
+                downloads.append((job, match[1]))
+                continue
+            try:
+                print(f"[*] Decoding Base64 image from response {job}...")
+                store(job, lambda w: w.write_base64(content, match[1], match[2]))
+            except Exception as e:
+                print(f"[-] Base64 decode failed: {e}")
+
+        if not found:
+            print(f"[-] No image URL or Base64 data found in response {job}")
             if len(content) > 200:
                 print(f"[*] Content snippet: {content[:200]}...")
-    else:
+
+    def download(job, url):
+        def fetch(writer):
+            for chunk in client.iter_download(url):
+                writer.write(chunk)
+
+        try:
+            print(f"[*] Downloading image from {url}...")
+            store(job, fetch, started_at=time.time())
+        except Exception as e:
+            print(f"[-] Download failed: {e}")
+
+    # Downloads share the client's keep-alive pool and stream straight to disk
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        list(pool.map(lambda d: download(*d), downloads))
+
+    if not saved:
         print("[-] Generation failed")
+        return
+
+    print("\n" + "-" * 30)
+    for job, path, latency, seconds in sorted(saved, key=lambda s: s[0]):
+        print(f"[+] #{job} {latency:6.1f}s + {seconds:4.1f}s download  {path}")
+    unique = len({path for _, path, _, _ in saved})
+    print(f"[*] {len(saved)} images ({unique} unique files) from {len(prompts)} requests in {time.time() - started:.1f}s")
 
 if __name__ == "__main__":
     main()
@@ -6,17 +6,27 @@ current_dir = Path(__file__).parent
 libs_path = current_dir.parent / "libs"
 sys.path.append(str(libs_path))
 
+# Hand the call to a running warm worker (scripts/serve.py) before importing anything heavy
+if __name__ == "__main__":
+    import warm
+    exit_code = warm.forward("list_models", sys.argv[1:])
+    if exit_code is not None:
+        sys.exit(exit_code)
+
 try:
     from api_client import AntigravityClient
+    from model_catalog import categorize
 except ImportError:
     print("[-] Error: libs module not found")
     sys.exit(1)
 
-def main():
-    client = AntigravityClient()
+def main(argv=None, client=None):
+    argv = sys.argv[1:] if argv is None else argv
+    client = client or AntigravityClient()
     print("[*] Fetching available models...")
     
-    models = client.get_models()
+    # --refresh bypasses the cached catalog
+    models = client.get_models(refresh="--refresh" in argv)
     
     if not models:
         print("[-] No models found or request failed.")
@@ -25,34 +35,24 @@ def main():
     print(f"\n[+] Found {len(models)} models:\n")
     
     # Categorize models for better readability
-    chat_models = []
-    image_models = []
-    other_models = []
-    
-    for m in models:
-        mid = m['id'] if isinstance(m, dict) else str(m)
-        if "image" in mid or "paint" in mid:
-            image_models.append(mid)
-        elif "claude" in mid or "gpt" in mid or "gemini" in mid:
-            chat_models.append(mid)
-        else:
-            other_models.append(mid)
+    groups = categorize(models)
+    chat_models, image_models, other_models = groups["chat"], groups["image"], groups["other"]
             
     if chat_models:
         print("--- Chat / Text Models ---")
-        for m in sorted(chat_models):
+        for m in chat_models:
             print(f"  {m}")
         print("")
         
     if image_models:
         print("--- Image / Vision Models ---")
-        for m in sorted(image_models):
+        for m in image_models:
             print(f"  {m}")
         print("")
 
     if other_models:
         print("--- Other Models ---")
-        for m in sorted(other_models):
+        for m in other_models:
             print(f"  {m}")
 
 if __name__ == "__main__":
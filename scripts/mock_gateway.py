@@ -0,0 +1,316 @@
+"""
+Local stand-in for an Antigravity Manager gateway, for testing without a live backend.
+
+Usage: python mock_gateway.py [--port 8045] [--token-rate 50] [--latency 0.3]
+                              [--error-rate 0.1] [--rate-limit-rate 0.1] [--drop-rate 0.05]
+                              [--part-failure-rate 0.2]
+
+Serves under /v1:
+  POST /v1/chat/completions              SSE stream of --tokens deltas at --token-rate per second after
+                                         --latency seconds; "stream": false returns one JSON answer with
+                                         an inline base64 PNG (like an image model)
+  GET  /v1/models                        model list, with ETag / If-None-Match
+  POST /v1/files                         single-request upload (multipart or octet-stream)
+  POST /v1/files/uploads                 chunked upload protocol (see libs/chunked_upload.py)
+  PUT  /v1/files/uploads/{id}/parts/{n}
+  GET  /v1/files/uploads/{id}
+  POST /v1/files/uploads/{id}/complete
+
+Fault injection applies to chat and single-request uploads: a fraction of
+requests gets 503, 429 (with Retry-After) or has its connection dropped (for
+chat, halfway through the stream).
+"""
+import argparse
+import base64
+import email.parser
+import hashlib
+import json
+import random
+import re
+import socket
+import struct
+import sys
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PART_RE = re.compile(r"^/v1/files/uploads/([\w-]+)/parts/(\d+)$")
+UPLOAD_RE = re.compile(r"^/v1/files/uploads/([\w-]+)$")
+COMPLETE_RE = re.compile(r"^/v1/files/uploads/([\w-]+)/complete$")
+
+DEFAULT_MODELS = ("gemini-3-pro-preview", "gemini-3-pro", "gemini-3-flash", "claude-sonnet-4-5",
+                  "gemini-3.1-flash-image")
+
+
+def _tiny_png():
+    """A valid 1x1 PNG, returned by non-streaming (image) requests."""
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(b"\x00\xff\x80\x00")) + chunk(b"IEND", b""))
+
+
+class GatewayState:
+    def __init__(self, part_failure_rate=0.0, token_rate=0.0, tokens=64, latency=0.0, error_rate=0.0,
+                 rate_limit_rate=0.0, drop_rate=0.0, retry_after=1, models=DEFAULT_MODELS):
+        self.part_failure_rate = part_failure_rate
+        self.token_rate = token_rate
+        self.tokens = tokens
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.drop_rate = drop_rate
+        self.retry_after = retry_after
+        self.models = list(models)
+        self.uploads = {}
+        self.files = {}
+        self.lock = threading.Lock()
+
+    def fault(self):
+        """None, or the fault to inject into this request: "503", "429" or "drop"."""
+        r = random.random()
+        for name, rate in (("503", self.error_rate), ("429", self.rate_limit_rate), ("drop", self.drop_rate)):
+            if r < rate:
+                return name
+            r -= rate
+        return None
+
+    def store_file(self, data, name):
+        uri = f"files/{hashlib.sha256(data).hexdigest()[:16]}"
+        with self.lock:
+            self.files[uri] = {"name": name, "size": len(data)}
+        return uri
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def log_message(self, fmt, *args):
+        print(f"[mock] {self.command} {self.path} -> {fmt % args}", file=sys.stderr)
+
+    def _body(self):
+        if "chunked" in self.headers.get("Transfer-Encoding", ""):
+            data = bytearray()
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return bytes(data)
+                data += self.rfile.read(size)
+                self.rfile.readline()
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _json(self, status, obj):
+        data = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _inject(self, fault):
+        """Answer with the injected fault (except "drop" for chat, which happens mid-stream)."""
+        if fault == "503":
+            return self._json(503, {"error": "injected: service unavailable"})
+        if fault == "429":
+            data = json.dumps({"error": "injected: rate limited"}).encode("utf-8")
+            self.send_response(429)
+            self.send_header("Retry-After", str(self.state.retry_after))
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        self._drop()
+
+    def _drop(self):
+        self.wfile.flush()
+        self.close_connection = True
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _chunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _event(self, obj):
+        self._chunk(b"data: " + json.dumps(obj).encode("utf-8") + b"\n\n")
+
+    def _chat(self, fault):
+        request = json.loads(self._body() or b"{}")
+        if fault in ("503", "429"):
+            return self._inject(fault)
+        model = request.get("model", "")
+        state = self.state
+        if state.latency:
+            time.sleep(state.latency)
+        if not request.get("stream"):
+            image = base64.b64encode(_tiny_png()).decode("ascii")
+            return self._json(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "object": "chat.completion", "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {
+                    "role": "assistant", "content": f"![image](data:image/png;base64,{image})"}}],
+            })
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        interval = 1.0 / state.token_rate if state.token_rate else 0
+        for i in range(state.tokens):
+            if fault == "drop" and i == state.tokens // 2:
+                return self._drop()
+            if interval:
+                time.sleep(interval)
+            self._event({"model": model, "choices": [{"index": 0, "delta": {"content": f"tok{i} "}}]})
+        self._event({"model": model, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                     "usage": {"prompt_tokens": len(json.dumps(request.get("messages", []))) // 4,
+                               "completion_tokens": state.tokens}})
+        self._chunk(b"data: [DONE]\n\n")
+        self._chunk(b"")
+
+    def _multipart_file(self, data):
+        head = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode()
+        message = email.parser.BytesParser().parsebytes(head + data)
+        for part in message.get_payload():
+            if part.get_param("name", header="content-disposition") == "file":
+                return part.get_payload(decode=True), part.get_filename() or "upload.bin"
+        return data, "upload.bin"
+
+    def do_POST(self):
+        if self.path == "/v1/chat/completions":
+            return self._chat(self.state.fault())
+
+        if self.path == "/v1/files":
+            data = self._body()
+            fault = self.state.fault()
+            if fault:
+                return self._inject(fault)
+            name = self.headers.get("X-File-Name", "upload.bin")
+            if self.headers.get("Content-Type", "").startswith("multipart/"):
+                data, name = self._multipart_file(data)
+            uri = self.state.store_file(data, name)
+            return self._json(200, {"id": uri, "file_uri": uri, "bytes": len(data)})
+
+        if self.path == "/v1/files/uploads":
+            meta = json.loads(self._body() or b"{}")
+            upload_id = uuid.uuid4().hex
+            with self.state.lock:
+                self.state.uploads[upload_id] = {"meta": meta, "parts": {}}
+            return self._json(200, {"upload_id": upload_id})
+
+        m = COMPLETE_RE.match(self.path)
+        if m:
+            self._body()
+            with self.state.lock:
+                upload = self.state.uploads.get(m.group(1))
+            if not upload:
+                return self._json(404, {"error": "unknown upload"})
+            meta, parts = upload["meta"], upload["parts"]
+            expected = max(1, -(-meta["size"] // meta["part_size"]))
+            missing = [n for n in range(expected) if n not in parts]
+            if missing:
+                return self._json(400, {"error": "missing parts", "parts": missing})
+            data = b"".join(parts[n] for n in range(expected))
+            uri = self.state.store_file(data, meta.get("file_name", "upload.bin"))
+            with self.state.lock:
+                del self.state.uploads[m.group(1)]
+            return self._json(200, {"file_uri": uri, "bytes": len(data)})
+
+        self._body()
+        self._json(404, {"error": "not found"})
+
+    def do_PUT(self):
+        m = PART_RE.match(self.path)
+        data = self._body()
+        if not m:
+            return self._json(404, {"error": "not found"})
+        with self.state.lock:
+            upload = self.state.uploads.get(m.group(1))
+        if not upload:
+            return self._json(404, {"error": "unknown upload"})
+        if random.random() < self.state.part_failure_rate:
+            return self._json(503, {"error": "injected part failure"})
+        with self.state.lock:
+            upload["parts"][int(m.group(2))] = data
+        self._json(200, {"part": int(m.group(2)), "bytes": len(data)})
+
+    def do_GET(self):
+        if self.path == "/v1/models":
+            etag = '"' + hashlib.sha256("\n".join(self.state.models).encode()).hexdigest()[:16] + '"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            data = json.dumps({"object": "list", "data": [
+                {"id": m, "object": "model", "owned_by": "mock"} for m in self.state.models]}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        m = UPLOAD_RE.match(self.path)
+        if m:
+            with self.state.lock:
+                upload = self.state.uploads.get(m.group(1))
+                parts = sorted(upload["parts"]) if upload else None
+            if parts is None:
+                return self._json(404, {"error": "unknown upload"})
+            return self._json(200, {"parts": parts})
+        self._json(404, {"error": "not found"})
+
+
+def make_server(host="127.0.0.1", port=0, **options):
+    """Create (but do not start) a mock gateway server. port=0 picks a free port."""
+    handler = type("MockGatewayHandler", (Handler,), {"state": GatewayState(**options)})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def start_in_thread(**kwargs):
+    """Start a mock gateway in a daemon thread. Returns (server, base_url)."""
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for an Antigravity gateway")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8045)
+    parser.add_argument("--part-failure-rate", type=float, default=0.0,
+                        help="fraction of chunked-upload parts to reject with 503")
+    parser.add_argument("--tokens", type=int, default=64, help="deltas per streamed answer")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="deltas per second (0 = as fast as possible)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before the response starts")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="fraction of connections dropped")
+    parser.add_argument("--models", help="comma-separated model ids for /models")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, part_failure_rate=args.part_failure_rate, tokens=args.tokens,
+                         token_rate=args.token_rate, latency=args.latency, error_rate=args.error_rate,
+                         rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+                         drop_rate=args.drop_rate,
+                         models=args.models.split(",") if args.models else DEFAULT_MODELS)
+    print(f"[*] Mock gateway listening on http://{args.host}:{server.server_address[1]}/v1", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
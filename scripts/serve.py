@@ -0,0 +1,249 @@
+"""
+Warm worker: keeps one configured AntigravityClient (and its keep-alive
+connection pool) in a long-running process, listening on a Unix socket.
+
+chat.py, generate_image.py and list_models.py forward to it automatically when
+it is running (see libs/warm.py) and run in-process otherwise.
+
+Usage: python serve.py [--workers 8]      start in the foreground (Ctrl+C stops)
+       python serve.py --status | --stop
+"""
+import argparse
+import importlib.util
+import os
+import socket
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Add libs to path
+current_dir = Path(__file__).parent
+libs_path = current_dir.parent / "libs"
+sys.path.append(str(libs_path))
+
+try:
+    import warm
+    from api_client import AntigravityClient
+except ImportError:
+    print("[-] Error: libs module not found")
+    sys.exit(1)
+
+SCRIPTS = {
+    "chat": "chat.py",
+    "generate_image": "generate_image.py",
+    "list_models": "list_models.py",
+}
+
+
+class _ThreadLocalStream:
+    """Routes writes to the calling thread's connection, or to the real stream outside a call."""
+
+    def __init__(self, name, default):
+        self.name = name
+        self.default = default
+        self.encoding = "utf-8"
+        self._local = threading.local()
+
+    def bind(self, sink):
+        self._local.sink = sink
+
+    def current(self):
+        return getattr(self._local, "sink", None)
+
+    def write(self, data):
+        sink = self.current()
+        if sink is not None:
+            try:
+                sink(self.name, data)
+                return len(data)
+            except OSError:
+                pass  # a helper thread outliving its call: the caller is gone
+        return self.default.write(data)
+
+    def flush(self):
+        if self.current() is None:
+            self.default.flush()
+
+    def reconfigure(self, **kwargs):
+        pass
+
+    def isatty(self):
+        return False
+
+
+def inherit_streams(streams):
+    """
+    Run ThreadPoolExecutor tasks with the stream sinks of the thread that
+    submitted them, so helper threads of a call (image jobs, downloads, upload
+    parts) write to that call's connection rather than the worker's console.
+    """
+    submit = ThreadPoolExecutor.submit
+
+    def submit_with_sinks(self, fn, /, *args, **kwargs):
+        sinks = [(stream, stream.current()) for stream in streams]
+        if all(sink is None for _, sink in sinks):
+            return submit(self, fn, *args, **kwargs)
+
+        def run(*args, **kwargs):
+            previous = [(stream, stream.current()) for stream in streams]
+            for stream, sink in sinks:
+                stream.bind(sink)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                for stream, sink in previous:
+                    stream.bind(sink)
+
+        return submit(self, run, *args, **kwargs)
+
+    ThreadPoolExecutor.submit = submit_with_sinks
+
+
+def load_scripts():
+    modules = {}
+    for name, filename in SCRIPTS.items():
+        spec = importlib.util.spec_from_file_location(f"warm_{name}", current_dir / filename)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        modules[name] = module
+    return modules
+
+
+def handle(conn, client, modules, stdout, stderr, stop):
+    lock = threading.Lock()
+
+    def sink(stream, data):
+        with lock:
+            warm.send(conn, {"stream": stream, "data": data})
+
+    code = 0
+    try:
+        request = next(warm.messages(conn), None)
+        if not request:
+            return
+        if request.get("cmd") == "status":
+            warm.send(conn, {"stream": "stdout", "data": f"[+] Warm worker running (pid {os.getpid()})\n"})
+            stats = client.connection_stats()
+            warm.send(conn, {"stream": "stdout", "data": f"    {stats['requests']} requests, "
+                             f"{stats['new_connections']} connections opened, {stats['idle_connections']} idle\n"})
+            limits = client.limiter.stats()
+            depth = ", ".join(f"{n} {limits['queue_depth'][n]}" for n in limits["queue_depth"])
+            waits = ", ".join(f"{n} {w['mean_s']:.2f}s/{w['max_s']:.2f}s" for n, w in limits["waits"].items() if w["count"])
+            warm.send(conn, {"stream": "stdout", "data": f"    rate limiter queue: {depth}"
+                             + (f"; wait mean/max: {waits}" if waits else "") + "\n"})
+            if len(client.gateways) > 1:
+                for g in client.gateways.stats():
+                    state = "healthy" if g["healthy"] else "ejected"
+                    warm.send(conn, {"stream": "stdout", "data": f"    gateway {g['name']}: {state}, weight {g['weight']}, "
+                                     f"{g['in_flight']} in flight, {g['requests']} requests, {g['failures']} failures\n"})
+            return
+        if request.get("cmd") == "stop":
+            warm.send(conn, {"stream": "stdout", "data": "[+] Warm worker stopping\n"})
+            stop.set()
+            return
+        module = modules.get(request.get("script"))
+        if module is None:
+            warm.send(conn, {"stream": "stderr", "data": f"[-] Unknown script: {request.get('script')}\n"})
+            code = 2
+            return
+
+        stdout.bind(sink)
+        stderr.bind(sink)
+        try:
+            module.main(request.get("argv", []), client=client)
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        except Exception as e:
+            print(f"[-] {type(e).__name__}: {e}", file=sys.stderr)
+            code = 1
+        finally:
+            stdout.bind(None)
+            stderr.bind(None)
+    except (OSError, ValueError):
+        return
+    finally:
+        try:
+            warm.send(conn, {"exit": code})
+        except OSError:
+            pass
+        conn.close()
+
+
+def control(cmd):
+    sock = warm.connect()
+    if sock is None:
+        print("[-] No warm worker running")
+        return 1
+    warm.send(sock, {"cmd": cmd})
+    for message in warm.messages(sock):
+        if "data" in message:
+            print(message["data"], end="")
+    sock.close()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm worker for the antigravity scripts")
+    parser.add_argument("--workers", type=int, default=8, help="calls served concurrently")
+    parser.add_argument("--status", action="store_true")
+    parser.add_argument("--stop", action="store_true")
+    args = parser.parse_args()
+
+    if not hasattr(socket, "AF_UNIX"):
+        print("[-] Unix sockets are not available on this platform; scripts run in-process")
+        return 1
+    if args.status or args.stop:
+        return control("status" if args.status else "stop")
+
+    path = warm.socket_path()
+    if warm.connect() is not None:
+        print(f"[-] A warm worker is already listening on {path}")
+        return 1
+    if os.path.exists(path):
+        os.remove(path)  # stale socket from a worker that did not shut down cleanly
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    client = AntigravityClient(pool_maxsize=max(args.workers, 1))
+    modules = load_scripts()
+    # Open the pool and fill the model catalog so the first real call is already warm
+    client.get_models()
+
+    stdout = _ThreadLocalStream("stdout", sys.stdout)
+    stderr = _ThreadLocalStream("stderr", sys.stderr)
+    sys.stdout, sys.stderr = stdout, stderr
+    inherit_streams((stdout, stderr))
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o177)  # socket readable/writable by this user only
+    try:
+        server.bind(path)
+    finally:
+        os.umask(old_umask)
+    server.listen(64)
+    server.settimeout(0.5)
+    stop = threading.Event()
+    print(f"[+] Warm worker listening on {path} (pid {os.getpid()}, {args.workers} workers)", file=stderr.default)
+
+    # A fixed pool keeps the number of per-thread HTTP sessions bounded
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        try:
+            while not stop.is_set():
+                try:
+                    conn, _ = server.accept()
+                except socket.timeout:
+                    continue
+                pool.submit(handle, conn, client, modules, stdout, stderr, stop)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+            if os.path.exists(path):
+                os.remove(path)
+            sys.stdout, sys.stderr = stdout.default, stderr.default
+            client.close()
+    print("[*] Warm worker stopped")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -12,6 +12,7 @@ sys.path.append(str(libs_path))
 
 try:
     from api_client import AntigravityClient
+    from sse import ChatStream
 except ImportError:
     print("[-] Error: libs module not found")
     sys.exit(1)
@@ -81,21 +82,8 @@ def main():
             print("\n" + "="*30)
             print(f"Status Code: {response.status_code}")
             # Stream the response
-            for line in response.iter_lines():
-                if not line: continue
-                line_str = line.decode('utf-8')
-                if line_str.startswith("data: "):
-                    data_str = line_str[6:]
-                    if data_str.strip() == "[DONE]":
-                        break
-                    try:
-                        data = json.loads(data_str)
-                        delta = data.get("choices", [{}])[0].get("delta", {})
-                        content = delta.get("content", "")
-                        if content:
-                            print(content, end="", flush=True)
-                    except:
-                        pass
+            for content in ChatStream(response):
+                print(content, end="", flush=True)
             print("\n" + "="*30)
         else:
             print("[-] No response received")
@@ -104,5 +92,4 @@ def main():
         print(f"[-] Request failed: {e}")
 
 if __name__ == "__main__":
-    import json
     main()
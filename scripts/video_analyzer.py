@@ -1,6 +1,13 @@
+import argparse
+import json
+import re
+import shutil
+import subprocess
 import sys
 import os
-import json
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 # 自动寻找库文件路径
@@ -10,81 +17,213 @@ sys.path.append(str(libs_path))
 
 try:
     from api_client import AntigravityClient
+    from sse import ChatStream
+    import video_tools
 except ImportError:
     print("[-] 错误: 找不到 libs 模块，请检查目录结构。")
     sys.exit(1)
 
-def analyze_video(video_path, custom_prompt=None):
+# 默认的高精度分析提示词
+DEFAULT_PROMPT = (
+    "请拆解视频的镜头。分析每一个镜头的开始时间、持续秒数、以及内容描述（包含景别、动作）。\n"
+    "请严格按照以下 JSON 数组格式输出，不要包含 Markdown 代码块标记或任何其他多余文本：\n"
+    "[\n"
+    "  {\"start\": \"HH:MM:SS\", \"duration\": 5, \"text\": \"分镜分析描述\"},\n"
+    "  ...\n"
+    "]\n"
+)
+
+# 指定最适合视频分析的模型，优先使用 gemini-3-flash
+MODEL = "gemini-3-flash"
+
+
+def strip_fences(text):
+    # 清理 Markdown 代码块包裹
+    clean_json = text.strip()
+    if clean_json.startswith("```"):
+        clean_json = clean_json.split("\n", 1)[1]
+    if clean_json.endswith("```"):
+        clean_json = clean_json.rsplit("\n", 1)[0]
+    return clean_json.strip()
+
+
+def request_analysis(client, video_path, prompt, media="video"):
+    """Send one video to the model and return the full text. Raises RuntimeError on API errors."""
+    messages = [{"role": "user", "content": prompt}]
+    response = client.chat_completion(messages, model=MODEL, file_paths=[video_path], video_mode=media)
+    if not response:
+        raise RuntimeError("未能收到有效响应，请确认服务是否开启。")
+    if response.status_code != 200:
+        raise RuntimeError(f"API 请求失败 ({response.status_code}): {response.text[:300]}")
+    return ChatStream(response).read()
+
+
+def analyze_video(video_path, custom_prompt=None, media="video"):
     if not os.path.exists(video_path):
         print(f"[-] 错误: 找不到视频文件 {video_path}")
         return
 
-    # 1. 实例化客户端 (自动从 config.json 获取端口和 key)
+    # 实例化客户端 (自动从 config.json 获取端口和 key)
     client = AntigravityClient()
-    
-    # 2. 默认的高精度分析提示词
-    default_prompt = (
-        "请拆解视频的镜头。分析每一个镜头的开始时间、持续秒数、以及内容描述（包含景别、动作）。\n"
-        "请严格按照以下 JSON 数组格式输出，不要包含 Markdown 代码块标记或任何其他多余文本：\n"
-        "[\n"
-        "  {\"start\": \"HH:MM:SS\", \"duration\": 5, \"text\": \"分镜分析描述\"},\n"
-        "  ...\n"
-        "]\n"
-    )
-    prompt = custom_prompt or default_prompt
-    
-    # 3. 指定最适合视频分析的模型
-    # 优先使用 gemini-3-flash
-    model = "gemini-3-flash"
-    
+    prompt = custom_prompt or DEFAULT_PROMPT
+
     print(f"[*] 正在分析视频: {os.path.basename(video_path)}", file=sys.stderr)
-    print(f"[*] 正在请求模型: {model} (连接地址: {client.base_url})", file=sys.stderr)
-    
-    messages = [{"role": "user", "content": prompt}]
-    
-    # 获取响应流
+    print(f"[*] 正在请求模型: {MODEL} (连接地址: {client.base_url})", file=sys.stderr)
+
     try:
-        response = client.chat_completion(messages, model=model, file_paths=[video_path])
+        full_content = request_analysis(client, video_path, prompt, media)
     except Exception as e:
-        print(f"[-] 连接服务失败: {e}", file=sys.stderr)
+        print(f"[-] {e}", file=sys.stderr)
         return
-    
-    if not response or response.status_code != 200:
-        if response:
-            print(f"[-] API 请求失败 ({response.status_code}): {response.text}", file=sys.stderr)
-        else:
-            print("[-] 未能收到有效响应，请确认服务是否开启。", file=sys.stderr)
+
+    print(strip_fences(full_content))
+
+
+# ---------------------------------------------------------------------------
+# 分段模式: 按时间窗口 (可对齐镜头切换点) 切分，并发分析后合并
+# ---------------------------------------------------------------------------
+
+def parse_timestamp(value):
+    """"HH:MM:SS(.f)", "MM:SS" or a number of seconds -> seconds (float), or None."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    seconds = 0.0
+    try:
+        for part in str(value).strip().split(":"):
+            seconds = seconds * 60 + float(part)
+    except ValueError:
+        return None
+    return seconds
+
+
+def format_timestamp(seconds):
+    seconds = int(round(seconds))
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def parse_shots(text):
+    """The JSON array of shots in a model reply (tolerates fences and surrounding prose)."""
+    clean = strip_fences(text)
+    try:
+        shots = json.loads(clean)
+    except ValueError:
+        match = re.search(r"\[.*\]", clean, re.S)
+        if not match:
+            raise ValueError("回复中没有 JSON 数组")
+        shots = json.loads(match.group(0))
+    if not isinstance(shots, list):
+        raise ValueError("回复不是 JSON 数组")
+    return [shot for shot in shots if isinstance(shot, dict)]
+
+
+def merge_shots(windows, tolerance=1.0):
+    """
+    Merge per-window shot lists into one timeline. `windows` is a list of
+    (offset_seconds, shots) with window-relative starts. Shots that repeat at a
+    window boundary (the same shot seen from both sides) are folded together.
+    """
+    merged = []
+    boundaries = [offset for offset, _ in windows if offset > 0]
+    for offset, shots in sorted(windows, key=lambda w: w[0]):
+        for shot in shots:
+            start = parse_timestamp(shot.get("start"))
+            if start is None:
+                continue
+            shot = dict(shot, start=start + offset)
+            merged.append(shot)
+    merged.sort(key=lambda shot: shot["start"])
+
+    result = []
+    for shot in merged:
+        if result:
+            prev = result[-1]
+            prev_end = prev["start"] + float(prev.get("duration") or 0)
+            at_boundary = any(abs(shot["start"] - b) <= tolerance for b in boundaries)
+            # 同一时间点的重复镜头，或跨越窗口边界被拆成两段的镜头
+            if abs(shot["start"] - prev["start"]) <= tolerance or (at_boundary and prev_end >= shot["start"] - tolerance):
+                end = max(prev_end, shot["start"] + float(shot.get("duration") or 0))
+                prev["duration"] = round(end - prev["start"], 1)
+                continue
+        result.append(shot)
+
+    for shot in result:
+        shot["start"] = format_timestamp(shot["start"])
+    return result
+
+
+def analyze_segmented(video_path, custom_prompt=None, window=120, scenes=False, workers=4, media="video"):
+    if not os.path.exists(video_path):
+        print(f"[-] 错误: 找不到视频文件 {video_path}")
         return
 
-    # 4. 获取完整 JSON 响应
-    full_content = ""
-    for line in response.iter_lines():
-        if not line: continue
-        line_str = line.decode('utf-8')
-        if line_str.startswith("data: "):
-            data_str = line_str[6:]
-            if data_str.strip() == "[DONE]": break
-            try:
-                data = json.loads(data_str)
-                content = data.get("choices", [{}])[0].get("delta", {}).get("content", "")
-                if content:
-                    full_content += content
-            except: pass
-    
-    # 清理 Markdown 代码块包裹
-    clean_json = full_content.strip()
-    if clean_json.startswith("```"):
-        clean_json = clean_json.split("\n", 1)[1]
-    if clean_json.endswith("```"):
-        clean_json = clean_json.rsplit("\n", 1)[0]
-    
-    print(clean_json.strip())
+    client = AntigravityClient(pool_maxsize=max(workers, 1))
+    prompt = custom_prompt or DEFAULT_PROMPT
+    duration = video_tools.probe_duration(video_path)
+    if not duration:
+        print("[-] 无法读取视频时长 (需要 ffprobe)，改为整段分析", file=sys.stderr)
+        return analyze_video(video_path, custom_prompt, media)
+
+    cuts = video_tools.scene_cuts(video_path) if scenes else []
+    times = video_tools.split_points(duration, window, cuts)
+    work_dir = Path(tempfile.mkdtemp(prefix="antigravity_windows_"))
+    started = time.time()
+    try:
+        try:
+            windows = video_tools.split_windows(video_path, work_dir, times)
+        except (subprocess.CalledProcessError, OSError) as e:
+            print(f"[-] 视频分段失败 ({e})，改为整段分析", file=sys.stderr)
+            return analyze_video(video_path, custom_prompt, media)
+        print(f"[*] 正在分析视频: {os.path.basename(video_path)} ({duration:.0f}s, {len(windows)} 个窗口, "
+              f"{workers} 路并发)", file=sys.stderr)
+        print(f"[*] 正在请求模型: {MODEL} (连接地址: {client.base_url})", file=sys.stderr)
+
+        def run(window_path, offset):
+            # 单个窗口失败时重试一次，不影响其他窗口
+            for attempt in range(2):
+                try:
+                    return parse_shots(request_analysis(client, str(window_path), prompt, media))
+                except Exception as e:
+                    error = e
+                    print(f"[-] 窗口 {format_timestamp(offset)} 第 {attempt + 1} 次分析失败: {e}", file=sys.stderr)
+            raise error
+
+        results, failed = [], []
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(run, path, offset): offset for path, offset in windows}
+            for future in as_completed(futures):
+                offset = futures[future]
+                try:
+                    results.append((offset, future.result()))
+                    print(f"[+] 窗口 {format_timestamp(offset)} 完成", file=sys.stderr)
+                except Exception:
+                    failed.append(offset)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"[*] 分析完成，用时 {time.time() - started:.1f}s", file=sys.stderr)
+    if failed:
+        print(f"[-] 以下窗口分析失败，结果中缺少对应片段: "
+              f"{', '.join(format_timestamp(o) for o in sorted(failed))}", file=sys.stderr)
+    print(json.dumps(merge_shots(results), ensure_ascii=False, indent=2))
+
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("用法: python video_analyzer.py \"视频绝对路径\" [可选自定义提示词]")
+    parser = argparse.ArgumentParser(description="视频镜头拆解")
+    parser.add_argument("video", help="视频路径")
+    parser.add_argument("prompt", nargs="?", default=None, help="可选自定义提示词")
+    parser.add_argument("--segment", action="store_true", help="分段并发分析 (适合长视频)")
+    parser.add_argument("--window", type=float, default=120, help="分段模式的窗口长度 (秒)，默认 120")
+    parser.add_argument("--scenes", action="store_true", help="分段边界对齐到镜头切换点")
+    parser.add_argument("--workers", type=int, default=4, help="分段模式的并发数，默认 4")
+    parser.add_argument("--media", choices=["video", "frames", "audio"], default="video",
+                        help="发送方式: video (压缩后的视频)、frames (镜头切换处的关键帧，体积小一个数量级) "
+                             "或 audio (只发送音轨，适合转写/总结讲话内容)")
+    args = parser.parse_args()
+
+    # 处理可能的双引号包裹
+    path = args.video.strip('"').strip("'")
+    if args.segment:
+        analyze_segmented(path, args.prompt, window=args.window, scenes=args.scenes, workers=args.workers,
+                          media=args.media)
     else:
-        # 处理可能的双引号包裹
-        path = sys.argv[1].strip('"').strip("'")
-        p = sys.argv[2] if len(sys.argv) > 2 else None
-        analyze_video(path, p)
+        analyze_video(path, args.prompt, args.media)
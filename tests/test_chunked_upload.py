@@ -0,0 +1,65 @@
+import hashlib
+import os
+import sys
+from pathlib import Path
+
+root = Path(__file__).parent.parent
+sys.path.append(str(root / "libs"))
+sys.path.append(str(root / "scripts"))
+
+import mock_gateway
+from chunked_upload import ChunkedUploader, ProgressMeter
+from http_pool import HTTPPool
+
+MB = 1024 * 1024
+
+
+def test_resume_ignores_manifest_with_other_part_size(tmp_path):
+    server, base_url = mock_gateway.start_in_thread()
+    http = HTTPPool()
+    try:
+        data = os.urandom(5 * MB + 123)
+        path = tmp_path / "clip.bin"
+        path.write_bytes(data)
+        content_hash = "clip"
+        manifests = tmp_path / "manifests"
+
+        # An interrupted run with 1MB parts: two of six parts sent, manifest left behind
+        first = ChunkedUploader(http, f"{base_url}/files", {}, manifests, part_size=1 * MB)
+        upload_id = first._start("clip.bin", "application/octet-stream", len(data))
+        meter = ProgressMeter(2 * MB)
+        assert first._upload_part(str(path), upload_id, 0, len(data), meter)
+        assert first._upload_part(str(path), upload_id, 1, len(data), meter)
+        first._save_manifest(content_hash, {"upload_id": upload_id, "files_url": first.files_url,
+                                            "size": len(data), "part_size": 1 * MB, "parts": [0, 1]})
+
+        # chunked_upload_part_mb changed to 2 before the retry
+        second = ChunkedUploader(http, f"{base_url}/files", {}, manifests, part_size=2 * MB)
+        assert second._load_manifest(content_hash, len(data)) is None
+        file_uri = second.upload(str(path), "clip.bin", "application/octet-stream", content_hash)
+        # The mock names files after the SHA-256 of the assembled bytes
+        assert file_uri == f"files/{hashlib.sha256(data).hexdigest()[:16]}"
+    finally:
+        http.close()
+        server.shutdown()
+
+
+def test_resume_with_same_part_size(tmp_path):
+    server, base_url = mock_gateway.start_in_thread()
+    http = HTTPPool()
+    try:
+        data = os.urandom(3 * MB)
+        path = tmp_path / "clip.bin"
+        path.write_bytes(data)
+        uploader = ChunkedUploader(http, f"{base_url}/files", {}, tmp_path / "manifests", part_size=1 * MB)
+        upload_id = uploader._start("clip.bin", "application/octet-stream", len(data))
+        assert uploader._upload_part(str(path), upload_id, 0, len(data), ProgressMeter(MB))
+        uploader._save_manifest("clip", {"upload_id": upload_id, "files_url": uploader.files_url,
+                                         "size": len(data), "part_size": 1 * MB, "parts": [0]})
+
+        assert uploader._load_manifest("clip", len(data))["upload_id"] == upload_id
+        file_uri = uploader.upload(str(path), "clip.bin", "application/octet-stream", "clip")
+        assert file_uri == f"files/{hashlib.sha256(data).hexdigest()[:16]}"
+    finally:
+        http.close()
+        server.shutdown()
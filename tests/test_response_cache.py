@@ -0,0 +1,20 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent / "libs"))
+
+from response_cache import ResponseCache
+
+
+def test_fresh_cache_root(tmp_path):
+    # The first cache=True chat on a new install: neither the root nor its parents exist yet
+    cache = ResponseCache(tmp_path / "missing" / "root" / "responses.sqlite3")
+    assert cache.get("x") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_round_trip_in_fresh_root(tmp_path):
+    cache = ResponseCache(tmp_path / "new_root" / "responses.sqlite3")
+    body = b'data: {"choices": [{"delta": {"content": "hi"}}]}\n\ndata: [DONE]\n\n'
+    cache.put("k", "gemini-3-flash", body)
+    assert cache.get("k") == body
@@ -0,0 +1,28 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent / "libs"))
+
+from telemetry import Telemetry
+
+
+def test_nested_attach_restores_outer_record():
+    # e.g. a chat_completion made from inside a telemetry.request() block
+    telemetry = Telemetry()
+    with telemetry.request("outer") as outer:
+        inner = telemetry.record("chat")
+        previous = telemetry.attach(inner)
+        assert previous is outer
+        telemetry.detach(previous)
+        assert telemetry.current is outer
+        with telemetry.span("after"):
+            pass
+    assert "after" in outer.to_dict()["spans"]
+    assert "after" not in inner.to_dict()["spans"]
+    assert telemetry.current is None
+
+
+def test_detach_without_outer_record():
+    telemetry = Telemetry()
+    telemetry.detach(telemetry.attach(telemetry.record("chat")))
+    assert telemetry.current is None